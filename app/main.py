@@ -1,13 +1,22 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.models import PlanRequest, PlanResponse
-from app.services.optimizer import build_plan
+from app.services.optimizer import build_plan_payload
+from app.services.plan_stream import stream_plan
+from app.services.plan_store import get_plan, list_plans
+from app.services.price_risk import price_risk
+from app.services.serialization import json_response, streaming_response
+from app.services.batch_planning import read_shipments_csv, stream_batch
+from app.services.jobs import submit_job, get_job, start_worker_pool, stop_worker_pool
 from app.services.refuel_optimizer import find_optimal_refuel_route
+from app.services.distance_cache import get_distance_cache
 from app.db import Base, get_engine, get_db
 from sqlalchemy.orm import Session
 from app.services.ports_loader import seed_ports
 import os, json
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime
 from pydantic import BaseModel
 
 # create DB tables on startup if they don't exist (simple approach for MVP)
@@ -35,15 +44,132 @@ def startup_event():
         seed_ports(db)
     except Exception as e:
         print(f"[warn] Skipping port seeding: {e}")
+    # embedded job workers; set JOBS_WORKERS=0 and run `python -m app.services.jobs worker` instead
+    workers = int(os.environ.get("JOBS_WORKERS", "2"))
+    if workers > 0:
+        try:
+            start_worker_pool(workers)
+        except Exception as e:
+            print(f"[warn] Skipping job workers: {e}")
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    stop_worker_pool()
 
 
 @app.post("/plan", response_model=PlanResponse)
-def create_plan(req: PlanRequest):
+def create_plan(req: PlanRequest, request: Request):
+    try:
+        plan = build_plan_payload(req)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return json_response(request, plan)
+
+
+@app.post("/plan/batch")
+async def create_plan_batch(request: Request, workers: Optional[int] = None, chunk_size: int = 16):
+    """
+    Plan many shipments: a JSON list of PlanRequest bodies, or a shipments CSV (Content-Type
+    text/csv). Results stream back as NDJSON, one line per shipment in input order.
+    """
+    body = await request.body()
     try:
-        plan = build_plan(req)
-        return plan
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            requests_, ids = read_shipments_csv(body.decode("utf-8-sig"))
+        else:
+            items = json.loads(body)
+            if not isinstance(items, list):
+                raise ValueError("Expected a JSON list of plan requests")
+            requests_, ids = [PlanRequest(**item) for item in items], None
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if not requests_:
+        raise HTTPException(status_code=400, detail="No shipments given")
+    return streaming_response(request, stream_batch(requests_, ids, workers=workers, chunk_size=chunk_size),
+                              media_type="application/x-ndjson")
+
+
+@app.get("/plans/{route_id}", response_model=PlanResponse)
+def read_plan(route_id: str, request: Request, db: Session = Depends(get_db)):
+    """A stored plan, as returned by POST /plan."""
+    plan = get_plan(db, route_id)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return json_response(request, plan)
+
+
+@app.get("/plan/{route_id}/price-risk")
+def read_plan_price_risk(route_id: str, samples: int = 5000, resolve: int = 20, budget_ms: float = 2000.0,
+                         seed: int = 0, db: Session = Depends(get_db)):
+    """
+    Fuel-price risk of a stored plan: P50/P90 fuel cost over `samples` correlated price scenarios
+    with the stops kept fixed, and how often `resolve` re-planned scenarios keep the same stops.
+    """
+    try:
+        risk = price_risk(db, route_id, samples=samples, resolve=resolve, budget_ms=budget_ms, random_seed=seed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if risk is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return risk
+
+
+@app.get("/plans")
+def read_plans(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    carrier_model: Optional[str] = None,
+    transport_medium: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Plan history, newest first: summaries only (route_id, created_at, carrier, totals).
+    Pass next_cursor from the previous page as cursor to continue; since/until bound created_at.
+    """
+    try:
+        return list_plans(db, limit=limit, cursor=cursor, since=since, until=until,
+                          carrier_model=carrier_model, transport_medium=transport_medium)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/plan/stream")
+def create_plan_stream(req: PlanRequest):
+    """
+    Same as POST /plan, streamed as server-sent events: run, progress, fuel_stop and leg events
+    while the plan is solved, then summary (the PlanResponse) or error.
+    """
+    return StreamingResponse(
+        stream_plan(req),
+        media_type="text/event-stream",
+        # no caching, and ask proxies (nginx) not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/jobs/plan", status_code=202)
+def create_plan_job(req: PlanRequest, priority: int = 0, timeout_s: float = 300.0, max_retries: int = 1):
+    """
+    Queue a plan and return its job id at once; poll GET /jobs/{job_id} for the result.
+    Higher priority runs first; failed or timed-out attempts are retried up to max_retries times.
+    """
+    if timeout_s <= 0 or max_retries < 0:
+        raise HTTPException(status_code=400, detail="timeout_s must be > 0 and max_retries >= 0")
+    job_id = submit_job("plan", req.dict(), priority=priority, timeout_s=timeout_s,
+                        max_retries=max_retries)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/jobs/{job_id}")
+def read_job(job_id: str):
+    """Job status (queued, running, done, failed); result holds the PlanResponse once done."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 class RefuelRequest(BaseModel):
@@ -54,6 +180,15 @@ class RefuelRequest(BaseModel):
     step_size: float = 1.0
     reserve: float = 0.1
     max_nodes_considered: int = 200
+    initial_fuel: Optional[float] = None
+    objective: str = "cheapest"  # cheapest | fastest | weighted | pareto
+    time_value_usd_per_hour: float = 0.0
+    optimize_speed: bool = False
+    max_hours: Optional[float] = None
+    max_stops: Optional[int] = None
+    port_opening_hours: Optional[Tuple[float, float]] = None  # (open_hour, close_hour), departure at hour 0
+    solver: str = "heap"  # heap | csgraph
+    max_states: int = 5_000_000
 
 
 @app.post("/refuel-plan")
@@ -83,30 +218,38 @@ def refuel_plan(req: RefuelRequest):
             fuel_unit=fuel_unit,
             step_size=req.step_size,
             reserve=req.reserve,
-            max_nodes_considered=req.max_nodes_considered
+            max_nodes_considered=req.max_nodes_considered,
+            initial_fuel=req.initial_fuel,
+            objective=req.objective,
+            time_value_usd_per_hour=req.time_value_usd_per_hour,
+            optimize_speed=req.optimize_speed,
+            max_hours=req.max_hours,
+            max_stops=req.max_stops,
+            port_opening_hours=req.port_opening_hours,
+            solver=req.solver,
+            max_states=req.max_states
         )
         return result
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/ports")
 def list_ports(db: Session = Depends(get_db)):
-    from app.models_orm import Port, Airport, Station
-    rows = db.query(Port).all()
+    from app.services.node_store import get_node_store
     out = []
-    from geoalchemy2.shape import to_shape
-    for r in rows:
-        shp = to_shape(r.geom)
+    for r in get_node_store(db, "port").records():
         out.append({
-            "id": r.id,
-            "name": r.name,
-            "lon": shp.x,
-            "lat": shp.y,
-            "bunker_price": r.bunker_price,
-            "port_fee": r.port_fee
+            "id": r["id"],
+            "name": r["name"],
+            "lon": r["lon"],
+            "lat": r["lat"],
+            "bunker_price": r["price"],
+            "port_fee": r["fee"]
         })
     return out
 
@@ -124,4 +267,9 @@ def list_carriers():
             item["id"] = k
             item["type"] = t
             out.append(item)
-    return out
\ No newline at end of file
+    return out
+
+@app.get("/distance-cache/stats")
+def distance_cache_stats():
+    """Hit rates of the shared node-pair distance cache, counted by the worker answering the request."""
+    return get_distance_cache().stats()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, conlist
-from typing import List, Optional, Any, Literal
+from typing import List, Optional, Any, Literal, Dict
 
 
 class Coordinate(BaseModel):
@@ -7,10 +7,33 @@ class Coordinate(BaseModel):
     lon: float
 
 
+class TimeWindow(BaseModel):
+    # hours after departure; arriving early means waiting until earliest_hours
+    earliest_hours: float = Field(0.0, ge=0.0)
+    latest_hours: Optional[float] = Field(None, gt=0.0)
+
+
+class OpeningHours(BaseModel):
+    # daily window (hours of day, same clock as PlanConstraints.departure_hour); close < open wraps midnight
+    open_hour: float = Field(..., ge=0.0, le=24.0, example=6.0)
+    close_hour: float = Field(..., ge=0.0, le=24.0, example=22.0)
+
+
+class PlanConstraints(BaseModel):
+    max_refuel_stops: Optional[int] = Field(None, ge=0, description="Most refuelling stops over the whole plan")
+    max_total_hours: Optional[float] = Field(None, gt=0.0, description="Latest arrival at the last destination, hours after departure")
+    # hour of day at departure; the clock port opening hours are given in
+    departure_hour: float = Field(0.0, ge=0.0, lt=24.0)
+    # refuelling can only start while a port is open; per-port entries are keyed by port name or node id ("port:12")
+    port_opening_hours: Optional[OpeningHours] = None
+    port_opening_hours_by_port: Dict[str, OpeningHours] = Field(default_factory=dict)
+
+
 class Destination(BaseModel):
     coord: Coordinate
     mode: Optional[Literal["ocean", "air", "road", "rail"]] = None
     name: Optional[str] = None
+    arrival_window: Optional[TimeWindow] = None
 
 
 class PlanRequest(BaseModel):
@@ -21,12 +44,29 @@ class PlanRequest(BaseModel):
     cargo_type: str = Field(..., example="bulk")
     cargo_quantity: float = Field(..., example=500.0)
     unit: str = Field(..., example="tons")
+    # "auto" evaluates every carrier model of each run's mode and picks the best for the objective
     carrier_model: Optional[str] = Field(None, example="bulkcarrier-75000DWT")
     origin: Coordinate
     # destinations is a list of Destination objects (each may specify mode); legacy support: accept simple list of coords
     destinations: List[Destination] = Field(..., min_items=1)
-    preferences: Optional[str] = Field("cheapest", example="cheapest")
-    constraints: Optional[dict] = None
+    # refuel plan objective; "weighted" trades USD against hours at time_value_usd_per_hour,
+    # "pareto" also returns the cost/time frontier
+    preferences: Optional[Literal["cheapest", "fastest", "weighted", "pareto"]] = Field("cheapest", example="cheapest")
+    time_value_usd_per_hour: Optional[float] = Field(None, ge=0.0, example=1500.0)
+    # ocean legs: pick a speed per segment from the carrier's speed/consumption curve (slow steaming)
+    optimize_speed: bool = Field(False, description="Choose ocean speeds per segment to save fuel")
+    # cargo over the carrier's payload/TEU/barrel capacity goes on several vehicles; False rejects it
+    split_shipments: bool = Field(True, description="Split over-capacity cargo across several vehicles")
+    # kept for older clients; same as constraints.max_total_hours (the tighter one wins)
+    arrival_deadline_hours: Optional[float] = Field(None, gt=0.0, description="Latest arrival at the last destination, hours after departure")
+    constraints: Optional[PlanConstraints] = None
+    # fuel on board at the origin (tons for ocean, liters otherwise); defaults to a full tank
+    initial_fuel: Optional[float] = Field(None, ge=0.0, example=1200.0)
+    # reorder destinations to shorten multi-drop tours before planning the legs
+    optimize_order: bool = Field(False, description="Reorder destinations to minimise total distance")
+    fix_first_stop: bool = Field(False, description="With optimize_order, keep the first destination first")
+    fix_last_stop: bool = Field(False, description="With optimize_order, keep the last destination last")
+    sequencing_time_budget_s: float = Field(1.0, ge=0.0, le=30.0)
 
 
 class FuelStop(BaseModel):
@@ -34,6 +74,8 @@ class FuelStop(BaseModel):
     amount_tons_or_liters: float
     price_per_unit_usd: float
     cost_usd: float
+    # identical stops of a fleet on the same route; amount and cost are the fleet's totals
+    vehicles: int = 1
 
 
 class LegDetail(BaseModel):
@@ -46,6 +88,70 @@ class LegDetail(BaseModel):
     fuel_needed: float
     fuel_unit: str
     port_fees_usd: float = 0.0
+    # set when the run's refuel plan failed and the leg keeps its coarse figures, without stops
+    refuel_warning: Optional[str] = None
+
+
+class SequenceSummary(BaseModel):
+    # order[i] is the index (into the requested destinations) of the i-th visited stop
+    order: List[int]
+    given_distance_km: float
+    optimized_distance_km: float
+    improvement_km: float
+    improvement_pct: float
+
+
+class SpeedSegment(BaseModel):
+    # one sea segment of the refuel plan and the speed chosen for it
+    from_name: str
+    to_name: str
+    distance_nm: float
+    speed_knots: float
+    time_hours: float
+    fuel_tons: float
+
+
+class ParetoOption(BaseModel):
+    # one non-dominated refuel plan of a run of legs sharing a vehicle
+    run_index: int
+    mode: str
+    total_cost_usd: float
+    total_time_hours: float
+    refuel_stops: List[str]
+
+
+class CarrierOption(BaseModel):
+    # one carrier model evaluated by carrier_model="auto"; score is what the run was ranked on
+    carrier_model: str
+    name: Optional[str] = None
+    status: Literal["ok", "infeasible", "pruned"]
+    # vehicles of this model the cargo needs; the cost is for all of them
+    vehicles: int = 1
+    total_cost_usd: Optional[float] = None
+    total_time_hours: Optional[float] = None
+    score: Optional[float] = None
+    # lower bound on score; "pruned" carriers could not beat the ranked ones
+    bound: Optional[float] = None
+    reason: Optional[str] = None
+
+
+class VehicleGroup(BaseModel):
+    # vehicles of one carrier model sharing a run's route, each carrying load_per_vehicle
+    run_index: int
+    mode: str
+    carrier_model: Optional[str] = None
+    name: Optional[str] = None
+    vehicles: int
+    load_per_vehicle: float
+    unit: str
+
+
+class CarrierChoice(BaseModel):
+    # carrier picked for a run of legs sharing a vehicle, with the ranked alternatives
+    run_index: int
+    mode: str
+    carrier_model: str
+    ranking: List[CarrierOption]
 
 
 class PlanResponse(BaseModel):
@@ -61,4 +167,15 @@ class PlanResponse(BaseModel):
     risk_score: float
     paperwork: List[str]
     leg_details: List[LegDetail]
+    sequence: Optional[SequenceSummary] = None
+    # km travelled per mode; shows the chosen mix for multi-modal plans
+    mode_split_km: Optional[Dict[str, float]] = None
+    pareto_frontier: Optional[List[ParetoOption]] = None
+    speed_plan: Optional[List[SpeedSegment]] = None
+    fuel_saved_vs_service_speed_tons: Optional[float] = None
+    carrier_choices: Optional[List[CarrierChoice]] = None
+    # set when cargo over a carrier's capacity was split across several vehicles
+    fleet: Optional[List[VehicleGroup]] = None
+    # problems the plan was completed despite, e.g. a run planned without refuelling stops
+    warnings: Optional[List[str]] = None
     raw: Optional[Any] = None
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Index, LargeBinary
 from sqlalchemy.sql import func
 from geoalchemy2 import Geometry
 from .db import Base
@@ -43,6 +43,8 @@ class Station(Base):
 
 
 class AISWaypoint(Base):
+    # partitioned by day in production (migrations/002_ais_waypoints_partitioned.sql);
+    # bulk-loaded by app/services/ais_ingest.py
     __tablename__ = "ais_waypoints"
     id = Column(Integer, primary_key=True, index=True)
     mmsi = Column(String, nullable=True, index=True)
@@ -56,19 +58,60 @@ class Plan(Base):
     __tablename__ = "plans"
     id = Column(Integer, primary_key=True, index=True)
     route_id = Column(String, nullable=False, unique=True, index=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    request = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # legacy: plans written before request_blob/response_blob; emptied by the plan_store backfill
+    request = Column(JSON, nullable=True)
     response = Column(JSON, nullable=True)
+    # PlanRequest and PlanResponse as compressed canonical JSON (see app/services/plan_store.py)
+    request_blob = Column(LargeBinary, nullable=True)
+    response_blob = Column(LargeBinary, nullable=True)
+    # copied out of request/response so GET /plans can filter and list without reading the blobs
+    # (migrations/003_plans_history.sql backfills them for older rows)
+    carrier_model = Column(String, nullable=True)
+    transport_medium = Column(String, nullable=True)
+    cargo_type = Column(String, nullable=True)
+    total_cost_usd = Column(Float, nullable=True)
+    total_time_hours = Column(Float, nullable=True)
+    total_distance_km = Column(Float, nullable=True)
+    stops = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        # keyset pagination: newest first, id breaks ties
+        Index("ix_plans_created_at_id", "created_at", "id"),
+        Index("ix_plans_carrier_created_at", "carrier_model", "created_at", "id"),
+        Index("ix_plans_medium_created_at", "transport_medium", "created_at", "id"),
+    )
 
 
 class PlanLeg(Base):
     __tablename__ = "plan_legs"
     id = Column(Integer, primary_key=True, index=True)
-    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="CASCADE"))
+    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="CASCADE"), index=True)
     idx = Column(Integer, nullable=False)
-    from_name = Column(String)
-    to_name = Column(String)
+    mode = Column(String, nullable=True)
+    from_geom = Column(Geometry(geometry_type="POINT", srid=4326), nullable=True)
+    to_geom = Column(Geometry(geometry_type="POINT", srid=4326), nullable=True)
+    distance_km = Column(Float)
     distance_nm = Column(Float)
     time_hours = Column(Float)
-    fuel_needed_tons = Column(Float)
-    extra = Column(JSON, nullable=True)
\ No newline at end of file
+    # in fuel_unit: tons for ocean legs, liters otherwise
+    fuel_needed = Column(Float)
+    fuel_unit = Column(String, nullable=True)
+    port_fees_usd = Column(Float, nullable=True)
+
+
+class PlanFuelStop(Base):
+    __tablename__ = "plan_fuel_stops"
+    id = Column(Integer, primary_key=True, index=True)
+    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="CASCADE"), index=True)
+    idx = Column(Integer, nullable=False)
+    run_index = Column(Integer, nullable=True)
+    # "port:12", "airport:7", ...; NULL for plans stored before it was recorded
+    node_id = Column(String, nullable=True, index=True)
+    name = Column(String, nullable=True)
+    geom = Column(Geometry(geometry_type="POINT", srid=4326), nullable=True)
+    amount = Column(Float)
+    fuel_unit = Column(String, nullable=True)
+    price_per_unit_usd = Column(Float)
+    cost_usd = Column(Float)
+    wait_hours = Column(Float, nullable=True)
@@ -0,0 +1,273 @@
+"""
+Fleet batch planning: many PlanRequests in one call, solved in parallel.
+
+Planning shipments one POST /plan at a time repeats the per-request setup (port seeding, a new
+DB session, carrier/node/graph loads) and uses one core. A batch instead:
+
+- groups shipments by (transport medium, carrier, per-destination modes) and cuts each group
+  into one chunk per worker (at most chunk_size shipments each), so every worker gets a share
+  of even a small batch and solves similar shipments back to back against node stores, sea
+  tables and networks it has already built;
+- solves chunks on a shared pool of worker processes (spawned once, reused across batches, so
+  their caches stay warm between mornings' runs); workers=1 plans inline instead;
+- seeds ports once, reuses one DB session per worker process (inline planning uses the batch's
+  own session), and persists each finished chunk with a single plan_store.store_plans call
+  from the parent;
+- yields one result per shipment in input order as soon as every earlier one is done, so the
+  NDJSON stream starts before the batch finishes.
+
+Input: a list of PlanRequest bodies, or a CSV with one shipment per row:
+    shipment_id (optional), origin_lat, origin_lon, dest_lat, dest_lon, cargo_type,
+    cargo_quantity, unit, and optionally transport_medium, carrier_model, preferences,
+    initial_fuel, optimize_speed, time_value_usd_per_hour.
+    Multi-drop rows give `destinations` as "lat,lon;lat,lon" instead of dest_lat/dest_lon.
+
+Output (one JSON object per line):
+    {"index", "shipment_id", "status": "ok", "plan": PlanResponse}
+    {"index", "shipment_id", "status": "error", "error"}
+
+API:
+    read_shipments_csv(text) -> (requests, shipment_ids)
+    plan_batch(requests, shipment_ids=None, workers=None, chunk_size=16) -> iterator of result dicts
+                                                      (chunk_size caps a chunk; groups split per worker)
+    stream_batch(...) -> iterator of NDJSON lines (bytes)
+
+CLI:
+    python -m app.services.batch_planning --file shipments.csv --workers 8 --out plans.ndjson
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.models import PlanRequest
+from app.services.serialization import dumps
+
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "0")) or (os.cpu_count() or 2)
+CHUNK_SIZE = 16
+
+CSV_FIELDS = ("transport_medium", "carrier_model", "preferences", "initial_fuel", "optimize_speed",
+              "time_value_usd_per_hour")
+
+
+def _row_request(row: Dict[str, str]) -> PlanRequest:
+    if row.get("destinations"):
+        points = [p.split(",") for p in row["destinations"].split(";") if p.strip()]
+    else:
+        points = [(row["dest_lat"], row["dest_lon"])]
+    body = {
+        "origin": {"lat": float(row["origin_lat"]), "lon": float(row["origin_lon"])},
+        "destinations": [{"coord": {"lat": float(lat), "lon": float(lon)}} for lat, lon in points],
+        "cargo_type": row["cargo_type"],
+        "cargo_quantity": float(row["cargo_quantity"]),
+        "unit": row["unit"],
+    }
+    for field in CSV_FIELDS:
+        value = (row.get(field) or "").strip()
+        if value:
+            body[field] = value
+    return PlanRequest(**body)
+
+
+def read_shipments_csv(text: str) -> Tuple[List[PlanRequest], List[Optional[str]]]:
+    """Parse a shipments CSV; raises ValueError naming the first bad row."""
+    requests, ids = [], []
+    for n, row in enumerate(csv.DictReader(io.StringIO(text)), start=2):
+        try:
+            requests.append(_row_request(row))
+        except Exception as e:
+            raise ValueError(f"Shipment CSV line {n}: {e}")
+        ids.append((row.get("shipment_id") or "").strip() or None)
+    return requests, ids
+
+
+def group_key(req: PlanRequest):
+    modes = tuple(sorted({d.mode for d in req.destinations if d.mode}))
+    return req.transport_medium or "", req.carrier_model or "", modes
+
+
+def _chunks(requests: List[PlanRequest], chunk_size: int, workers: int = 1) -> List[List[Tuple[int, Dict[str, Any]]]]:
+    """
+    (index, request body) chunks, each from a single group; groups in order of first appearance.
+    A group is spread over `workers` chunks, none longer than chunk_size.
+    """
+    groups: Dict[tuple, List[int]] = {}
+    for i, req in enumerate(requests):
+        groups.setdefault(group_key(req), []).append(i)
+    out = []
+    for members in groups.values():
+        count = max(min(workers, len(members)), -(-len(members) // chunk_size))
+        # near-equal chunks: the first len % count get one extra shipment
+        start = 0
+        for n in range(count):
+            end = start + len(members) // count + (n < len(members) % count)
+            out.append([(i, requests[i].dict()) for i in members[start:end]])
+            start = end
+    return out
+
+
+# ---- worker side -------------------------------------------------------------------------
+
+# session of a spawned worker process, opened on its first chunk and kept for its lifetime
+_worker_db = None
+
+
+def _plan_chunk(chunk, db=None):
+    """
+    Plan one chunk: [(index, response | None, stops, error | None)]. Worker processes pass no
+    db and use their own long-lived session; inline planning passes the batch's session, since a
+    module-level one would be shared by concurrent requests on the API threadpool.
+    """
+    global _worker_db
+    from app.db import get_db
+    from app.services.optimizer import build_plan_payload
+
+    if db is None:
+        if _worker_db is None:
+            _worker_db = next(get_db())
+        db = _worker_db
+    out = []
+    for index, body in chunk:
+        collected = []
+        try:
+            build_plan_payload(PlanRequest(**body), db=db, seed=False,
+                               store=lambda db, req, response, stops: collected.append((response, stops)))
+            out.append((index, collected[0][0], collected[0][1], None))
+        except Exception as e:
+            db.rollback()
+            out.append((index, None, None, str(e)))
+    return out
+
+
+# ---- parent side -------------------------------------------------------------------------
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """Shared pool, recreated only when a different size is asked for (or it broke)."""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = workers
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+
+
+def _completed_chunks(chunks, workers: int, db):
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield chunk, _plan_chunk(chunk, db)
+        return
+    executor = _get_executor(workers)
+    futures = {executor.submit(_plan_chunk, chunk): chunk for chunk in chunks}
+    for fut in as_completed(futures):
+        chunk = futures[fut]
+        try:
+            yield chunk, fut.result()
+        except BrokenProcessPool as e:
+            # a worker died (e.g. out of memory); the pool is rebuilt for the next batch
+            _reset_executor()
+            yield chunk, [(index, None, None, f"worker failed: {e}") for index, _ in chunk]
+        except Exception as e:
+            yield chunk, [(index, None, None, str(e)) for index, _ in chunk]
+
+
+def plan_batch(requests: List[PlanRequest], shipment_ids: Optional[List[Optional[str]]] = None,
+               workers: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Plan, persist and yield one result dict per request, in input order."""
+    from app.db import get_db
+    from app.services.plan_store import store_plans
+    from app.services.ports_loader import seed_ports
+
+    workers = max(1, int(workers or BATCH_WORKERS))
+    shipment_ids = shipment_ids or [None] * len(requests)
+    db = next(get_db())
+    try:
+        seed_ports(db)
+        t0 = time.perf_counter()
+        pending: Dict[int, Dict[str, Any]] = {}
+        next_index = 0
+        failed = 0
+        chunks = _chunks(requests, max(1, chunk_size), workers)
+        for chunk, results in _completed_chunks(chunks, workers, db):
+            ok = [r for r in results if r[3] is None]
+            if ok:
+                try:
+                    store_plans(db, [(requests[index], response, stops) for index, response, stops, _ in ok])
+                except Exception as e:
+                    db.rollback()
+                    results = [(index, None, None, error or f"could not store plan: {e}")
+                               for index, _, _, error in results]
+            for index, response, _, error in results:
+                record = {"index": index, "shipment_id": shipment_ids[index]}
+                if error is None:
+                    record.update(status="ok", plan=response)
+                else:
+                    record.update(status="error", error=error)
+                    failed += 1
+                pending[index] = record
+            while next_index in pending:
+                yield pending.pop(next_index)
+                next_index += 1
+        print(f"[batch] {len(requests)} shipments ({failed} failed) on {workers} workers "
+              f"in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    finally:
+        db.close()
+
+
+def stream_batch(requests: List[PlanRequest], shipment_ids: Optional[List[Optional[str]]] = None,
+                 workers: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    for record in plan_batch(requests, shipment_ids, workers, chunk_size):
+        yield dumps(record) + b"\n"
+
+
+def read_shipments_file(path: str) -> Tuple[List[PlanRequest], List[Optional[str]]]:
+    with open(path, "r") as f:
+        text = f.read()
+    if path.lower().endswith(".csv"):
+        return read_shipments_csv(text)
+    bodies = json.loads(text)
+    return [PlanRequest(**b) for b in bodies], [None] * len(bodies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan a batch of shipments")
+    parser.add_argument("--file", required=True, help="shipments CSV, or a JSON list of PlanRequests")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--out", default=None, help="NDJSON output file (default stdout)")
+    args = parser.parse_args()
+
+    requests, ids = read_shipments_file(args.file)
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for line in stream_batch(requests, ids, workers=args.workers, chunk_size=args.chunk_size):
+            out.write(line)
+            out.flush()
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Load-dependent fuel consumption.
+
+A carrier's consumption_* rate (consumption_tons_per_nm, consumption_l_per_km, the speed curve of
+vessel_speed.py) is its burn fully laden. A profile may add how the burn falls with the load:
+
+    load_curve   [[load_fraction, factor], ...]   factor applied to the laden rate
+
+Two points make a linear model, more points a table; factors are interpolated linearly and held
+constant beyond the first and last point. Without a load_curve the factor is 1 at every load (the
+fixed-rate model).
+
+The load fraction counts everything the carrier lifts besides itself: payload plus fuel on board,
+over the most it can lift (deadweight for ships, which already includes bunkers; max payload plus
+a full tank otherwise). Fuel is weighed at FUEL_DENSITY_KG_PER_L for liter-fuelled modes, so a
+freighter leaving with full tanks burns more per km than the same aircraft on the last leg.
+
+Burn over a leg is evaluated at the mean load on that leg: the burn at the departure load is
+corrected once with the load at half the leg's fuel burnt. Everything takes numpy arrays and
+broadcasts, so the solver evaluates every candidate edge at every fuel level in one call.
+
+API:
+    has_load_curve(carrier) -> bool
+    load_factor(carrier, load_fraction) -> ndarray
+    min_load_factor(carrier) -> float            (lowest factor; lower bounds use it)
+    fuel_tonnes(mode, amount) -> ndarray          (fuel amount in its unit -> tonnes)
+    load_fraction(carrier, mode, payload_tonnes, fuel_on_board) -> ndarray
+    leg_burn(carrier, mode, laden_fuel, payload_tonnes, fuel_on_board) -> ndarray
+"""
+from typing import Any, Dict
+import numpy as np
+
+# kg per liter of the fuel each liter-fuelled mode burns (jet A-1, diesel); ocean fuel is in tonnes
+FUEL_DENSITY_KG_PER_L = {"air": 0.8, "road": 0.84, "rail": 0.84}
+
+
+def has_load_curve(carrier: Dict[str, Any]) -> bool:
+    return bool(carrier.get("load_curve"))
+
+
+def _curve(carrier: Dict[str, Any]):
+    pts = np.asarray(sorted(carrier["load_curve"]), dtype=np.float64)
+    return pts[:, 0], pts[:, 1]
+
+
+def load_factor(carrier: Dict[str, Any], load_fraction) -> np.ndarray:
+    lf = np.asarray(load_fraction, dtype=np.float64)
+    if not has_load_curve(carrier):
+        return np.ones_like(lf)
+    x, y = _curve(carrier)
+    return np.interp(lf, x, y)
+
+
+def min_load_factor(carrier: Dict[str, Any]) -> float:
+    if not has_load_curve(carrier):
+        return 1.0
+    return float(min(_curve(carrier)[1].min(), 1.0))
+
+
+def fuel_tonnes(mode: str, amount) -> np.ndarray:
+    amount = np.asarray(amount, dtype=np.float64)
+    if mode == "ocean":
+        return amount
+    return amount * FUEL_DENSITY_KG_PER_L.get(mode, 0.84) / 1000.0
+
+
+def _fuel_capacity(carrier: Dict[str, Any], mode: str) -> float:
+    return float(carrier.get("fuel_capacity_tons" if mode == "ocean" else "fuel_capacity_l") or 0.0)
+
+
+def _max_lift_tonnes(carrier: Dict[str, Any], mode: str):
+    if mode == "ocean":
+        dwt = carrier.get("deadweight_tons")
+        return float(dwt) if dwt else None
+    payload = carrier.get("max_payload_kg")
+    if payload is None:
+        return None
+    return payload / 1000.0 + float(fuel_tonnes(mode, _fuel_capacity(carrier, mode)))
+
+
+def load_fraction(carrier: Dict[str, Any], mode: str, payload_tonnes, fuel_on_board) -> np.ndarray:
+    """(payload + fuel) / most the carrier lifts, clipped to [0, 1]; payload None = fully loaded."""
+    fuel = np.asarray(fuel_on_board, dtype=np.float64)
+    lift = _max_lift_tonnes(carrier, mode)
+    if not lift:
+        return np.ones_like(fuel)
+    if payload_tonnes is None:
+        # a full cargo hold; what is left of the lift is bunker space
+        payload_tonnes = lift - float(fuel_tonnes(mode, _fuel_capacity(carrier, mode)))
+    return np.clip((payload_tonnes + fuel_tonnes(mode, fuel)) / lift, 0.0, 1.0)
+
+
+def leg_burn(carrier: Dict[str, Any], mode: str, laden_fuel, payload_tonnes, fuel_on_board) -> np.ndarray:
+    """
+    Fuel burnt on legs that would take laden_fuel fully laden, leaving with fuel_on_board (same
+    unit as the carrier's fuel); the arrays broadcast against each other.
+    """
+    laden_fuel = np.asarray(laden_fuel, dtype=np.float64)
+    if not has_load_curve(carrier):
+        return laden_fuel * np.ones_like(np.asarray(fuel_on_board, dtype=np.float64))
+    fuel_on_board = np.asarray(fuel_on_board, dtype=np.float64)
+    first = laden_fuel * load_factor(carrier, load_fraction(carrier, mode, payload_tonnes, fuel_on_board))
+    mean_fuel = np.maximum(fuel_on_board - 0.5 * first, 0.0)
+    return laden_fuel * load_factor(carrier, load_fraction(carrier, mode, payload_tonnes, mean_fuel))
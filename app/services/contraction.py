@@ -0,0 +1,358 @@
+"""
+Contraction hierarchies (CH) for fast point-to-point shortest paths on static graphs.
+
+Preprocessing contracts nodes one by one in order of importance (edge difference + number of
+contracted neighbours, with lazy updates). When a node v is contracted, a shortcut u->w is added
+for every pair of neighbours whose shortest path runs through v (checked with a bounded witness
+search). Queries then run a bidirectional Dijkstra that only relaxes edges towards more important
+nodes, which settles a few hundred nodes even on large graphs.
+
+The graph is directed; add both directions for undirected networks. Edge weights must be >= 0.
+Parallel edges keep the cheapest one.
+
+Edges may carry a second metric, (u, v, weight, length): the hierarchy is still built on weight
+(e.g. travel time) and lengths (e.g. km) are summed along shortcuts, so queries report the length
+of the cheapest path without unpacking it.
+
+Many-to-many queries use buckets: one backward upward search per target stores (target, cost) at
+every node it settles, then one forward upward search per source scans the buckets of the nodes
+it settles. That is |sources| + |targets| small searches instead of |sources| * |targets| queries.
+
+A built hierarchy is saved as a single .npz (rank, upward edges in CSR form, shortcut middles)
+together with any arrays the caller adds, and loaded without contracting again.
+
+API:
+    ch = ContractionHierarchy(num_nodes, edges)   # edges: iterable of (u, v, weight[, length])
+    ch.query(source, target) -> (cost, [node path])
+    ch.query_multi({src: init_cost}, {dst: final_cost}) -> (cost, [node path])
+    ch.path_length(path) -> float
+    ch.many_to_many([{src: (init_cost, init_length)}], [{dst: (cost, length)}]) -> (costs, lengths)
+    ch.search_space(seeds, forward) -> [(node, cost, length)]; ch.join(forward_spaces, backward_spaces)
+    ch.save(path, **arrays); ContractionHierarchy.load(path) -> ch  (extra arrays in ch.meta)
+"""
+from collections import defaultdict
+from heapq import heappush, heappop, heapify
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+INF = float("inf")
+
+# witness searches stop after settling this many nodes; a missed witness only adds a redundant shortcut
+WITNESS_SETTLE_LIMIT = 60
+
+
+class ContractionHierarchy:
+    def __init__(self, num_nodes: int, edges: Iterable[tuple]):
+        self.num_nodes = num_nodes
+        out = [dict() for _ in range(num_nodes)]
+        inn = [dict() for _ in range(num_nodes)]
+        # (u, v) -> length of the cheapest u->v edge or shortcut; None without a length metric
+        self.lengths: Optional[Dict[Tuple[int, int], float]] = None
+        for edge in edges:
+            u, v, w = edge[0], edge[1], float(edge[2])
+            if u == v:
+                continue
+            if w < out[u].get(v, INF):
+                out[u][v] = w
+                inn[v][u] = w
+                if len(edge) > 3:
+                    if self.lengths is None:
+                        self.lengths = {}
+                    self.lengths[(u, v)] = float(edge[3])
+        # middle node of every shortcut (u, w) -> v, used to unpack paths
+        self.shortcut_mid: Dict[Tuple[int, int], int] = {}
+        self.meta: Dict[str, np.ndarray] = {}
+        self.rank = [0] * num_nodes
+        self._contract(out, inn)
+
+    # ---- preprocessing -------------------------------------------------------------------
+
+    def _witness(self, out, source: int, skip: int, targets: Dict[int, float], limit: float) -> Dict[int, float]:
+        """Bounded Dijkstra from source avoiding `skip`; returns distances to reached targets."""
+        dist = {source: 0.0}
+        found = {}
+        pq = [(0.0, source)]
+        settled = 0
+        while pq and settled < WITNESS_SETTLE_LIMIT:
+            d, x = heappop(pq)
+            if d > dist.get(x, INF):
+                continue
+            if d > limit:
+                break
+            settled += 1
+            if x in targets:
+                found[x] = d
+                if len(found) == len(targets):
+                    break
+            for y, w in out[x].items():
+                if y == skip:
+                    continue
+                nd = d + w
+                if nd < dist.get(y, INF):
+                    dist[y] = nd
+                    heappush(pq, (nd, y))
+        return found
+
+    def _shortcuts_for(self, out, inn, v: int) -> List[Tuple[int, int, float]]:
+        needed = []
+        outs = out[v]
+        if not outs:
+            return needed
+        max_out = max(outs.values())
+        for u, w_in in inn[v].items():
+            targets = {w: w_in + w_out for w, w_out in outs.items() if w != u}
+            if not targets:
+                continue
+            witnesses = self._witness(out, u, v, targets, w_in + max_out)
+            for w, via in targets.items():
+                if witnesses.get(w, INF) > via:
+                    needed.append((u, w, via))
+        return needed
+
+    def _priority(self, out, inn, v: int, deleted_neighbours: List[int]) -> float:
+        shortcuts = self._shortcuts_for(out, inn, v)
+        edge_difference = len(shortcuts) - len(out[v]) - len(inn[v])
+        return edge_difference + deleted_neighbours[v]
+
+    def _contract(self, out, inn):
+        n = self.num_nodes
+        deleted_neighbours = [0] * n
+        pq = [(self._priority(out, inn, v, deleted_neighbours), v) for v in range(n)]
+        pq.sort()
+        contracted = [False] * n
+        # edges towards more important nodes, kept for queries
+        self.up_out: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+        self.up_in: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+        order = 0
+        while pq:
+            prio, v = heappop(pq)
+            if contracted[v]:
+                continue
+            # lazy update: re-evaluate and push back if no longer the minimum
+            current = self._priority(out, inn, v, deleted_neighbours)
+            if pq and current > pq[0][0]:
+                heappush(pq, (current, v))
+                continue
+            for u, w, cost in self._shortcuts_for(out, inn, v):
+                if cost < out[u].get(w, INF):
+                    out[u][w] = cost
+                    inn[w][u] = cost
+                    self.shortcut_mid[(u, w)] = v
+                    if self.lengths is not None:
+                        self.lengths[(u, w)] = self.lengths[(u, v)] + self.lengths[(v, w)]
+            contracted[v] = True
+            self.rank[v] = order
+            order += 1
+            # remaining neighbours are all more important than v
+            for w, cost in out[v].items():
+                self.up_out[v].append((w, cost))
+                del inn[w][v]
+                deleted_neighbours[w] += 1
+            for u, cost in inn[v].items():
+                self.up_in[v].append((u, cost))
+                del out[u][v]
+                deleted_neighbours[u] += 1
+            out[v] = {}
+            inn[v] = {}
+
+    # ---- queries -------------------------------------------------------------------------
+
+    def query(self, source: int, target: int) -> Tuple[float, List[int]]:
+        return self.query_multi({source: 0.0}, {target: 0.0})
+
+    def query_multi(self, sources: Dict[int, float], targets: Dict[int, float]) -> Tuple[float, List[int]]:
+        """
+        Cheapest path from any source to any target. The initial (resp. final) costs model access
+        legs from/to points that are not graph nodes. Returns (INF, []) when unreachable.
+        """
+        dist_f = dict(sources)
+        dist_b = dict(targets)
+        prev_f = {}
+        prev_b = {}
+        pq_f = [(d, s) for s, d in sources.items()]
+        pq_b = [(d, t) for t, d in targets.items()]
+        pq_f.sort()
+        pq_b.sort()
+        best = INF
+        meet = None
+        for s, d in sources.items():
+            if s in dist_b and d + dist_b[s] < best:
+                best, meet = d + dist_b[s], s
+        while pq_f or pq_b:
+            # stop once both frontiers are past the best meeting cost
+            min_f = pq_f[0][0] if pq_f else INF
+            min_b = pq_b[0][0] if pq_b else INF
+            if min(min_f, min_b) >= best:
+                break
+            if min_f <= min_b:
+                pq, dist, other, prev, adj = pq_f, dist_f, dist_b, prev_f, self.up_out
+            else:
+                pq, dist, other, prev, adj = pq_b, dist_b, dist_f, prev_b, self.up_in
+            d, x = heappop(pq)
+            if d > dist.get(x, INF):
+                continue
+            if x in other and d + other[x] < best:
+                best, meet = d + other[x], x
+            for y, w in adj[x]:
+                nd = d + w
+                if nd < dist.get(y, INF):
+                    dist[y] = nd
+                    prev[y] = x
+                    heappush(pq, (nd, y))
+                    if y in other and nd + other[y] < best:
+                        best, meet = nd + other[y], y
+        if meet is None:
+            return INF, []
+        # walk both search trees back to the meeting node, then expand shortcuts
+        up = [meet]
+        while up[-1] in prev_f:
+            up.append(prev_f[up[-1]])
+        up.reverse()
+        down = []
+        x = meet
+        while x in prev_b:
+            x = prev_b[x]
+            down.append(x)
+        return best, self._unpack(up + down)
+
+    def _unpack(self, path: List[int]) -> List[int]:
+        if len(path) < 2:
+            return path
+        out = [path[0]]
+        for u, w in zip(path, path[1:]):
+            stack = [(u, w)]
+            while stack:
+                a, b = stack.pop()
+                mid = self.shortcut_mid.get((a, b))
+                if mid is None:
+                    out.append(b)
+                else:
+                    # expand a->mid before mid->b
+                    stack.append((mid, b))
+                    stack.append((a, mid))
+        return out
+
+    def path_length(self, path: List[int]) -> float:
+        """Summed length metric along an unpacked path (0.0 without lengths)."""
+        if self.lengths is None:
+            return 0.0
+        return sum(self.lengths[(u, w)] for u, w in zip(path, path[1:]))
+
+    # ---- many-to-many --------------------------------------------------------------------
+
+    def search_space(self, seeds: Dict[int, Tuple[float, float]], forward: bool = True) -> List[Tuple[int, float, float]]:
+        """
+        (node, cost, length) of every node the upward search from seeds settles: forward along up_out
+        (paths leaving the seeds), backward along up_in (paths into them). Seeds map node ->
+        (initial cost, initial length).
+        """
+        adj = self.up_out if forward else self.up_in
+        lengths = self.lengths
+        dist = {x: c for x, (c, _) in seeds.items()}
+        length = {x: l for x, (_, l) in seeds.items()}
+        pq = [(c, x) for x, c in dist.items()]
+        heapify(pq)
+        space = []
+        while pq:
+            d, x = heappop(pq)
+            if d > dist[x]:
+                continue
+            space.append((x, d, length[x]))
+            for y, w in adj[x]:
+                nd = d + w
+                if nd < dist.get(y, INF):
+                    dist[y] = nd
+                    if lengths is None:
+                        length[y] = 0.0
+                    else:
+                        length[y] = length[x] + lengths[(x, y) if forward else (y, x)]
+                    heappush(pq, (nd, y))
+        return space
+
+    def join(self, forward_spaces: List[list], backward_spaces: List[list]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (costs, lengths) arrays from every forward space's seeds to every backward space's seeds;
+        INF where unreachable. Spaces come from search_space and can be reused across calls.
+        """
+        buckets = defaultdict(list)
+        for j, space in enumerate(backward_spaces):
+            for x, d, l in space:
+                buckets[x].append((j, d, l))
+        costs = np.full((len(forward_spaces), len(backward_spaces)), INF)
+        lengths = np.full((len(forward_spaces), len(backward_spaces)), INF)
+        for i, space in enumerate(forward_spaces):
+            best = [INF] * len(backward_spaces)
+            best_len = [INF] * len(backward_spaces)
+            for x, d, l in space:
+                for j, d_b, l_b in buckets.get(x, ()):
+                    if d + d_b < best[j]:
+                        best[j] = d + d_b
+                        best_len[j] = l + l_b
+            costs[i] = best
+            lengths[i] = best_len
+        return costs, lengths
+
+    def many_to_many(self, sources: List[Dict[int, Tuple[float, float]]],
+                     targets: List[Dict[int, Tuple[float, float]]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cheapest cost (and its length) from every source to every target, as two
+        (len(sources), len(targets)) arrays; INF where unreachable. Each source/target is a dict
+        node -> (initial cost, initial length), like the access legs of query_multi.
+        """
+        return self.join([self.search_space(s, forward=True) for s in sources],
+                         [self.search_space(t, forward=False) for t in targets])
+
+    # ---- persistence ---------------------------------------------------------------------
+
+    @staticmethod
+    def _csr(adj: List[List[Tuple[int, float]]]):
+        indptr = np.zeros(len(adj) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(a) for a in adj])
+        idx = np.fromiter((y for a in adj for y, _ in a), dtype=np.int32, count=int(indptr[-1]))
+        weight = np.fromiter((w for a in adj for _, w in a), dtype=np.float64, count=int(indptr[-1]))
+        return indptr, idx, weight
+
+    def save(self, path: str, **arrays):
+        """Write the hierarchy (and extra named arrays, e.g. node coordinates) to one .npz file."""
+        out_ptr, out_idx, out_w = self._csr(self.up_out)
+        in_ptr, in_idx, in_w = self._csr(self.up_in)
+        mids = np.array([(u, w, v) for (u, w), v in self.shortcut_mid.items()], dtype=np.int32).reshape(-1, 3)
+        data = dict(num_nodes=np.array(self.num_nodes), rank=np.asarray(self.rank, dtype=np.int32),
+                    out_ptr=out_ptr, out_idx=out_idx, out_w=out_w, in_ptr=in_ptr, in_idx=in_idx, in_w=in_w,
+                    shortcut_mid=mids)
+        if self.lengths is not None:
+            # lengths of the upward edges cover every pair a query or unpacking can look up
+            rows = np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(out_ptr))
+            data["out_len"] = np.array([self.lengths[(u, w)] for u, w in zip(rows.tolist(), out_idx.tolist())])
+            rows = np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(in_ptr))
+            data["in_len"] = np.array([self.lengths[(u, v)] for v, u in zip(rows.tolist(), in_idx.tolist())])
+        with open(path, "wb") as f:
+            np.savez(f, **data, **{"meta_" + k: np.asarray(v) for k, v in arrays.items()})
+
+    @classmethod
+    def load(cls, path: str) -> "ContractionHierarchy":
+        with np.load(path) as data:
+            ch = cls.__new__(cls)
+            ch.num_nodes = int(data["num_nodes"])
+            ch.rank = data["rank"].tolist()
+            ch.up_out = cls._adjacency(data["out_ptr"], data["out_idx"], data["out_w"])
+            ch.up_in = cls._adjacency(data["in_ptr"], data["in_idx"], data["in_w"])
+            ch.shortcut_mid = {(u, w): v for u, w, v in data["shortcut_mid"].tolist()}
+            ch.lengths = None
+            if "out_len" in data.files:
+                ch.lengths = {}
+                for adj, lens, forward in ((ch.up_out, data["out_len"].tolist(), True),
+                                           (ch.up_in, data["in_len"].tolist(), False)):
+                    pos = 0
+                    for x, row in enumerate(adj):
+                        for y, _ in row:
+                            ch.lengths[(x, y) if forward else (y, x)] = lens[pos]
+                            pos += 1
+            ch.meta = {k[len("meta_"):]: data[k] for k in data.files if k.startswith("meta_")}
+        return ch
+
+    @staticmethod
+    def _adjacency(indptr, idx, weight) -> List[List[Tuple[int, float]]]:
+        indptr = indptr.tolist()
+        pairs = list(zip(idx.tolist(), weight.tolist()))
+        return [pairs[indptr[x]:indptr[x + 1]] for x in range(len(indptr) - 1)]
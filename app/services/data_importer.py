@@ -14,6 +14,10 @@ Usage (examples):
     python -m app.services.data_importer import_airports --file path/to/ourairports.csv
     python -m app.services.data_importer import_stations --file path/to/stations.csv
 
+Imports mark the cached node stores stale in running API processes (app/services/node_store.py)
+and refresh the memory-mapped distance matrices (app/services/distance_matrix.py) for ports and
+airports if they have been built.
+
 Notes:
 - Some authoritative sources require registration or manual download (UN/LOCODE). For convenience use public datasets:
   - OurAirports airports.csv: https://ourairports.com/data/
@@ -30,6 +34,8 @@ import requests
 from typing import Optional
 from app.db import get_db
 from app.models_orm import Port, Airport, Station
+from app.services.distance_matrix import update_after_import
+from app.services.node_store import touch_node_stores
 from geoalchemy2.elements import WKTElement
 
 def _download_if_url(path_or_url: str) -> str:
@@ -94,6 +100,9 @@ def import_ports_from_csv(file_path: str, unlocode_col='UN/LOCODE', name_col='Na
         db.close()
 
     print(f"Imported/updated {count} ports from {file_path}")
+    touch_node_stores()
+    # refresh prebuilt distance matrices (only rows of new/moved ports are recomputed)
+    update_after_import("port_sea")
 
 
 def import_airports_from_ourairports(file_path: str):
@@ -145,6 +154,8 @@ def import_airports_from_ourairports(file_path: str):
         db.close()
 
     print(f"Imported/updated {count} airports from {file_path}")
+    touch_node_stores()
+    update_after_import("airport")
 
 
 def import_stations_from_csv(file_path: str, lon_col='lon', lat_col='lat', name_col='name', kind_col='kind', price_col=None):
@@ -193,6 +204,10 @@ def import_stations_from_csv(file_path: str, lon_col='lon', lat_col='lat', name_
         db.close()
 
     print(f"Imported/updated {count} stations from {file_path}")
+    touch_node_stores()
+    # rail terminals (kind rail_terminal) have prebuilt terminal-to-terminal tables
+    update_after_import("rail_terminal")
+    update_after_import("rail_terminal_time")
 
 
 def main():
@@ -0,0 +1,412 @@
+"""
+Shared cache of network distances between node pairs, in memory and on disk.
+
+The mapped matrices of distance_matrix.py cover DB node to DB node. Everything else is routed per
+call: a plan's legs (sea lanes, road and rail routes) and the rows of its origin and destinations
+in the refuel candidate matrices. The same warehouses, ports and stations come back request after
+request, so those results are cached here, keyed by (node_id_a, node_id_b, metric):
+
+- node ids are node_store ids ("port:12", "station:7") for DB nodes and point_id(lat, lon)
+  ("pt:51.94700,4.13600") for free points such as origins and destinations;
+- metrics: great_circle (km), sea (nm), road and rail (km and hours). great_circle and sea are
+  symmetric and stored once per unordered pair; road and rail are directed (one-way streets);
+- tier 1 is an in-process LRU of DISTANCE_CACHE_SIZE pairs; tier 2 is a SQLite file in WAL mode
+  (DISTANCE_CACHE_DB, default data/distance_cache.sqlite3; empty disables it) shared by every
+  worker and process on the machine, so a pair is routed once and reused everywhere;
+- unreachable pairs are cached too (inf).
+
+Invalidation: every entry records the coordinates of both nodes and the version of the network it
+was routed on (sea lanes file, road/rail network build time). A lookup whose node moved or whose
+network was rebuilt is a miss and overwrites the entry. invalidate() drops entries explicitly;
+purge() deletes disk entries of older network versions.
+
+Metrics: lookups, memory hits, disk hits and computed pairs per metric, since process start
+(stats(); GET /distance-cache/stats for the worker that answers).
+
+API:
+    point_id(lat, lon) -> str
+    node_ids(nodes) -> [str]                  (ids of a NodeStore's rows, virtual rows by position)
+    cached_distance(metric, a_id, a, b_id, b) -> (value, hours | nan)
+    cached_matrix(metric, from_ids, from_points, to_ids, to_points) -> (values, hours | None)
+    get_distance_cache() -> DistanceCache
+    DistanceCache.invalidate(node_ids=None, metric=None), .purge(), .stats()
+
+CLI:
+    python -m app.services.distance_cache stats
+    python -m app.services.distance_cache lookup sea 51.95,4.14 1.26,103.84
+    python -m app.services.distance_cache purge
+    python -m app.services.distance_cache clear [--metric road] [--node port:12]
+"""
+import argparse
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from app.services.utils import haversine_km_np
+
+DISTANCE_CACHE_DB = os.environ.get(
+    "DISTANCE_CACHE_DB", os.path.join(os.path.dirname(__file__), "..", "..", "data", "distance_cache.sqlite3"))
+DISTANCE_CACHE_SIZE = int(os.environ.get("DISTANCE_CACHE_SIZE", "200000"))
+
+# metric -> (symmetric, unit)
+METRICS = {
+    "great_circle": (True, "km"),
+    "sea": (True, "nm"),
+    "road": (False, "km"),
+    "rail": (False, "km"),
+}
+
+# coordinates are compared at this precision (~0.1 m); point ids are rounded to 1 m
+GEOMETRY_DECIMALS = 6
+POINT_ID_DECIMALS = 5
+# SQLite bound parameters per IN (...) list
+SQL_CHUNK = 400
+
+NAN = float("nan")
+
+
+def point_id(lat: float, lon: float) -> str:
+    return f"pt:{lat:.{POINT_ID_DECIMALS}f},{lon:.{POINT_ID_DECIMALS}f}"
+
+
+def node_ids(nodes) -> List[str]:
+    """Cache ids of a NodeStore's rows: "kind:id" for DB nodes, point_id for virtual ones."""
+    lat, lon = nodes.lat.tolist(), nodes.lon.tolist()
+    return [nodes.node_id(i) if nodes.obj_id[i] >= 0 else point_id(lat[i], lon[i]) for i in range(len(nodes))]
+
+
+# ---- metrics ---------------------------------------------------------------------------------
+
+def _network(metric: str):
+    if metric == "road":
+        from app.services.road_network import get_road_network
+        return get_road_network()
+    from app.services.rail_network import get_rail_network
+    return get_rail_network()
+
+
+def _version(metric: str) -> str:
+    """Version of what a metric is computed on; entries of another version are stale."""
+    if metric == "great_circle":
+        return "haversine"
+    if metric == "sea":
+        from app.services.sea_routing import SEA_LANES_PATH
+        try:
+            return f"lanes@{os.stat(SEA_LANES_PATH).st_mtime:.0f}"
+        except OSError:
+            return "lanes@none"
+    network = _network(metric)
+    return f"{metric}@{network.ch.meta['built_at']}" if network is not None else f"{metric}@none"
+
+
+def _compute(metric: str, from_points, to_points) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """(values, hours or None) from every from-point to every to-point."""
+    if metric == "great_circle":
+        a = np.asarray(from_points, dtype=np.float64).reshape(-1, 2)
+        b = np.asarray(to_points, dtype=np.float64).reshape(-1, 2)
+        return haversine_km_np(a[:, 0, None], a[:, 1, None], b[None, :, 0], b[None, :, 1]), None
+    if metric == "sea":
+        from app.services.sea_routing import get_sea_router
+        return get_sea_router().distance_matrix_nm(list(from_points), list(to_points)), None
+    network = _network(metric)
+    if network is None:
+        inf = np.full((len(from_points), len(to_points)), math.inf)
+        return inf, inf.copy()
+    return network.matrix(list(from_points), list(to_points))
+
+
+# ---- cache -----------------------------------------------------------------------------------
+
+def _geometry(a: Tuple[float, float], b: Tuple[float, float]) -> Tuple[float, float, float, float]:
+    return (round(float(a[0]), GEOMETRY_DECIMALS), round(float(a[1]), GEOMETRY_DECIMALS),
+            round(float(b[0]), GEOMETRY_DECIMALS), round(float(b[1]), GEOMETRY_DECIMALS))
+
+
+class DistanceCache:
+    """In-process LRU in front of an optional SQLite table shared across processes."""
+
+    def __init__(self, path: Optional[str] = DISTANCE_CACHE_DB, size: int = DISTANCE_CACHE_SIZE):
+        self.path = path or None
+        self.size = size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {m: {"lookups": 0, "memory_hits": 0, "disk_hits": 0, "computed": 0} for m in METRICS}
+        self.conn = None
+        if self.path:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # autocommit; writes batch into explicit transactions
+            self.conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            with self._lock:
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS pair_distance (
+                        metric TEXT NOT NULL,
+                        a TEXT NOT NULL,
+                        b TEXT NOT NULL,
+                        value REAL NOT NULL,
+                        hours REAL,
+                        lat_a REAL NOT NULL,
+                        lon_a REAL NOT NULL,
+                        lat_b REAL NOT NULL,
+                        lon_b REAL NOT NULL,
+                        version TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        PRIMARY KEY (metric, a, b)
+                    ) WITHOUT ROWID""")
+
+    def _key(self, metric: str, a_id: str, a, b_id: str, b):
+        """(cache key, geometry, swapped): symmetric metrics store the pair once, smaller id first."""
+        if METRICS[metric][0] and b_id < a_id:
+            return (metric, b_id, a_id), _geometry(b, a), True
+        return (metric, a_id, b_id), _geometry(a, b), False
+
+    def _remember(self, key, entry):
+        # caller holds the lock
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, metric: str, keys) -> Dict[tuple, tuple]:
+        """Disk entries of the given keys: {key: (value, hours, geometry, version)}."""
+        if self.conn is None or not keys:
+            return {}
+        by_a: Dict[str, set] = {}
+        for _, a, b in keys:
+            by_a.setdefault(a, set()).add(b)
+        a_ids = sorted(by_a)
+        b_ids = sorted(set().union(*by_a.values()))
+        found = {}
+        with self._lock:
+            for i in range(0, len(a_ids), SQL_CHUNK):
+                a_chunk = a_ids[i:i + SQL_CHUNK]
+                for j in range(0, len(b_ids), SQL_CHUNK):
+                    b_chunk = b_ids[j:j + SQL_CHUNK]
+                    rows = self.conn.execute(
+                        "SELECT a, b, value, hours, lat_a, lon_a, lat_b, lon_b, version FROM pair_distance "
+                        f"WHERE metric = ? AND a IN ({','.join('?' * len(a_chunk))}) "
+                        f"AND b IN ({','.join('?' * len(b_chunk))})",
+                        [metric] + a_chunk + b_chunk).fetchall()
+                    for a, b, value, hours, lat_a, lon_a, lat_b, lon_b, version in rows:
+                        if b in by_a[a]:
+                            found[(metric, a, b)] = (value, NAN if hours is None else hours,
+                                                     (lat_a, lon_a, lat_b, lon_b), version)
+        return found
+
+    def _write_disk(self, rows: List[tuple]):
+        if self.conn is None or not rows:
+            return
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO pair_distance "
+                    "(metric, a, b, value, hours, lat_a, lon_a, lat_b, lon_b, version, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def matrix(self, metric: str, from_ids: List[str], from_points, to_ids: List[str], to_points,
+               compute: Callable = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        (values, hours) from every from-node to every to-node; hours is None for metrics without
+        times. Misses are computed together, one block over the rows and columns that have any.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown distance metric {metric!r}; expected one of {', '.join(METRICS)}")
+        F, T = len(from_ids), len(to_ids)
+        timed = not METRICS[metric][0]
+        values = np.full((F, T), math.inf)
+        hours = np.full((F, T), NAN) if timed else None
+        version = _version(metric)
+        pairs = {}
+        missing = []
+        with self._lock:
+            for i in range(F):
+                for j in range(T):
+                    key, geometry, _ = self._key(metric, from_ids[i], from_points[i], to_ids[j], to_points[j])
+                    pairs[(i, j)] = (key, geometry)
+                    hit = self._memory.get(key)
+                    if hit is not None and hit[2] == geometry and hit[3] == version:
+                        self._memory.move_to_end(key)
+                        values[i, j] = hit[0]
+                        if timed:
+                            hours[i, j] = hit[1]
+                    else:
+                        missing.append((i, j))
+            self._counts[metric]["lookups"] += F * T
+            self._counts[metric]["memory_hits"] += F * T - len(missing)
+
+        if missing:
+            disk = self._read_disk(metric, {pairs[p][0] for p in missing})
+            still = []
+            disk_hits = 0
+            with self._lock:
+                for i, j in missing:
+                    key, geometry = pairs[(i, j)]
+                    hit = disk.get(key)
+                    if hit is not None and hit[2] == geometry and hit[3] == version:
+                        self._remember(key, hit)
+                        values[i, j] = hit[0]
+                        if timed:
+                            hours[i, j] = hit[1]
+                        disk_hits += 1
+                    else:
+                        still.append((i, j))
+                self._counts[metric]["disk_hits"] += disk_hits
+                self._counts[metric]["computed"] += len(still)
+            missing = still
+
+        if missing:
+            rows = sorted({i for i, _ in missing})
+            cols = sorted({j for _, j in missing})
+            block, block_hours = (compute or (lambda a, b: _compute(metric, a, b)))(
+                [from_points[i] for i in rows], [to_points[j] for j in cols])
+            row_at = {i: n for n, i in enumerate(rows)}
+            col_at = {j: n for n, j in enumerate(cols)}
+            now = time.time()
+            out = {}
+            with self._lock:
+                for i, j in missing:
+                    value = float(block[row_at[i], col_at[j]])
+                    h = float(block_hours[row_at[i], col_at[j]]) if timed else NAN
+                    values[i, j] = value
+                    if timed:
+                        hours[i, j] = h
+                    key, geometry = pairs[(i, j)]
+                    self._remember(key, (value, h, geometry, version))
+                    out[key] = (*key, value, None if math.isnan(h) else h, *geometry, version, now)
+            self._write_disk(list(out.values()))
+        return values, hours
+
+    def distance(self, metric: str, a_id: str, a, b_id: str, b) -> Tuple[float, float]:
+        """(value, hours or nan) of one pair."""
+        values, hours = self.matrix(metric, [a_id], [a], [b_id], [b])
+        return float(values[0, 0]), float(hours[0, 0]) if hours is not None else NAN
+
+    def invalidate(self, node_ids: Iterable[str] = None, metric: str = None) -> int:
+        """Drop the entries of some nodes (all nodes if None) for one metric (all if None); disk rows deleted."""
+        ids = set(node_ids) if node_ids is not None else None
+        with self._lock:
+            for key in [k for k in self._memory
+                        if (metric is None or k[0] == metric) and (ids is None or k[1] in ids or k[2] in ids)]:
+                del self._memory[key]
+            if self.conn is None:
+                return 0
+            where, params = [], []
+            if metric is not None:
+                where.append("metric = ?")
+                params.append(metric)
+            deleted = 0
+            if ids is None:
+                sql = "DELETE FROM pair_distance" + (" WHERE " + " AND ".join(where) if where else "")
+                deleted = self.conn.execute(sql, params).rowcount
+            else:
+                ordered = sorted(ids)
+                for i in range(0, len(ordered), SQL_CHUNK):
+                    chunk = ordered[i:i + SQL_CHUNK]
+                    marks = ",".join("?" * len(chunk))
+                    sql = " AND ".join(where + [f"(a IN ({marks}) OR b IN ({marks}))"])
+                    deleted += self.conn.execute(f"DELETE FROM pair_distance WHERE {sql}",
+                                                 params + chunk + chunk).rowcount
+            return deleted
+
+    def purge(self) -> int:
+        """Delete disk entries routed on an older version of their metric's network."""
+        if self.conn is None:
+            return 0
+        deleted = 0
+        for metric in METRICS:
+            with self._lock:
+                deleted += self.conn.execute("DELETE FROM pair_distance WHERE metric = ? AND version != ?",
+                                             (metric, _version(metric))).rowcount
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit counts and rates per metric since process start, plus tier sizes."""
+        with self._lock:
+            counts = {m: dict(c) for m, c in self._counts.items()}
+            memory = len(self._memory)
+            disk = dict(self.conn.execute("SELECT metric, COUNT(*) FROM pair_distance GROUP BY metric").fetchall()) \
+                if self.conn is not None else {}
+        for metric, c in counts.items():
+            c["hit_rate"] = round((c["memory_hits"] + c["disk_hits"]) / c["lookups"], 4) if c["lookups"] else None
+            c["disk_entries"] = disk.get(metric, 0)
+        return {"memory_entries": memory, "memory_size": self.size, "disk_path": self.path, "metrics": counts}
+
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def get_distance_cache() -> DistanceCache:
+    """The process-wide cache (opened on first use)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DistanceCache()
+        return _cache
+
+
+def cached_matrix(metric: str, from_ids: List[str], from_points, to_ids: List[str], to_points,
+                  compute: Callable = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    return get_distance_cache().matrix(metric, from_ids, from_points, to_ids, to_points, compute)
+
+
+def cached_distance(metric: str, a_id: str, a, b_id: str, b) -> Tuple[float, float]:
+    return get_distance_cache().distance(metric, a_id, a, b_id, b)
+
+
+def _point(text: str) -> Tuple[float, float]:
+    lat, lon = text.split(",")
+    return float(lat), float(lon)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared node-pair distance cache")
+    sub = parser.add_subparsers(dest="cmd")
+    sub.add_parser("stats", help="entries per metric on disk")
+    p_lookup = sub.add_parser("lookup", help="look up (or compute) one pair, timed")
+    p_lookup.add_argument("metric", choices=sorted(METRICS))
+    p_lookup.add_argument("origin", help="lat,lon")
+    p_lookup.add_argument("destination", help="lat,lon")
+    sub.add_parser("purge", help="delete entries of rebuilt networks")
+    p_clear = sub.add_parser("clear", help="delete entries")
+    p_clear.add_argument("--metric", choices=sorted(METRICS), default=None)
+    p_clear.add_argument("--node", action="append", default=None, help="node id (repeatable), e.g. port:12")
+    args = parser.parse_args()
+
+    cache = get_distance_cache()
+    if args.cmd == "stats":
+        stats = cache.stats()
+        print(f"{stats['disk_path']}:")
+        for metric, c in stats["metrics"].items():
+            print(f"  {metric:<13} {c['disk_entries']} pairs ({METRICS[metric][1]})")
+    elif args.cmd == "lookup":
+        a, b = _point(args.origin), _point(args.destination)
+        for attempt in ("first", "again"):
+            t0 = time.perf_counter()
+            value, hours = cache.distance(args.metric, point_id(*a), a, point_id(*b), b)
+            ms = (time.perf_counter() - t0) * 1000.0
+            print(f"{attempt}: {value:.1f} {METRICS[args.metric][1]}"
+                  + ("" if math.isnan(hours) else f", {hours:.2f} h") + f" ({ms:.2f} ms)")
+        c = cache.stats()["metrics"][args.metric]
+        print(f"memory hits {c['memory_hits']}, disk hits {c['disk_hits']}, computed {c['computed']}")
+    elif args.cmd == "purge":
+        print(f"deleted {cache.purge()} stale entries")
+    elif args.cmd == "clear":
+        print(f"deleted {cache.invalidate(args.node, args.metric)} entries")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Precomputed, memory-mapped node-to-node distance matrices.
+
+Planning requests used to recompute pairwise distances between candidate nodes on every call.
+The node tables change rarely, so an offline build writes one dense float32 matrix per kind to
+an `.npy` file plus a JSON index (node id -> row). Every uvicorn worker maps the same file with
+np.load(mmap_mode="r"): the OS page cache holds a single copy and lookups copy nothing but the
+requested block.
+
+Kinds:
+    port_sea            sea-lane nm between ports (see sea_routing.py); replaces the per-worker PortSeaTable build
+    airport             great-circle km between airports
+    rail_terminal       track km between rail terminals (stations of kind rail_terminal, see rail_network.py)
+    rail_terminal_time  train hours between rail terminals
+Rail kinds need the rail network; they are rebuilt in full when the network was rebuilt, and pairs
+the network does not connect are stored as inf.
+
+Rebuilds are incremental: rows of nodes whose coordinates are unchanged are copied from the
+previous matrix and only new or moved nodes are computed. Each build writes a new matrix file
+and swaps the index in atomically, so workers that still map the old file keep working and pick
+up the new one on their next lookup.
+
+Files live in DISTANCE_MATRIX_DIR (default data/distance_matrix):
+    <kind>_index.json          {"kind", "unit", "matrix": file name, "ids", "lat", "lon", "built_at", "network"}
+    <kind>.<token>.npy         (N, N) float32
+
+API:
+    build_matrix(kind, db=None, full=False) -> DistanceMatrix
+    update_after_import(kind)                # incremental rebuild, only if the matrix exists
+    get_distance_matrix(kind) -> DistanceMatrix | None
+    DistanceMatrix.submatrix(ids), .distance(a, b), .covers(ids, lat, lon)
+
+CLI:
+    python -m app.services.distance_matrix build --kind port_sea --kind airport [--full]
+    python -m app.services.distance_matrix build --kind rail_terminal --kind rail_terminal_time
+    python -m app.services.distance_matrix info
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from geoalchemy2.shape import to_shape
+from app.models_orm import Port, Airport, Station
+from app.services.node_store import node_query
+from app.services.utils import haversine_km_np
+
+DISTANCE_MATRIX_DIR = os.environ.get(
+    "DISTANCE_MATRIX_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "data", "distance_matrix"),
+)
+
+# kind -> (ORM model, unit, node_store kind of its rows)
+KINDS = {
+    "port_sea": (Port, "nm", "port"),
+    "airport": (Airport, "km", "airport"),
+    "rail_terminal": (Station, "km", "rail_terminal"),
+    "rail_terminal_time": (Station, "h", "rail_terminal"),
+}
+RAIL_KINDS = ("rail_terminal", "rail_terminal_time")
+
+# rows computed per chunk while building (bounds temporary memory to CHUNK_ROWS * N floats)
+CHUNK_ROWS = 512
+
+
+class DistanceMatrix:
+    """Read-only view over a mapped matrix and its id index."""
+
+    def __init__(self, kind: str, unit: str, ids: List[int], matrix: np.ndarray, path: str,
+                 lat: Optional[List[float]] = None, lon: Optional[List[float]] = None):
+        self.kind = kind
+        self.unit = unit
+        self.ids = ids
+        self.index = {nid: row for row, nid in enumerate(ids)}
+        self.matrix = matrix
+        self.path = path
+        self.lat = None if lat is None else np.asarray(lat, dtype=np.float64)
+        self.lon = None if lon is None else np.asarray(lon, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def covers(self, ids, lat=None, lon=None) -> bool:
+        """
+        True if every id has a row. With positions, the rows must also have been built at these
+        positions (an index without positions, from an older build, then never covers).
+        """
+        if not all(i in self.index for i in ids):
+            return False
+        if lat is None or lon is None:
+            return True
+        if self.lat is None or self.lon is None:
+            return False
+        rows = np.array([self.index[i] for i in ids], dtype=np.int64)
+        return (np.allclose(self.lat[rows], lat, rtol=0.0, atol=1e-9)
+                and np.allclose(self.lon[rows], lon, rtol=0.0, atol=1e-9))
+
+    def matches(self, ids: List[int], lat, lon) -> bool:
+        """True if the matrix was built for exactly these nodes at these positions (in this order)."""
+        if self.lat is None or self.lon is None or list(ids) != list(self.ids):
+            return False
+        return (np.allclose(self.lat, lat, rtol=0.0, atol=1e-9)
+                and np.allclose(self.lon, lon, rtol=0.0, atol=1e-9))
+
+    def distance(self, a: int, b: int) -> float:
+        return float(self.matrix[self.index[a], self.index[b]])
+
+    def submatrix(self, ids: List[int]) -> np.ndarray:
+        """Distances between the given ids, as a float64 array in the given order."""
+        rows = np.array([self.index[i] for i in ids], dtype=np.int64)
+        return self.matrix[np.ix_(rows, rows)].astype(np.float64)
+
+
+def _index_path(kind: str) -> str:
+    return os.path.join(DISTANCE_MATRIX_DIR, f"{kind}_index.json")
+
+
+def _read_index(kind: str) -> Optional[Dict]:
+    try:
+        with open(_index_path(kind), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _load_nodes(db, kind: str) -> Tuple[List[int], np.ndarray, np.ndarray]:
+    model, _, node_kind = KINDS[kind]
+    ids, lat, lon = [], [], []
+    for r in node_query(db, node_kind, model).order_by(model.id).all():
+        shp = to_shape(r.geom)
+        ids.append(r.id)
+        lat.append(shp.y)
+        lon.append(shp.x)
+    return ids, np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+
+
+def _compute_rows(kind: str, lat_r, lon_r, lat, lon) -> np.ndarray:
+    """Distances from the row points to all points, in the kind's unit."""
+    if kind == "port_sea":
+        from app.services.sea_routing import get_sea_router
+        return get_sea_router().distance_matrix_nm(list(zip(lat_r, lon_r)), list(zip(lat, lon)))
+    if kind in RAIL_KINDS:
+        km, hours = _rail_network().matrix(list(zip(lat_r, lon_r)), list(zip(lat, lon)))
+        return hours if kind == "rail_terminal_time" else km
+    return haversine_km_np(lat_r[:, None], lon_r[:, None], lat[None, :], lon[None, :])
+
+
+def _rail_network():
+    from app.services.rail_network import get_rail_network
+    network = get_rail_network()
+    if network is None:
+        raise ValueError("No rail network; build it first (python -m app.services.rail_network build --osm ...)")
+    return network
+
+
+def _network_stamp(kind: str) -> Optional[str]:
+    """Build time of the network a kind is routed on; rows of another network cannot be reused."""
+    if kind in RAIL_KINDS:
+        return str(_rail_network().ch.meta["built_at"])
+    return None
+
+
+def build_matrix(kind: str, db=None, full: bool = False) -> "DistanceMatrix":
+    """
+    Build (or incrementally update) the matrix for `kind` from the current DB contents.
+    full=True ignores the previous matrix and recomputes every row.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown matrix kind {kind!r}; expected one of {sorted(KINDS)}")
+    close_db = db is None
+    if db is None:
+        from app.db import get_db
+        db = next(get_db())
+    try:
+        ids, lat, lon = _load_nodes(db, kind)
+    finally:
+        if close_db:
+            db.close()
+
+    os.makedirs(DISTANCE_MATRIX_DIR, exist_ok=True)
+    t0 = time.perf_counter()
+    n = len(ids)
+
+    # reuse rows of nodes that kept their coordinates
+    old = _read_index(kind)
+    old_rows = {}
+    old_matrix = None
+    stamp = _network_stamp(kind)
+    if old is not None and not full and old.get("network") == stamp:
+        old_path = os.path.join(DISTANCE_MATRIX_DIR, old["matrix"])
+        if os.path.exists(old_path):
+            old_matrix = np.load(old_path, mmap_mode="r")
+            old_pos = {nid: (row, la, lo) for row, (nid, la, lo) in enumerate(zip(old["ids"], old["lat"], old["lon"]))}
+            for row, nid in enumerate(ids):
+                prev = old_pos.get(nid)
+                if prev is not None and prev[1] == lat[row] and prev[2] == lon[row]:
+                    old_rows[row] = prev[0]
+
+    name = f"{kind}.{uuid.uuid4().hex[:12]}.npy"
+    path = os.path.join(DISTANCE_MATRIX_DIR, name)
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n, n))
+
+    kept = np.array(sorted(old_rows), dtype=np.int64)
+    fresh = np.array([r for r in range(n) if r not in old_rows], dtype=np.int64)
+    if kept.size:
+        src = np.array([old_rows[r] for r in kept], dtype=np.int64)
+        for start in range(0, kept.size, CHUNK_ROWS):
+            block = slice(start, start + CHUNK_ROWS)
+            out[kept[block, None], kept[None, :]] = old_matrix[src[block, None], src[None, :]]
+    # new/moved nodes: fill their rows and, by symmetry, their columns
+    for start in range(0, fresh.size, CHUNK_ROWS):
+        rows = fresh[start:start + CHUNK_ROWS]
+        block = _compute_rows(kind, lat[rows], lon[rows], lat, lon).astype(np.float32)
+        out[rows, :] = block
+        out[:, rows] = block.T
+    out.flush()
+    del out
+    old_matrix = None
+
+    index = {
+        "kind": kind,
+        "unit": KINDS[kind][1],
+        "matrix": name,
+        "ids": ids,
+        "lat": lat.tolist(),
+        "lon": lon.tolist(),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "network": stamp,
+    }
+    tmp = _index_path(kind) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, _index_path(kind))
+
+    # mapped pages of the old file stay valid for workers still holding it (POSIX unlink semantics)
+    if old is not None and old["matrix"] != name:
+        try:
+            os.remove(os.path.join(DISTANCE_MATRIX_DIR, old["matrix"]))
+        except OSError:
+            pass
+
+    print(f"[distance_matrix] {kind}: {n} nodes, {fresh.size} rows computed, {kept.size} reused "
+          f"in {time.perf_counter() - t0:.1f}s -> {path}")
+    return _open(kind)
+
+
+def update_after_import(kind: str):
+    """Incrementally refresh an existing matrix after an import; no-op if none was built yet."""
+    if _read_index(kind) is None:
+        return None
+    return build_matrix(kind)
+
+
+def _open(kind: str) -> Optional[DistanceMatrix]:
+    index = _read_index(kind)
+    if index is None:
+        return None
+    path = os.path.join(DISTANCE_MATRIX_DIR, index["matrix"])
+    try:
+        matrix = np.load(path, mmap_mode="r")
+    except OSError:
+        return None
+    return DistanceMatrix(kind, index["unit"], index["ids"], matrix, path,
+                          index.get("lat"), index.get("lon"))
+
+
+_lock = threading.Lock()
+_opened: Dict[str, Tuple[float, Optional[DistanceMatrix]]] = {}
+
+
+def get_distance_matrix(kind: str) -> Optional[DistanceMatrix]:
+    """Mapped matrix for `kind`, reopened when a rebuild swapped the index; None if not built."""
+    try:
+        mtime = os.stat(_index_path(kind)).st_mtime
+    except OSError:
+        return None
+    with _lock:
+        cached = _opened.get(kind)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, _open(kind))
+            _opened[kind] = cached
+        return cached[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build memory-mapped distance matrices")
+    sub = parser.add_subparsers(dest="cmd")
+    p_build = sub.add_parser("build")
+    p_build.add_argument("--kind", action="append", choices=sorted(KINDS),
+                         help="repeatable; defaults to port_sea")
+    p_build.add_argument("--full", action="store_true", help="recompute every row")
+    sub.add_parser("info")
+
+    args = parser.parse_args()
+    if args.cmd == "build":
+        for kind in args.kind or ["port_sea"]:
+            build_matrix(kind, full=args.full)
+    elif args.cmd == "info":
+        for kind in sorted(KINDS):
+            index = _read_index(kind)
+            if index is None:
+                print(f"{kind}: not built")
+                continue
+            n = len(index["ids"])
+            print(f"{kind}: {n} nodes, {n * n * 4 / 1e6:.1f} MB ({index['unit']}), built {index['built_at']}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+"""
+Asynchronous planning jobs: a pluggable broker plus a pool of worker processes.
+
+POST /jobs/plan enqueues a PlanRequest and returns a job id at once; GET /jobs/{id} reports its
+status and, when done, the PlanResponse. Plans run in separate worker processes, so heavy or
+batch planning neither holds an API threadpool slot nor competes with request handlers for the
+GIL.
+
+Jobs:
+- priority: higher runs first (ties in submission order).
+- timeout_s: per attempt; the worker process running an overdue job is killed and replaced.
+- max_retries: failed or timed-out attempts are retried with exponential backoff
+  (RETRY_BACKOFF_S * 2**(attempt - 1)) before the job is marked failed.
+- status: queued -> running -> done | failed (back to queued between retries).
+
+Brokers (JOBS_BROKER):
+- "sqlite" (default): a SQLite file (JOBS_DB, default data/jobs.sqlite3) in WAL mode. Claims take
+  a write lock, so several API processes and standalone workers on one machine can share it. A
+  running job whose lease (timeout + LEASE_GRACE_S) expires, e.g. because its worker died, is
+  handed out again as a failed attempt.
+- "memory": in-process queue; only useful with the embedded pool (JOBS_WORKERS > 0).
+- "package.module:factory": any callable returning a Broker (subclass) instance.
+
+Worker pool: a supervisor thread keeps `workers` long-lived child processes (spawned, not forked,
+so they start from a clean interpreter), hands each one job at a time and enforces timeouts. The
+API starts one at startup when JOBS_WORKERS > 0 (default 2); set JOBS_WORKERS=0 and run the CLI
+instead to keep planning entirely out of the API processes.
+
+Job kinds map to "module:function" handlers (JOB_HANDLERS) taking the JSON payload and returning
+a JSON-serialisable result; the pool sends the handler path with each job and children import it
+by name.
+
+API:
+    get_broker() -> Broker
+    submit_job(kind, payload, priority=0, timeout_s=300, max_retries=1) -> job id
+    get_job(job_id) -> dict | None
+    start_worker_pool(workers) / stop_worker_pool()
+
+CLI:
+    python -m app.services.jobs worker --workers 4
+    python -m app.services.jobs stats
+"""
+import argparse
+import heapq
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from multiprocessing.connection import wait
+from typing import Any, Dict, Optional
+
+JOBS_BROKER = os.environ.get("JOBS_BROKER", "sqlite")
+JOBS_DB = os.environ.get(
+    "JOBS_DB",
+    os.path.join(os.path.dirname(__file__), "..", "..", "data", "jobs.sqlite3"),
+)
+
+RETRY_BACKOFF_S = 5.0
+LEASE_GRACE_S = 60.0
+POLL_S = 0.5
+
+JOB_HANDLERS = {
+    "plan": "app.services.jobs:run_plan_job",
+}
+
+Job = namedtuple("Job", ["id", "kind", "payload", "timeout_s", "attempts", "max_retries"])
+
+
+def run_plan_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Handler for "plan" jobs: payload is a PlanRequest body, the result a PlanResponse."""
+    from app.models import PlanRequest
+    from app.services.optimizer import build_plan_payload
+    return build_plan_payload(PlanRequest(**payload))
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts)) if ts else None
+
+
+def _retry_delay(attempts: int) -> float:
+    return RETRY_BACKOFF_S * 2 ** max(0, attempts - 1)
+
+
+class Broker(ABC):
+    """Queue interface used by the API and the worker pool."""
+
+    @abstractmethod
+    def enqueue(self, kind: str, payload: Dict[str, Any], priority: int, timeout_s: float,
+                max_retries: int) -> str:
+        ...
+
+    @abstractmethod
+    def claim(self) -> Optional[Job]:
+        """Next ready job (marked running), or None."""
+
+    @abstractmethod
+    def complete(self, job: Job, result: Any):
+        ...
+
+    @abstractmethod
+    def fail(self, job: Job, error: str):
+        """Record a failed attempt: requeue with backoff while retries remain, else mark failed."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        ...
+
+
+class SQLiteBroker(Broker):
+    def __init__(self, path: str = JOBS_DB):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # autocommit mode; transactions are explicit (BEGIN IMMEDIATE for claims)
+        self.conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_retries INTEGER NOT NULL DEFAULT 0,
+                    timeout_s REAL NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    run_after REAL NOT NULL DEFAULT 0,
+                    lease_until REAL
+                )""")
+            # ready jobs in claim order
+            self.conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_ready ON jobs (status, priority DESC, created_at)")
+
+    def enqueue(self, kind, payload, priority=0, timeout_s=300.0, max_retries=1):
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, kind, payload, priority, status, max_retries, timeout_s, created_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), int(priority), int(max_retries), float(timeout_s), time.time()),
+            )
+        return job_id
+
+    def claim(self):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # a running job past its lease lost its worker: count it as a failed attempt
+                for job_id, attempts, max_retries in self.conn.execute(
+                        "SELECT id, attempts, max_retries FROM jobs WHERE status = 'running' AND lease_until < ?",
+                        (now,)).fetchall():
+                    if attempts <= max_retries:
+                        self.conn.execute("UPDATE jobs SET status = 'queued', run_after = ?, error = ? WHERE id = ?",
+                                          (now + _retry_delay(attempts), "worker lost", job_id))
+                    else:
+                        self.conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                                          (now, "worker lost", job_id))
+                row = self.conn.execute(
+                    "SELECT id, kind, payload, timeout_s, attempts, max_retries FROM jobs "
+                    "WHERE status = 'queued' AND run_after <= ? ORDER BY priority DESC, created_at LIMIT 1",
+                    (now,)).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_until = ? "
+                        "WHERE id = ?", (now, now + row[3] + LEASE_GRACE_S, row[0]))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), row[3], row[4] + 1, row[5])
+
+    def complete(self, job, result):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ?, lease_until = NULL "
+                "WHERE id = ?", (json.dumps(result, default=str), time.time(), job.id))
+
+    def fail(self, job, error):
+        now = time.time()
+        with self.lock:
+            if job.attempts <= job.max_retries:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, run_after = ?, lease_until = NULL WHERE id = ?",
+                    (error, now + _retry_delay(job.attempts), job.id))
+            else:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                    (error, now, job.id))
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, kind, status, priority, attempts, max_retries, timeout_s, result, error, "
+                "created_at, started_at, finished_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0], "kind": row[1], "status": row[2], "priority": row[3], "attempts": row[4],
+            "max_retries": row[5], "timeout_s": row[6], "result": json.loads(row[7]) if row[7] else None,
+            "error": row[8], "created_at": _iso(row[9]), "started_at": _iso(row[10]), "finished_at": _iso(row[11]),
+        }
+
+    def stats(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class MemoryBroker(Broker):
+    """In-process broker; jobs live only as long as the process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.ready = []  # heap of (-priority, seq, job id)
+        self.seq = 0
+
+    def _push(self, job_id):
+        self.seq += 1
+        heapq.heappush(self.ready, (-self.jobs[job_id]["priority"], self.seq, job_id))
+
+    def enqueue(self, kind, payload, priority=0, timeout_s=300.0, max_retries=1):
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = {
+                "job_id": job_id, "kind": kind, "payload": payload, "status": "queued", "priority": int(priority),
+                "attempts": 0, "max_retries": int(max_retries), "timeout_s": float(timeout_s), "result": None,
+                "error": None, "created_at": time.time(), "started_at": None, "finished_at": None, "run_after": 0.0,
+            }
+            self._push(job_id)
+        return job_id
+
+    def claim(self):
+        now = time.time()
+        with self.lock:
+            waiting = []
+            job = None
+            while self.ready:
+                entry = heapq.heappop(self.ready)
+                j = self.jobs[entry[2]]
+                if j["run_after"] > now:
+                    waiting.append(entry)
+                    continue
+                j.update(status="running", attempts=j["attempts"] + 1, started_at=now)
+                job = Job(j["job_id"], j["kind"], j["payload"], j["timeout_s"], j["attempts"], j["max_retries"])
+                break
+            for entry in waiting:
+                heapq.heappush(self.ready, entry)
+            return job
+
+    def complete(self, job, result):
+        with self.lock:
+            self.jobs[job.id].update(status="done", result=result, error=None, finished_at=time.time())
+
+    def fail(self, job, error):
+        now = time.time()
+        with self.lock:
+            j = self.jobs[job.id]
+            if job.attempts <= job.max_retries:
+                j.update(status="queued", error=error, run_after=now + _retry_delay(job.attempts))
+                self._push(job.id)
+            else:
+                j.update(status="failed", error=error, finished_at=now)
+
+    def get(self, job_id):
+        with self.lock:
+            j = self.jobs.get(job_id)
+            if j is None:
+                return None
+            out = {k: v for k, v in j.items() if k not in ("payload", "run_after")}
+        for k in ("created_at", "started_at", "finished_at"):
+            out[k] = _iso(out[k])
+        return out
+
+    def stats(self):
+        with self.lock:
+            out = {}
+            for j in self.jobs.values():
+                out[j["status"]] = out.get(j["status"], 0) + 1
+            return out
+
+
+def _load(path: str):
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> Broker:
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            if JOBS_BROKER == "sqlite":
+                _broker = SQLiteBroker(JOBS_DB)
+            elif JOBS_BROKER == "memory":
+                _broker = MemoryBroker()
+            else:
+                _broker = _load(JOBS_BROKER)()
+        return _broker
+
+
+def submit_job(kind: str, payload: Dict[str, Any], priority: int = 0, timeout_s: float = 300.0,
+               max_retries: int = 1) -> str:
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}; expected one of {sorted(JOB_HANDLERS)}")
+    return get_broker().enqueue(kind, payload, priority, timeout_s, max_retries)
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return get_broker().get(job_id)
+
+
+# ---- worker pool -------------------------------------------------------------------------
+
+def _child_main(conn):
+    # runs in a worker process: one (handler path, payload) at a time until told to stop (None)
+    handlers = {}
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        path, payload = task
+        try:
+            if path not in handlers:
+                handlers[path] = _load(path)
+            conn.send(("ok", handlers[path](payload)))
+        except Exception as e:
+            print(f"[jobs] {path} failed: {traceback.format_exc()}")
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Slot:
+    """One worker process and the job it is running (if any)."""
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_child_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.job = None
+        self.deadline = None
+
+
+class WorkerPool:
+    def __init__(self, broker: Broker, workers: int = 2, poll_s: float = POLL_S):
+        self.broker = broker
+        self.workers = max(1, int(workers))
+        self.poll_s = poll_s
+        self.ctx = multiprocessing.get_context("spawn")
+        self.slots = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="jobs-supervisor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+    def run(self):
+        self.slots = [_Slot(self.ctx) for _ in range(self.workers)]
+        print(f"[jobs] worker pool started with {self.workers} processes")
+        try:
+            while not self._stop.is_set():
+                self._dispatch()
+                busy = [s.conn for s in self.slots if s.job is not None]
+                ready = wait(busy, timeout=self.poll_s) if busy else []
+                if not busy:
+                    self._stop.wait(self.poll_s)
+                for slot in self.slots:
+                    if slot.job is not None and slot.conn in ready:
+                        self._collect(slot)
+                self._enforce_timeouts()
+        finally:
+            for slot in self.slots:
+                try:
+                    slot.conn.send(None)
+                except (OSError, EOFError):
+                    pass
+                slot.process.join(timeout=1.0)
+                if slot.process.is_alive():
+                    slot.process.kill()
+
+    def _dispatch(self):
+        for slot in self.slots:
+            if slot.job is not None:
+                continue
+            job = self.broker.claim()
+            if job is None:
+                return
+            slot.job = job
+            slot.deadline = time.monotonic() + job.timeout_s
+            slot.conn.send((JOB_HANDLERS[job.kind], job.payload))
+
+    def _collect(self, slot):
+        job = slot.job
+        try:
+            status, value = slot.conn.recv()
+        except (EOFError, OSError):
+            # the process died (e.g. out of memory); replace it
+            status, value = "error", f"worker process exited with code {slot.process.exitcode}"
+            self._replace(slot)
+        if status == "ok":
+            self.broker.complete(job, value)
+        else:
+            self.broker.fail(job, value)
+        slot.job = None
+
+    def _enforce_timeouts(self):
+        now = time.monotonic()
+        for slot in self.slots:
+            if slot.job is not None and now > slot.deadline:
+                job = slot.job
+                self._replace(slot)
+                slot.job = None
+                self.broker.fail(job, f"timed out after {job.timeout_s:g} s")
+
+    def _replace(self, slot):
+        slot.process.kill()
+        slot.process.join(timeout=1.0)
+        fresh = _Slot(self.ctx)
+        slot.conn, slot.process = fresh.conn, fresh.process
+
+
+_pool = None
+
+
+def start_worker_pool(workers: int):
+    """Start the embedded pool (once per process)."""
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool(get_broker(), workers)
+        _pool.start()
+    return _pool
+
+
+def stop_worker_pool():
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Planning job workers")
+    sub = parser.add_subparsers(dest="cmd")
+    p_worker = sub.add_parser("worker", help="run a worker pool in the foreground")
+    p_worker.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    sub.add_parser("stats", help="job counts by status")
+
+    args = parser.parse_args()
+    if args.cmd == "worker":
+        pool = WorkerPool(get_broker(), args.workers)
+        try:
+            pool.run()
+        except KeyboardInterrupt:
+            pass
+    elif args.cmd == "stats":
+        print(json.dumps(get_broker().stats(), indent=2))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
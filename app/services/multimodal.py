@@ -0,0 +1,254 @@
+"""
+Multi-modal hub network: picks the best mix of ocean, rail, road and air through transfer hubs.
+
+Graph layout (one node per (hub, mode)):
+- ocean layer: ports; air layer: airports; rail layer: stations of kind 'rail_terminal'.
+- road layer: every hub, so trucks provide pre-/on-carriage and short direct hops.
+- line-haul edges connect each node to its k nearest same-layer nodes within the mode's range.
+- transfer edges connect a hub's mode node with its own road node and with the mode nodes of
+  co-located hubs (within CO_LOCATION_KM); they carry handling time and cost.
+
+Edge weights are a generalized cost per tonne: USD/t plus VALUE_OF_TIME_USD_PER_T_HOUR * hours.
+Because every term scales with tonnage the best path does not depend on cargo size, so one
+contraction hierarchy (see contraction.py) serves all requests. The hierarchy is built lazily
+and cached per process until the port, airport or rail terminal node store (node_store.py) is
+reloaded with different rows.
+
+Ocean hops use sea-lane distances (sea_routing.py); other modes use great-circle distances times
+a per-mode circuity factor.
+
+API:
+    get_network(db) -> MultiModalNetwork
+    network.route(origin, destination) -> dict with segments, mode_split_km, hours, usd_per_t
+"""
+import threading
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from geoalchemy2.shape import to_shape
+from app.models_orm import Port, Airport, Station
+from app.services.contraction import ContractionHierarchy, INF
+from app.services.node_store import get_node_store
+from app.services.sea_routing import get_sea_router
+from app.services.utils import haversine_km_np, KM_PER_NM
+
+# per-mode line-haul parameters (USD per tonne-km are indicative averages)
+MODE_PARAMS = {
+    "ocean": {"speed_kmh": 14.0 * 1.852, "usd_per_tkm": 0.004, "circuity": 1.15, "k": 8, "max_km": 20000.0},
+    "rail": {"speed_kmh": 40.0, "usd_per_tkm": 0.03, "circuity": 1.2, "k": 6, "max_km": 1500.0},
+    "road": {"speed_kmh": 70.0, "usd_per_tkm": 0.09, "circuity": 1.25, "k": 8, "max_km": 800.0},
+    "air": {"speed_kmh": 800.0, "usd_per_tkm": 0.9, "circuity": 1.05, "k": 8, "max_km": 9000.0},
+}
+
+# handling at a transfer into/out of a hub's line-haul mode
+HUB_HANDLING = {
+    "port": {"mode": "ocean", "hours": 24.0, "usd_per_t": 12.0},
+    "airport": {"mode": "air", "hours": 4.0, "usd_per_t": 60.0},
+    "rail_terminal": {"mode": "rail", "hours": 8.0, "usd_per_t": 8.0},
+}
+
+CO_LOCATION_KM = 25.0
+VALUE_OF_TIME_USD_PER_T_HOUR = 0.5
+# origin/destination connect by road to this many nearby hubs
+ACCESS_K = 6
+
+_cache_lock = threading.Lock()
+_cached_network = None
+_cached_signature = None
+
+
+def _generalized(usd: float, hours: float) -> float:
+    return usd + VALUE_OF_TIME_USD_PER_T_HOUR * hours
+
+
+def _line_haul(mode: str, km_direct: float) -> Tuple[float, float, float]:
+    """(km, hours, usd_per_t) for a line-haul hop given its great-circle length."""
+    p = MODE_PARAMS[mode]
+    km = km_direct * p["circuity"]
+    return km, km / p["speed_kmh"], km * p["usd_per_tkm"]
+
+
+def _knn(lat: np.ndarray, lon: np.ndarray, k: int, max_km: float, chunk: int = 512):
+    """Yield (i, j, km) for the k nearest neighbours j of every point i within max_km."""
+    n = len(lat)
+    if n < 2:
+        return
+    k = min(k, n - 1)
+    for start in range(0, n, chunk):
+        stop = min(n, start + chunk)
+        d = haversine_km_np(lat[start:stop, None], lon[start:stop, None], lat[None, :], lon[None, :])
+        d[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        nearest = np.argpartition(d, k - 1, axis=1)[:, :k]
+        for row, cols in enumerate(nearest):
+            for j in cols:
+                km = d[row, j]
+                if km <= max_km:
+                    yield start + row, int(j), float(km)
+
+
+class MultiModalNetwork:
+    def __init__(self, hubs: List[Dict[str, Any]]):
+        self.hubs = hubs
+        # node -> (hub index, mode)
+        self.node_hub: List[int] = []
+        self.node_mode: List[str] = []
+        self.road_node: List[int] = []
+        self.mode_node: List[int] = []
+        for h_idx, hub in enumerate(hubs):
+            self.road_node.append(len(self.node_hub))
+            self.node_hub.append(h_idx)
+            self.node_mode.append("road")
+            self.mode_node.append(len(self.node_hub))
+            self.node_hub.append(h_idx)
+            self.node_mode.append(HUB_HANDLING[hub["kind"]]["mode"])
+        self.hub_lat = np.array([h["lat"] for h in hubs], dtype=np.float64)
+        self.hub_lon = np.array([h["lon"] for h in hubs], dtype=np.float64)
+        # (u, v) -> (mode, km, hours, usd_per_t); mode 'transfer' for handling edges
+        self.edge_info: Dict[Tuple[int, int], Tuple[str, float, float, float]] = {}
+        edges = []
+
+        def add(u, v, mode, km, hours, usd):
+            w = _generalized(usd, hours)
+            old = self.edge_info.get((u, v))
+            if old is not None and _generalized(old[3], old[2]) <= w:
+                return
+            self.edge_info[(u, v)] = (mode, km, hours, usd)
+            edges.append((u, v, w))
+
+        # line-haul layers
+        for mode in MODE_PARAMS:
+            members = [h for h in range(len(hubs)) if mode == "road" or self.node_mode[self.mode_node[h]] == mode]
+            if not members:
+                continue
+            idx = np.array(members)
+            p = MODE_PARAMS[mode]
+            sea_nm = None
+            if mode == "ocean":
+                sea_nm = get_sea_router().distance_matrix_nm(list(zip(self.hub_lat[idx], self.hub_lon[idx])))
+            for i, j, km_direct in _knn(self.hub_lat[idx], self.hub_lon[idx], p["k"], p["max_km"]):
+                a, b = members[i], members[j]
+                u = self.road_node[a] if mode == "road" else self.mode_node[a]
+                v = self.road_node[b] if mode == "road" else self.mode_node[b]
+                if sea_nm is not None:
+                    # ships follow sea lanes; the circuity factor only applies to great circles
+                    if sea_nm[i, j] == INF:
+                        continue
+                    km, hours, usd = _line_haul(mode, sea_nm[i, j] * KM_PER_NM / p["circuity"])
+                else:
+                    km, hours, usd = _line_haul(mode, km_direct)
+                add(u, v, mode, km, hours, usd)
+                add(v, u, mode, km, hours, usd)
+
+        # transfers: hub mode <-> own road node, and between co-located hubs of different kinds
+        for h_idx, hub in enumerate(hubs):
+            handling = HUB_HANDLING[hub["kind"]]
+            add(self.road_node[h_idx], self.mode_node[h_idx], "transfer", 0.0, handling["hours"], handling["usd_per_t"])
+            add(self.mode_node[h_idx], self.road_node[h_idx], "transfer", 0.0, handling["hours"], handling["usd_per_t"])
+        for i, j, km in _knn(self.hub_lat, self.hub_lon, 8, CO_LOCATION_KM):
+            if hubs[i]["kind"] == hubs[j]["kind"]:
+                continue
+            a = HUB_HANDLING[hubs[i]["kind"]]
+            b = HUB_HANDLING[hubs[j]["kind"]]
+            hours = a["hours"] + b["hours"]
+            usd = a["usd_per_t"] + b["usd_per_t"]
+            add(self.mode_node[i], self.mode_node[j], "transfer", km, hours, usd)
+
+        self.ch = ContractionHierarchy(len(self.node_hub), edges)
+
+    def _access(self, lat: float, lon: float) -> Dict[int, Tuple[float, float, float, float]]:
+        """Road access from a free point to the nearest hubs: node -> (km, hours, usd, weight)."""
+        if not self.hubs:
+            return {}
+        d = haversine_km_np(lat, lon, self.hub_lat, self.hub_lon)
+        k = min(ACCESS_K, len(d))
+        out = {}
+        for h_idx in np.argpartition(d, k - 1)[:k]:
+            km, hours, usd = _line_haul("road", float(d[h_idx]))
+            out[self.road_node[int(h_idx)]] = (km, hours, usd, _generalized(usd, hours))
+        return out
+
+    def route(self, origin: Tuple[float, float], destination: Tuple[float, float]) -> Dict[str, Any]:
+        """Best multi-modal path between two (lat, lon) points, including road pre-/on-carriage."""
+        src = self._access(*origin)
+        dst = self._access(*destination)
+        cost, path = self.ch.query_multi({n: a[3] for n, a in src.items()},
+                                         {n: a[3] for n, a in dst.items()})
+
+        # door-to-door trucking competes when within road range
+        direct_km = float(haversine_km_np(origin[0], origin[1], destination[0], destination[1]))
+        road_km, road_hours, road_usd = _line_haul("road", direct_km)
+        if road_km <= MODE_PARAMS["road"]["max_km"] and _generalized(road_usd, road_hours) <= cost:
+            steps = [("road", origin, destination, "Origin", "Destination", road_km, road_hours, road_usd)]
+        elif cost == INF:
+            raise ValueError("No multi-modal route found between origin and destination")
+        else:
+            steps = []
+            first, last = path[0], path[-1]
+            steps.append(("road", origin, self._coord(first), "Origin", self._name(first)) + src[first][:3])
+            for u, v in zip(path, path[1:]):
+                mode, km, hours, usd = self.edge_info[(u, v)]
+                steps.append((mode, self._coord(u), self._coord(v), self._name(u), self._name(v), km, hours, usd))
+            steps.append(("road", self._coord(last), destination, self._name(last), "Destination") + dst[last][:3])
+
+        # merge consecutive hops of the same mode into segments
+        segments = []
+        for mode, a, b, a_name, b_name, km, hours, usd in steps:
+            if segments and segments[-1]["mode"] == mode and mode != "transfer":
+                seg = segments[-1]
+                seg["to"], seg["to_name"] = b, b_name
+                seg["distance_km"] += km
+                seg["time_hours"] += hours
+                seg["usd_per_t"] += usd
+            else:
+                segments.append({"mode": mode, "from": a, "to": b, "from_name": a_name, "to_name": b_name,
+                                 "distance_km": km, "time_hours": hours, "usd_per_t": usd})
+        # drop zero-length road stubs (point already at the hub)
+        segments = [s for s in segments if s["mode"] == "transfer" or s["distance_km"] > 1e-6]
+
+        mode_split = {}
+        for s in segments:
+            if s["mode"] != "transfer":
+                mode_split[s["mode"]] = mode_split.get(s["mode"], 0.0) + s["distance_km"]
+        return {
+            "segments": segments,
+            "mode_split_km": mode_split,
+            "time_hours": sum(s["time_hours"] for s in segments),
+            "usd_per_t": sum(s["usd_per_t"] for s in segments),
+        }
+
+    def _coord(self, node: int) -> Tuple[float, float]:
+        h = self.node_hub[node]
+        return float(self.hub_lat[h]), float(self.hub_lon[h])
+
+    def _name(self, node: int) -> str:
+        return self.hubs[self.node_hub[node]]["name"]
+
+
+def _load_hubs(db) -> List[Dict[str, Any]]:
+    hubs = []
+    for r in db.query(Port).all():
+        shp = to_shape(r.geom)
+        hubs.append({"kind": "port", "id": r.id, "name": r.name, "lat": shp.y, "lon": shp.x})
+    # only airports with an IATA code handle scheduled cargo
+    for r in db.query(Airport).filter(Airport.iata.isnot(None)).all():
+        shp = to_shape(r.geom)
+        hubs.append({"kind": "airport", "id": r.id, "name": r.name, "lat": shp.y, "lon": shp.x})
+    for r in db.query(Station).filter(Station.kind == "rail_terminal").all():
+        shp = to_shape(r.geom)
+        hubs.append({"kind": "rail_terminal", "id": r.id, "name": r.name or f"station:{r.id}", "lat": shp.y, "lon": shp.x})
+    return hubs
+
+
+def _signature(db):
+    # node store objects are replaced only when their rows change, so identity is the signature
+    return tuple(get_node_store(db, kind) for kind in ("port", "airport", "rail_terminal"))
+
+
+def get_network(db) -> MultiModalNetwork:
+    """Return the cached network, rebuilding it when hubs were added, removed, moved or renamed."""
+    global _cached_network, _cached_signature
+    signature = _signature(db)
+    with _cache_lock:
+        if _cached_network is None or any(a is not b for a, b in zip(signature, _cached_signature)):
+            _cached_network = MultiModalNetwork(_load_hubs(db))
+            _cached_signature = signature
+        return _cached_network
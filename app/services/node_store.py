@@ -0,0 +1,253 @@
+"""
+Struct-of-arrays store for ports, airports and stations.
+
+The refuel solver used to load every candidate node as a dict with string keys on every call and
+look up "price_per_unit"/"stop_fee" inside its hottest loop. A NodeStore keeps one contiguous
+array per field instead and is cached per kind, so a request only pays for the rows it uses:
+
+    obj_id  int64     DB primary key (-1 for virtual nodes such as an origin or destination)
+    lat     float64
+    lon     float64
+    price   float64   fuel price per unit (USD/ton for ports, USD/l otherwise); NaN = no price
+    fee     float64   port/landing/service fee; NaN = unknown
+    names   list      interned str
+
+Footprint: 5 * 8 = 40 bytes of array data per node, plus an 8-byte list slot for the name; the
+interned name strings are shared with every other reference to the same text. The dict layout it
+replaces took ~450 bytes per node (a dict with 8 keys, boxed floats and a formatted id string).
+
+NodeView is a thin __slots__ record (store + row) for the few places that want attribute access
+to one node; it copies nothing.
+
+Cached stores cost nothing per request: no query runs until they go stale. A store is reloaded
+- after touch_node_stores(), which the data importer and port seeding call once they commit: it
+  drops this process's stores and bumps the mtime of NODE_STORE_STAMP (default
+  data/node_store.stamp), which every other process checks with one os.stat per lookup;
+- after NODE_STORE_TTL_S seconds (default 300), for rows edited outside those paths.
+A reload that finds the same rows keeps the old store object, so caches keyed on it (the sea
+table, the hub network) survive TTL reloads.
+
+API:
+    get_node_store(db, kind) -> NodeStore          kind: "port" | "airport" | "station" | "rail_terminal"
+    node_query(db, kind, *entities) -> Query       (rows of a kind; rail_terminal is a subset of stations)
+    touch_node_stores()                            (after imports and price updates, in any process)
+    invalidate_node_store(kind=None)               (this process only)
+    NodeStore.view(i) -> NodeView, .nearest(lat, lon) -> row, .head(n), .prepend_virtual(points)
+    NodeStore.node_id(i), .records() -> list of dicts (listing endpoints)
+"""
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from geoalchemy2.shape import to_shape
+from app.models_orm import Port, Airport, Station
+from app.services.utils import haversine_km_np
+
+NODE_STORE_STAMP = os.environ.get(
+    "NODE_STORE_STAMP",
+    os.path.join(os.path.dirname(__file__), "..", "..", "data", "node_store.stamp"),
+)
+NODE_STORE_TTL_S = float(os.environ.get("NODE_STORE_TTL_S", "300"))
+
+# kind -> (ORM model, price column, fee column)
+KINDS = {
+    "port": (Port, "bunker_price", "port_fee"),
+    "airport": (Airport, "jet_price_per_l", "landing_fee"),
+    "station": (Station, "diesel_price_per_l", "service_fee"),
+    "rail_terminal": (Station, "diesel_price_per_l", "service_fee"),
+}
+# kinds that are a subset of their table: kind -> (column, value)
+SUBSETS = {"rail_terminal": ("kind", "rail_terminal")}
+
+
+def node_query(db, kind: str, *entities):
+    """db.query(*entities) restricted to the rows of `kind`."""
+    q = db.query(*entities)
+    if kind in SUBSETS:
+        column, value = SUBSETS[kind]
+        q = q.filter(getattr(KINDS[kind][0], column) == value)
+    return q
+
+
+def _nan(value) -> float:
+    return float("nan") if value is None else float(value)
+
+
+class NodeStore:
+    """Column arrays for the nodes of one kind; row i of every array is the same node."""
+
+    def __init__(self, kind: str, obj_id, lat, lon, price, fee, names: List[str],
+                 virtual_ids: Dict[int, str] = None):
+        self.kind = kind
+        self.obj_id = np.asarray(obj_id, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.price = np.asarray(price, dtype=np.float64)
+        self.fee = np.asarray(fee, dtype=np.float64)
+        self.names = [sys.intern(n) for n in names]
+        # row -> id string of virtual rows ("origin", "destination:1", ...)
+        self.virtual_ids = virtual_ids or {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def node_id(self, i: int) -> str:
+        if i in self.virtual_ids:
+            return self.virtual_ids[i]
+        return f"{self.kind}:{int(self.obj_id[i])}"
+
+    def node_type(self, i: int) -> str:
+        return self.node_id(i).split(":")[0] if i in self.virtual_ids else self.kind
+
+    def view(self, i: int) -> "NodeView":
+        return NodeView(self, i)
+
+    def head(self, n: int) -> "NodeStore":
+        """The first n rows (views of the same arrays)."""
+        return NodeStore(self.kind, self.obj_id[:n], self.lat[:n], self.lon[:n], self.price[:n], self.fee[:n],
+                         self.names[:n], {i: v for i, v in self.virtual_ids.items() if i < n})
+
+    def prepend_virtual(self, points: List[Tuple[str, str, float, float]]) -> "NodeStore":
+        """New store with virtual rows (node_id, name, lat, lon) in front; they sell no fuel."""
+        k = len(points)
+        return NodeStore(
+            self.kind,
+            np.concatenate([np.full(k, -1, dtype=np.int64), self.obj_id]),
+            np.concatenate([[p[2] for p in points], self.lat]),
+            np.concatenate([[p[3] for p in points], self.lon]),
+            np.concatenate([np.full(k, np.nan), self.price]),
+            np.concatenate([np.zeros(k), self.fee]),
+            [p[1] for p in points] + self.names,
+            {**{i: p[0] for i, p in enumerate(points)}, **{i + k: v for i, v in self.virtual_ids.items()}},
+        )
+
+    def same_rows(self, other: "NodeStore") -> bool:
+        """True if both stores hold the same nodes, positions, prices, fees and names."""
+        return (len(self) == len(other) and self.names == other.names
+                and np.array_equal(self.obj_id, other.obj_id)
+                and np.array_equal(self.lat, other.lat) and np.array_equal(self.lon, other.lon)
+                and np.array_equal(self.price, other.price, equal_nan=True)
+                and np.array_equal(self.fee, other.fee, equal_nan=True))
+
+    def nearest(self, lat: float, lon: float) -> Optional[int]:
+        """Row of the node closest (great circle) to a point; None if the store is empty."""
+        if not len(self):
+            return None
+        return int(np.argmin(haversine_km_np(lat, lon, self.lat, self.lon)))
+
+    def records(self) -> List[Dict]:
+        """One dict per node for JSON responses (missing prices/fees as None)."""
+        price = [None if p != p else p for p in self.price.tolist()]
+        fee = [None if f != f else f for f in self.fee.tolist()]
+        return [
+            {"id": oid, "name": name, "lon": lo, "lat": la, "price": pr, "fee": fe}
+            for oid, name, la, lo, pr, fe in zip(self.obj_id.tolist(), self.names, self.lat.tolist(),
+                                                 self.lon.tolist(), price, fee)
+        ]
+
+
+class NodeView:
+    """Attribute access to one row of a NodeStore."""
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store: NodeStore, row: int):
+        self.store = store
+        self.row = row
+
+    @property
+    def id(self) -> str:
+        return self.store.node_id(self.row)
+
+    @property
+    def obj_id(self) -> Optional[int]:
+        oid = int(self.store.obj_id[self.row])
+        return None if oid < 0 else oid
+
+    @property
+    def name(self) -> str:
+        return self.store.names[self.row]
+
+    @property
+    def lat(self) -> float:
+        return float(self.store.lat[self.row])
+
+    @property
+    def lon(self) -> float:
+        return float(self.store.lon[self.row])
+
+    @property
+    def price_per_unit(self) -> Optional[float]:
+        p = float(self.store.price[self.row])
+        return None if p != p else p
+
+    @property
+    def stop_fee(self) -> float:
+        f = float(self.store.fee[self.row])
+        return 0.0 if f != f else f
+
+    def __repr__(self):
+        return f"NodeView({self.id!r}, {self.name!r})"
+
+
+def _load(db, kind: str) -> NodeStore:
+    model, price_col, fee_col = KINDS[kind]
+    obj_id, lat, lon, price, fee, names = [], [], [], [], [], []
+    for r in node_query(db, kind, model).order_by(model.id).all():
+        shp = to_shape(r.geom)
+        obj_id.append(r.id)
+        lat.append(shp.y)
+        lon.append(shp.x)
+        price.append(_nan(getattr(r, price_col)))
+        fee.append(_nan(getattr(r, fee_col)))
+        names.append(r.name or f"{kind}:{r.id}")
+    return NodeStore(kind, obj_id, lat, lon, price, fee, names)
+
+
+def _stamp() -> Optional[float]:
+    try:
+        return os.stat(NODE_STORE_STAMP).st_mtime
+    except OSError:
+        return None
+
+
+_lock = threading.Lock()
+# kind -> (loaded at (monotonic), stamp mtime at load, store)
+_stores: Dict[str, Tuple[float, Optional[float], NodeStore]] = {}
+
+
+def invalidate_node_store(kind: Optional[str] = None):
+    """Drop this process's cached store for `kind` (all kinds if None)."""
+    with _lock:
+        if kind is None:
+            _stores.clear()
+        else:
+            _stores.pop(kind, None)
+
+
+def touch_node_stores():
+    """Mark node stores stale in every process: call after committing imports or price updates."""
+    os.makedirs(os.path.dirname(os.path.abspath(NODE_STORE_STAMP)), exist_ok=True)
+    with open(NODE_STORE_STAMP, "a"):
+        pass
+    os.utime(NODE_STORE_STAMP, None)
+    invalidate_node_store()
+
+
+def get_node_store(db, kind: str) -> NodeStore:
+    """Cached store for `kind`, reloaded after touch_node_stores() or NODE_STORE_TTL_S seconds."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown node kind {kind!r}; expected one of {sorted(KINDS)}")
+    stamp = _stamp()
+    now = time.monotonic()
+    with _lock:
+        cached = _stores.get(kind)
+        if cached is not None and cached[1] == stamp and now - cached[0] < NODE_STORE_TTL_S:
+            return cached[2]
+        store = _load(db, kind)
+        if cached is not None and cached[2].same_rows(store):
+            store = cached[2]
+        _stores[kind] = (now, stamp, store)
+        return store
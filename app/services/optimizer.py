@@ -1,5 +1,5 @@
 # Replace your existing build_plan in this file with this updated version.
-from app.models import PlanRequest, PlanResponse, FuelStop, LegDetail, Coordinate
+from app.models import PlanRequest, PlanResponse, FuelStop, LegDetail, Coordinate, SequenceSummary, ParetoOption, SpeedSegment, PlanConstraints, CarrierChoice, CarrierOption, VehicleGroup
 from app.services.paperwork import generate_paperwork
 from app.services.fuel_service import (
     get_bunker_price_for_port,
@@ -7,8 +7,7 @@ from app.services.fuel_service import (
     get_jet_price_for_region,
 )
 from app.db import get_db
-from app.models_orm import Port, Plan, PlanLeg
-from geoalchemy2.shape import to_shape
+from app.models_orm import Port
 from app.services.utils import haversine_km, haversine_nm_coords
 from math import ceil
 import uuid
@@ -17,19 +16,44 @@ import json
 import os
 
 # import refuel optimizer
-from app.services.refuel_optimizer import find_optimal_refuel_route
+from app.services.refuel_optimizer import find_optimal_itinerary_refuel_route, rank_carriers, carrier_payload_tonnes
+from app.services.sequencing import distance_matrix_km, optimize_sequence
+from app.services.multimodal import get_network
+from app.services.road_network import get_road_network
+from app.services.rail_network import get_rail_network
+from app.services.distance_cache import cached_distance, point_id
+from app.services.wind_field import leg_wind_factor
+from app.services.node_store import get_node_store
+from app.services.consumption import has_load_curve, leg_burn
+from app.services.plan_store import store_plan
 
 KM_PER_NM = 1.852
 HOURS_PER_DAY = 24.0
 
+CARRIERS_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "data", "carriers.json")
+
+
+_carriers_cache = (None, None)
+
+
+def load_carriers():
+    """carriers.json ({mode: {key: profile}}), re-read only when the file changes; None if missing."""
+    global _carriers_cache
+    try:
+        mtime = os.stat(CARRIERS_PATH).st_mtime
+    except OSError:
+        return None
+    if _carriers_cache[0] != mtime:
+        with open(CARRIERS_PATH, "r") as f:
+            _carriers_cache = (mtime, json.load(f))
+    return _carriers_cache[1]
+
 
 def load_carrier_profile(carrier_key: str):
     """Load a carrier model by its key."""
-    path = os.path.join(os.path.dirname(__file__), "..", "data", "carriers.json")
-    if not os.path.exists(path):
+    carriers = load_carriers()
+    if carriers is None:
         return None
-    with open(path, "r") as f:
-        carriers = json.load(f)
     for mode, models in carriers.items():
         if carrier_key in models:
             return models[carrier_key]
@@ -38,21 +62,46 @@ def load_carrier_profile(carrier_key: str):
 
 def find_nearest_port(db, lat: float, lon: float):
     """Find nearest port to a coordinate."""
-    ports = db.query(Port).all()
-    nearest = None
-    best_dist = float("inf")
-    for p in ports:
-        shp = to_shape(p.geom)
-        d = haversine_km(lat, lon, shp.y, shp.x)
-        if d < best_dist:
-            best_dist = d
-            nearest = p
-    return nearest
-
-
-def compute_leg_mode_info(mode: str, carrier: dict, a: Coordinate, b: Coordinate) -> dict:
+    store = get_node_store(db, "port")
+    row = store.nearest(lat, lon)
+    if row is None:
+        return None
+    return db.query(Port).get(int(store.obj_id[row]))
+
+
+def compute_leg_mode_info(mode: str, carrier: dict, a: Coordinate, b: Coordinate, payload_tonnes: float = None) -> dict:
     """Compute basic leg information: distance, time, fuel."""
-    dist_km = haversine_km(a.lat, a.lon, b.lat, b.lon)
+    pa, pb = (a.lat, a.lon), (b.lat, b.lon)
+    if mode == "ocean":
+        # ships follow sea lanes, not the great circle; pairs are shared across requests (distance_cache.py)
+        nm, _ = cached_distance("sea", point_id(*pa), pa, point_id(*pb), pb)
+        if nm == float("inf"):
+            nm = haversine_nm_coords(a.lat, a.lon, b.lat, b.lon)
+        return leg_info_for_distance(mode, carrier, nm * KM_PER_NM, payload_tonnes)
+    if mode in ("road", "rail"):
+        # trucks and trains follow the road/rail network when one is built (road_network.py,
+        # rail_network.py), at its speeds
+        network = get_road_network() if mode == "road" else get_rail_network()
+        if network is not None:
+            km, hours = cached_distance(mode, point_id(*pa), pa, point_id(*pb), pb)
+            if km < float("inf"):
+                info = leg_info_for_distance(mode, carrier, km, payload_tonnes)
+                info["time_hours"] = hours
+                return info
+    if mode == "air":
+        # upper-air winds stretch or shorten the flight (wind_field.py; 1.0 without a wind file)
+        return leg_info_for_distance(mode, carrier, haversine_km(a.lat, a.lon, b.lat, b.lon), payload_tonnes,
+                                     wind_factor=leg_wind_factor(carrier, a.lat, a.lon, b.lat, b.lon))
+    return leg_info_for_distance(mode, carrier, haversine_km(a.lat, a.lon, b.lat, b.lon), payload_tonnes)
+
+
+def leg_info_for_distance(mode: str, carrier: dict, dist_km: float, payload_tonnes: float = None,
+                          wind_factor: float = 1.0) -> dict:
+    """
+    Time and fuel for travelling dist_km with a carrier of the given mode. With a load_curve the
+    fuel follows the payload (None = fully loaded), leaving with just the fuel the leg needs.
+    wind_factor: air time in wind over time in still air; fuel scales with it.
+    """
     dist_nm = dist_km / KM_PER_NM
     
     if mode == "ocean":
@@ -63,8 +112,8 @@ def compute_leg_mode_info(mode: str, carrier: dict, a: Coordinate, b: Coordinate
     elif mode == "air":
         speed_kmh = carrier.get("cruise_speed_kmh", 800.0)
         consumption = carrier.get("consumption_l_per_km", 0.05)
-        time_hours = dist_km / speed_kmh
-        fuel_needed = dist_km * consumption
+        time_hours = dist_km / speed_kmh * wind_factor
+        fuel_needed = dist_km * consumption * wind_factor
     elif mode == "road":
         speed_kmh = carrier.get("cruise_speed_kmh", 70.0)
         consumption = carrier.get("consumption_l_per_km", 0.08)
@@ -80,7 +129,9 @@ def compute_leg_mode_info(mode: str, carrier: dict, a: Coordinate, b: Coordinate
         consumption = 0.1
         time_hours = dist_km / speed_kmh
         fuel_needed = dist_km * consumption
-    
+    if has_load_curve(carrier):
+        fuel_needed = float(leg_burn(carrier, mode, fuel_needed, payload_tonnes, fuel_needed))
+
     return {
         "distance_km": dist_km,
         "distance_nm": dist_nm,
@@ -91,39 +142,177 @@ def compute_leg_mode_info(mode: str, carrier: dict, a: Coordinate, b: Coordinate
 
 def iter_mode_first(model_type: str):
     """Iterate through models of a specific type."""
-    path = os.path.join(os.path.dirname(__file__), "..", "data", "carriers.json")
-    if not os.path.exists(path):
+    carriers = load_carriers()
+    if carriers is None:
         return
-    with open(path, "r") as f:
-        carriers = json.load(f)
     if model_type in carriers:
         for key in carriers[model_type]:
             yield key
 
 
-def build_plan(req: PlanRequest, carrier_profile: dict = None) -> PlanResponse:
-    db = next(get_db())
-    from app.services.ports_loader import seed_ports
+def default_carrier_for_mode(mode: str):
+    """First carrier profile listed for a mode in carriers.json (None if the mode has none)."""
+    key = next(iter_mode_first(model_type=mode), None)
+    return load_carrier_profile(key) if key else None
+
+
+TEU_UNITS = {"teu", "teus"}
+BARREL_UNITS = {"bbl", "bbls", "barrel", "barrels"}
+# average gross weight of a laden TEU, and a barrel of crude
+TONNES_PER_TEU = 14.0
+TONNES_PER_BARREL = 0.136
+
+
+def cargo_tonnes(quantity: float, unit: str) -> float:
+    """Convert a cargo quantity to metric tonnes (unknown units are taken as tonnes)."""
+    unit = (unit or "").strip().lower()
+    if unit in {"kg", "kgs", "kilogram", "kilograms"}:
+        return quantity / 1000.0
+    if unit in {"lb", "lbs", "pound", "pounds"}:
+        return quantity * 0.000453592
+    if unit in TEU_UNITS:
+        return quantity * TONNES_PER_TEU
+    if unit in BARREL_UNITS:
+        return quantity * TONNES_PER_BARREL
+    return quantity
+
+
+def carrier_key(carrier: dict):
+    """carriers.json key of a profile (None for profiles not from the file)."""
+    for models in (load_carriers() or {}).values():
+        for key, profile in models.items():
+            if profile == carrier:
+                return key
+    return None
+
+
+def carrier_capacity(carrier: dict, unit: str):
+    """Cargo one vehicle takes, in the cargo's unit (TEU, barrels or weight); None if the profile does not say."""
+    unit_l = (unit or "").strip().lower()
+    if unit_l in TEU_UNITS:
+        return carrier.get("teu_capacity")
+    if unit_l in BARREL_UNITS:
+        return carrier.get("bbl_capacity")
+    tonnes = carrier_payload_tonnes(carrier)
+    if tonnes is None:
+        return None
+    return tonnes / cargo_tonnes(1.0, unit)
+
+
+def vehicles_needed(carrier: dict, quantity: float, unit: str, split: bool = True):
+    """(vehicles of this carrier the cargo needs, reason); 0 vehicles if it cannot be carried."""
+    cap = carrier_capacity(carrier, unit)
+    if cap is None:
+        return 1, None
+    name = carrier.get("name", "carrier")
+    if cap <= 0:
+        return 0, f"{name} does not carry cargo measured in {unit}"
+    n = max(1, ceil(quantity / cap - 1e-9))
+    if n > 1 and not split:
+        return 0, f"Cargo ({quantity:g} {unit}) exceeds the capacity of {name} ({cap:g} {unit}) and split_shipments is off"
+    return n, None
+
+
+def plan_fleet(mode: str, carrier: dict, quantity: float, unit: str, split: bool = True, mix: bool = True):
+    """
+    Vehicles for a run: [{"carrier", "vehicles", "load"}]. Cargo over capacity fills as many
+    vehicles as needed; with mix=True a remainder goes on the smallest carrier model of the mode
+    that takes it, otherwise the load is spread evenly. Raises ValueError if it cannot be carried.
+    """
+    n, reason = vehicles_needed(carrier, quantity, unit, split)
+    if n == 0:
+        raise ValueError(reason)
+    if n == 1:
+        return [{"carrier": carrier, "vehicles": 1, "load": quantity}]
+    cap = carrier_capacity(carrier, unit)
+    full = int(quantity // cap)
+    rest = quantity - full * cap
+    if mix and rest > 1e-9 * quantity:
+        fits = []
+        for profile in (load_carriers() or {}).get(mode, {}).values():
+            c = carrier_capacity(profile, unit)
+            if profile != carrier and c and rest <= c < cap:
+                fits.append((c, profile))
+        if fits:
+            small = min(fits, key=lambda f: f[0])[1]
+            return [{"carrier": carrier, "vehicles": full, "load": cap},
+                    {"carrier": small, "vehicles": 1, "load": rest}]
+    return [{"carrier": carrier, "vehicles": n, "load": quantity / n}]
+
+
+def sequence_destinations(req: PlanRequest):
+    """Reorder req.destinations to shorten the tour; returns (destinations, SequenceSummary)."""
+    coords = [(req.origin.lat, req.origin.lon)] + [(d.coord.lat, d.coord.lon) for d in req.destinations]
+    result = optimize_sequence(
+        distance_matrix_km(coords),
+        fix_first=req.fix_first_stop,
+        fix_last=req.fix_last_stop,
+        time_budget_s=req.sequencing_time_budget_s,
+    )
+    order = [i - 1 for i in result["order"]]
+    given = result["given_cost"]
+    improvement = given - result["cost"]
+    summary = SequenceSummary(
+        order=order,
+        given_distance_km=round(given, 2),
+        optimized_distance_km=round(result["cost"], 2),
+        improvement_km=round(improvement, 2),
+        improvement_pct=round(100.0 * improvement / given, 2) if given > 0 else 0.0,
+    )
+    return [req.destinations[i] for i in order], summary
+
+
+def build_plan(req: PlanRequest, **kwargs) -> PlanResponse:
+    """build_plan_payload as a PlanResponse model, for Python callers that want attribute access."""
+    return PlanResponse(**build_plan_payload(req, **kwargs))
+
 
-    seed_ports(db)
+def build_plan_payload(req: PlanRequest, carrier_profile: dict = None, progress=None, db=None, seed: bool = True,
+                       store=None, price_overrides: dict = None) -> dict:
+    """
+    Plan a request and return the PlanResponse body as a plain dict, built once: legs and stops are
+    validated as models while planning, the response itself is not rebuilt (the API writes the
+    dict straight to JSON, see serialization.py).
+    progress: optional callable(event, data) told about each run before it is solved, solver
+    progress, and every fuel stop and leg as soon as it is known (see plan_stream.py).
+    db/seed/store let batch planning (batch_planning.py) reuse one session, seed ports once and
+    persist plans in bulk: store(db, req, response, stops) replaces plan_store.store_plan.
+    price_overrides: node id -> fuel price used by the refuel solves instead of the stored one
+    (price scenarios of price_risk.py).
+    """
+    if db is None:
+        db = next(get_db())
+
+    def emit(event, data):
+        if progress is not None:
+            progress(event, data)
+
+    if seed:
+        from app.services.ports_loader import seed_ports
+        seed_ports(db)
 
     # prepare nodes list as before
     destinations = req.destinations
+    sequence = None
+    if req.optimize_order and len(destinations) > 1:
+        destinations, sequence = sequence_destinations(req)
     nodes = []
     origin = Coordinate(lat=req.origin.lat, lon=req.origin.lon)
     nodes.append({"coord": origin, "mode": None, "name": "Origin"})
 
     for d in destinations:
-        nodes.append({"coord": d.coord, "mode": d.mode or req.transport_medium, "name": d.name or "Dest"})
+        nodes.append({"coord": d.coord, "mode": d.mode or req.transport_medium, "name": d.name or "Dest",
+                      "window": d.arrival_window})
+
+    # carrier_model="auto": every run picks among all carrier models of its mode (see rank_carriers)
+    auto_carrier = req.carrier_model == "auto"
 
     # prepare default carrier if not provided (existing logic)
-    if req.carrier_model:
+    if req.carrier_model and not auto_carrier:
         selected_carrier = load_carrier_profile(req.carrier_model)
     else:
         # auto-pick default for primary transport medium
-        path = os.path.join(os.path.dirname(__file__), "..", "data", "carriers.json")
-        with open(path, "r") as f:
-            carriers_all = json.load(f)
+        carriers_all = load_carriers()
         selected_carrier = None
         if req.transport_medium in carriers_all:
             first_key = next(iter(carriers_all[req.transport_medium]))
@@ -133,16 +322,8 @@ def build_plan(req: PlanRequest, carrier_profile: dict = None) -> PlanResponse:
             first_model = next(iter(carriers_all[first_cat]))
             selected_carrier = carriers_all[first_cat][first_model]
 
-    leg_details = []
-    total_distance_km = 0.0
-    total_distance_nm = 0.0
-    total_time_hours = 0.0
-    total_fuel_amount = 0.0
-    total_cost = 0.0
-    fuel_plan = []
-    stops = 0
-
-    # iterate legs; for each leg we compute basic metrics and, when supported, call precise refuel optimizer
+    # resolve mode and carrier for every leg up front so legs sharing a vehicle can be solved jointly
+    legs = []
     for idx in range(len(nodes) - 1):
         a = nodes[idx]["coord"]
         b = nodes[idx + 1]["coord"]
@@ -160,118 +341,320 @@ def build_plan(req: PlanRequest, carrier_profile: dict = None) -> PlanResponse:
                         carrier = candidate
             except Exception:
                 carrier = selected_carrier  # fallback
+        if auto_carrier and mode in {"ocean", "air", "road", "rail"}:
+            # chosen when the run is solved
+            carrier = None
+        legs.append({"a": a, "b": b, "mode": mode, "carrier": carrier, "window": nodes[idx + 1]["window"]})
 
-        # compute coarse leg info
-        info = compute_leg_mode_info(mode, carrier, a, b)
+    # consecutive legs with the same mode and carrier form one run, solved by a single joint refuel search
+    runs = []
+    for idx, leg in enumerate(legs):
+        if runs and runs[-1]["mode"] == leg["mode"] and runs[-1]["carrier"] == leg["carrier"]:
+            runs[-1]["legs"].append(idx)
+        else:
+            runs.append({"mode": leg["mode"], "carrier": leg["carrier"], "legs": [idx]})
 
-        # For modes supported by the refuel optimizer, call it to get precise refuel plan for this leg.
-        if mode in {"ocean", "air", "road", "rail"}:
-            # call refuel optimizer for this single leg
-            try:
-                # choose step_size heuristics by mode
-                if mode == "ocean":
-                    step_size = 1.0  # 1 ton increments
-                    fuel_unit = "tons"
-                elif mode == "air":
-                    step_size = 100.0  # liters resolution
-                    fuel_unit = "liters"
-                else:
-                    step_size = 50.0  # liters for road/rail
-                    fuel_unit = "liters"
+    objective = req.preferences or "cheapest"
+    if objective == "weighted" and req.time_value_usd_per_hour is None:
+        raise ValueError("preferences='weighted' requires time_value_usd_per_hour")
+    pareto_frontier = [] if objective == "pareto" else None
 
-                refuel_result = find_optimal_refuel_route(
-                    origin_coord=(a.lat, a.lon),
-                    dest_coord=(b.lat, b.lon),
-                    carrier_profile=carrier,
-                    mode=mode,
-                    fuel_unit=fuel_unit,
-                    step_size=step_size,
-                    reserve=0.1,
-                    max_nodes_considered=200
-                )
-                # Merge results: add fuel plan entries and leg(s)
-                if "fuel_plan" in refuel_result:
-                    # each entry has node, added_amount, price_per_unit, cost
-                    for entry in refuel_result["fuel_plan"]:
-                        # normalize keys for response model
-                        fuel_plan.append(FuelStop(
-                            port=entry.get("node"),
-                            amount_tons_or_liters=round(entry.get("added_amount"), 3),
-                            price_per_unit_usd=round(entry.get("price_per_unit"), 3),
-                            cost_usd=round(entry.get("cost"), 2)
-                        ))
-                        total_cost += float(entry.get("cost", 0.0))
-                # legs
-                if "legs" in refuel_result:
-                    for leg in refuel_result["legs"]:
-                        leg_details.append(LegDetail(
-                            from_coord=Coordinate(lat=a.lat, lon=a.lon),
-                            to_coord=Coordinate(lat=b.lat, lon=b.lon),
-                            mode=mode,
-                            distance_km=round(info["distance_km"], 2),
-                            distance_nm=round(info["distance_nm"], 2),
-                            time_hours=round(info["time_hours"], 2),
-                            fuel_needed=round(info["fuel_needed"], 3),
-                            fuel_unit=fuel_unit,
-                            port_fees_usd=0.0
-                        ))
-                        total_distance_km += info["distance_km"]
-                        total_distance_nm += info["distance_nm"]
-                        total_time_hours += info["time_hours"]
-                        total_fuel_amount += info["fuel_needed"]
-                else:
-                    # fallback: add coarse info
+    # plan constraints; the legacy arrival_deadline_hours is the same as max_total_hours
+    constraints = req.constraints or PlanConstraints()
+    deadlines = [h for h in (req.arrival_deadline_hours, constraints.max_total_hours) if h is not None]
+    deadline = min(deadlines) if deadlines else None
+    opening = constraints.port_opening_hours
+    opening = (opening.open_hour, opening.close_hour) if opening else None
+    opening_by_node = {k: (w.open_hour, w.close_hour) for k, w in constraints.port_opening_hours_by_port.items()}
+    speed_plan = [] if req.optimize_speed else None
+    fuel_saved_tons = 0.0
+    carrier_choices = [] if auto_carrier else None
+    fleet_groups = []
+    warnings = []
+    # a carrier pinned by the request carries everything; otherwise a remainder may go on a smaller model
+    mix_carriers = req.carrier_model in (None, "auto")
+
+    # one refuel solve per distinct (carrier, route, settings) in this plan: vehicles of a fleet share it
+    solve_memo = {}
+
+    def solve(profile, kwargs, load):
+        # load: cargo on each vehicle, in the request's unit
+        kwargs = dict(kwargs, payload_tonnes=cargo_tonnes(load, req.unit))
+        key = json.dumps([profile, {k: v for k, v in kwargs.items() if k != "progress"}], sort_keys=True, default=str)
+        if key not in solve_memo:
+            solve_memo[key] = find_optimal_itinerary_refuel_route(carrier_profile=profile, **kwargs)
+        return solve_memo[key]
+
+    leg_details = []
+    total_distance_km = 0.0
+    total_distance_nm = 0.0
+    total_time_hours = 0.0
+    total_fuel_amount = 0.0
+    total_cost = 0.0
+    fuel_plan = []
+    # where each fuel_plan entry was bought, for the typed plan_fuel_stops rows
+    stop_details = []
+
+    for run_idx, run in enumerate(runs):
+        mode = run["mode"]
+        carrier = run["carrier"]
+        auto_run = carrier is None
+        if auto_run:
+            # used for the coarse leg figures if no carrier can be ranked
+            carrier = default_carrier_for_mode(mode) or selected_carrier
+        fuel_unit = "tons" if mode == "ocean" else "liters"
+        emit("run", {"run_index": run_idx, "mode": mode, "legs": run["legs"]})
+
+        if mode == "multi-modal":
+            # best mix of modes through transfer hubs; costs are the network's all-in USD per tonne
+            network = get_network(db)
+            tonnes = cargo_tonnes(req.cargo_quantity, req.unit)
+            for i in run["legs"]:
+                a = legs[i]["a"]
+                b = legs[i]["b"]
+                route = network.route((a.lat, a.lon), (b.lat, b.lon))
+                handling_usd = 0.0
+                handling_hours = 0.0
+                for seg in route["segments"]:
+                    if seg["mode"] == "transfer":
+                        # handling is reported as a fee on the following line-haul segment
+                        handling_usd += seg["usd_per_t"] * tonnes
+                        handling_hours += seg["time_hours"]
+                        continue
+                    seg_carrier = default_carrier_for_mode(seg["mode"]) or carrier
+                    info = leg_info_for_distance(seg["mode"], seg_carrier, seg["distance_km"], tonnes)
+                    seg_unit = "tons" if seg["mode"] == "ocean" else "liters"
                     leg_details.append(LegDetail(
-                        from_coord=a,
-                        to_coord=b,
-                        mode=mode,
+                        from_coord=Coordinate(lat=seg["from"][0], lon=seg["from"][1]),
+                        to_coord=Coordinate(lat=seg["to"][0], lon=seg["to"][1]),
+                        mode=seg["mode"],
                         distance_km=round(info["distance_km"], 2),
                         distance_nm=round(info["distance_nm"], 2),
-                        time_hours=round(info["time_hours"], 2),
+                        time_hours=round(seg["time_hours"] + handling_hours, 2),
                         fuel_needed=round(info["fuel_needed"], 3),
-                        fuel_unit=fuel_unit,
-                        port_fees_usd=0.0
+                        fuel_unit=seg_unit,
+                        port_fees_usd=round(handling_usd, 2)
                     ))
+                    emit("leg", {"index": len(leg_details) - 1, "leg": leg_details[-1].dict()})
                     total_distance_km += info["distance_km"]
                     total_distance_nm += info["distance_nm"]
-                    total_time_hours += info["time_hours"]
+                    total_time_hours += seg["time_hours"] + handling_hours
                     total_fuel_amount += info["fuel_needed"]
+                    total_cost += seg["usd_per_t"] * tonnes + handling_usd
+                    handling_usd = 0.0
+                    handling_hours = 0.0
+                # hub routes are not time-constrained; check the windows on arrival
+                window = legs[i]["window"]
+                if window is not None:
+                    if window.latest_hours is not None and total_time_hours > window.latest_hours:
+                        raise ValueError(f"Multi-modal route reaches destination {i + 1} after its arrival window")
+                    total_time_hours = max(total_time_hours, window.earliest_hours)
+            continue
+
+        # For modes supported by the refuel optimizer, solve the refuel plan of the whole run at once.
+        refuel_result = None
+        refuel_warning = None
+        fleet = [{"carrier": carrier, "vehicles": 1, "load": req.cargo_quantity}]
+        if mode in {"ocean", "air", "road", "rail"}:
+            if not auto_run:
+                fleet = plan_fleet(mode, carrier, req.cargo_quantity, req.unit, req.split_shipments, mix_carriers)
+            # choose step_size heuristics by mode
+            if mode == "ocean":
+                step_size = 1.0  # 1 ton increments
+            elif mode == "air":
+                step_size = 100.0  # liters resolution
+            else:
+                step_size = 50.0  # liters for road/rail
+
+            # windows and the remaining stop budget are relative to where this run starts
+            offset = total_time_hours
+            windows = None
+            if any(legs[i]["window"] for i in run["legs"]):
+                windows = []
+                for i in run["legs"]:
+                    w = legs[i]["window"]
+                    if w is None:
+                        windows.append((0.0, None))
+                    else:
+                        windows.append((max(0.0, w.earliest_hours - offset),
+                                        None if w.latest_hours is None else w.latest_hours - offset))
+            max_stops = None
+            if constraints.max_refuel_stops is not None:
+                max_stops = max(0, constraints.max_refuel_stops - len(fuel_plan))
 
-            except Exception as e:
-                # if refuel optimizer fails, fallback to simple heuristics (previous logic)
-                leg_details.append(LegDetail(
-                    from_coord=a,
-                    to_coord=b,
+            first = legs[run["legs"][0]]["a"]
+            waypoints = [(first.lat, first.lon)] + [(legs[i]["b"].lat, legs[i]["b"].lon) for i in run["legs"]]
+            solve_kwargs = dict(
+                waypoints=waypoints,
+                mode=mode,
+                fuel_unit=fuel_unit,
+                step_size=step_size,
+                reserve=0.1,
+                max_nodes_considered=200,
+                # fuel on board only applies to the vehicle leaving the origin
+                initial_fuel=req.initial_fuel if run_idx == 0 else None,
+                objective=objective,
+                time_value_usd_per_hour=req.time_value_usd_per_hour or 0.0,
+                optimize_speed=req.optimize_speed,
+                # whatever the earlier runs left of the deadline
+                max_hours=(deadline - offset) if deadline is not None else None,
+                max_stops=max_stops,
+                arrival_windows=windows,
+                departure_hour=(constraints.departure_hour + offset) % 24.0,
+                port_opening_hours=opening,
+                port_opening_hours_by_node=opening_by_node,
+                progress=lambda p: emit("progress", {"run_index": run_idx, "mode": mode, **p}),
+                price_overrides=price_overrides
+            )
+            try:
+                if auto_run:
+                    choice = rank_carriers(
+                        carrier_profiles=(load_carriers() or {}).get(mode, {}),
+                        vehicles=lambda p: vehicles_needed(p, req.cargo_quantity, req.unit, req.split_shipments),
+                        cargo_tonnes=cargo_tonnes(req.cargo_quantity, req.unit),
+                        **solve_kwargs
+                    )
+                    carrier_choices.append(CarrierChoice(
+                        run_index=run_idx,
+                        mode=mode,
+                        carrier_model=choice["best"] or "",
+                        ranking=[CarrierOption(**o) for o in choice["ranking"]]
+                    ))
+                    if choice["best"] is None:
+                        refuel_result = {"error": "No carrier model can serve this run: " + "; ".join(
+                            f"{o['carrier_model']}: {o.get('reason')}" for o in choice["ranking"])}
+                    else:
+                        carrier = load_carrier_profile(choice["best"])
+                        refuel_result = choice["result"]
+                        fleet = plan_fleet(mode, carrier, req.cargo_quantity, req.unit, req.split_shipments,
+                                           mix_carriers)
+                        if len(fleet) > 1:
+                            # ranked with the cargo spread evenly; the main vehicles go full instead
+                            refuel_result = solve(carrier, solve_kwargs, fleet[0]["load"])
+                else:
+                    refuel_result = solve(carrier, solve_kwargs, fleet[0]["load"])
+                # a remainder vehicle of another model sails the same route; if it cannot, it becomes
+                # one more vehicle of the main carrier
+                fleet_results = [refuel_result]
+                for group in fleet[1:]:
+                    extra = solve(group["carrier"], solve_kwargs, group["load"])
+                    if "error" in extra:
+                        n = fleet[0]["vehicles"] + 1
+                        fleet = [{"carrier": carrier, "vehicles": n, "load": req.cargo_quantity / n}]
+                        refuel_result = solve(carrier, solve_kwargs, fleet[0]["load"])
+                        fleet_results = [refuel_result]
+                        break
+                    fleet_results.append(extra)
+            except ValueError as e:
+                refuel_result = {"error": f"Refuel optimizer failed: {e}"}
+            if "error" in refuel_result:
+                constrained = (deadline is not None or constraints.max_refuel_stops is not None or opening
+                               or opening_by_node or any(legs[i]["window"] for i in run["legs"]))
+                if constrained or auto_run:
+                    raise ValueError(refuel_result["error"])
+                # unconstrained: the run keeps the coarse leg figures, without refuelling stops; the
+                # response says so on the run's legs and in warnings
+                refuel_warning = f"run {run_idx} ({mode}) planned without refuelling stops: {refuel_result['error']}"
+                warnings.append(refuel_warning)
+                emit("warning", {"run_index": run_idx, "message": refuel_warning})
+                print(f"[optimizer] {refuel_warning}")
+            else:
+                # time spent at refuelling stops and waiting is not part of the coarse leg times below
+                total_time_hours += float(refuel_result.get("refuel_hours", 0.0))
+                total_time_hours += float(refuel_result.get("wait_hours", 0.0))
+                for option in refuel_result.get("pareto", []):
+                    pareto_frontier.append(ParetoOption(
+                        run_index=run_idx,
+                        mode=mode,
+                        total_cost_usd=option["total_cost"],
+                        total_time_hours=option["total_time_hours"],
+                        refuel_stops=[f["node"] for f in option["fuel_plan"]]
+                    ))
+                # each entry has node, added_amount, price_per_unit, cost (per vehicle)
+                for group, result in zip(fleet, fleet_results):
+                    n = group["vehicles"]
+                    for entry in result.get("fuel_plan", []):
+                        # normalize keys for response model
+                        fuel_plan.append(FuelStop(
+                            port=entry.get("node"),
+                            amount_tons_or_liters=round(n * entry.get("added_amount"), 3),
+                            price_per_unit_usd=round(entry.get("price_per_unit"), 3),
+                            cost_usd=round(n * entry.get("cost"), 2),
+                            vehicles=n
+                        ))
+                        stop_details.append({
+                            "run_index": run_idx,
+                            "node_id": entry.get("node_id"),
+                            "lat": entry.get("lat"),
+                            "lon": entry.get("lon"),
+                            "fuel_unit": fuel_unit,
+                            "wait_hours": entry.get("wait_hours"),
+                        })
+                        emit("fuel_stop", {"run_index": run_idx, "stop": fuel_plan[-1].dict()})
+                        total_cost += n * float(entry.get("cost", 0.0))
+                    fuel_saved_tons += n * float(result.get("fuel_saved_vs_service_speed", 0.0))
+                for seg in refuel_result.get("legs", []):
+                    if "speed_knots" in seg:
+                        speed_plan.append(SpeedSegment(
+                            from_name=seg["from"],
+                            to_name=seg["to"],
+                            distance_nm=seg["distance_nm"],
+                            speed_knots=seg["speed_knots"],
+                            time_hours=seg["time_hours"],
+                            fuel_tons=seg["fuel_used"]
+                        ))
+            for group in fleet:
+                fleet_groups.append(VehicleGroup(
+                    run_index=run_idx,
                     mode=mode,
-                    distance_km=round(info["distance_km"], 2),
-                    distance_nm=round(info["distance_nm"], 2),
-                    time_hours=round(info["time_hours"], 2),
-                    fuel_needed=round(info["fuel_needed"], 3),
-                    fuel_unit=("tons" if mode == "ocean" else "liters"),
-                    port_fees_usd=0.0
+                    carrier_model=carrier_key(group["carrier"]),
+                    name=group["carrier"].get("name"),
+                    vehicles=group["vehicles"],
+                    load_per_vehicle=round(group["load"], 3),
+                    unit=req.unit
                 ))
-                total_distance_km += info["distance_km"]
-                total_distance_nm += info["distance_nm"]
-                total_time_hours += info["time_hours"]
-                total_fuel_amount += info["fuel_needed"]
-        else:
-            # unsupported mode: add simple dimensions
+
+        # with speed optimisation the solver's per-leg time and fuel replace the service-speed figures
+        solved = {}
+        if req.optimize_speed and mode == "ocean" and refuel_result:
+            for seg in refuel_result.get("legs", []):
+                hours, fuel = solved.get(seg["leg_index"], (0.0, 0.0))
+                solved[seg["leg_index"]] = (hours + seg["time_hours"], fuel + seg["fuel_used"])
+
+        # coarse leg info for every itinerary leg of the run
+        for pos, i in enumerate(run["legs"]):
+            a = legs[i]["a"]
+            b = legs[i]["b"]
+            info = compute_leg_mode_info(mode, carrier, a, b, cargo_tonnes(fleet[0]["load"], req.unit))
+            if pos in solved:
+                info["time_hours"], info["fuel_needed"] = solved[pos]
+            # fuel of the whole fleet; its vehicles travel together, so time is per vehicle
+            info["fuel_needed"] = info["fuel_needed"] * fleet[0]["vehicles"] + sum(
+                compute_leg_mode_info(mode, g["carrier"], a, b, cargo_tonnes(g["load"], req.unit))["fuel_needed"]
+                * g["vehicles"] for g in fleet[1:])
             leg_details.append(LegDetail(
-                from_coord=a,
-                to_coord=b,
+                from_coord=Coordinate(lat=a.lat, lon=a.lon),
+                to_coord=Coordinate(lat=b.lat, lon=b.lon),
                 mode=mode,
                 distance_km=round(info["distance_km"], 2),
                 distance_nm=round(info["distance_nm"], 2),
                 time_hours=round(info["time_hours"], 2),
                 fuel_needed=round(info["fuel_needed"], 3),
-                fuel_unit=("tons" if mode == "ocean" else "liters"),
-                port_fees_usd=0.0
+                fuel_unit=fuel_unit,
+                port_fees_usd=0.0,
+                refuel_warning=refuel_warning
             ))
+            emit("leg", {"index": len(leg_details) - 1, "leg": leg_details[-1].dict()})
             total_distance_km += info["distance_km"]
             total_distance_nm += info["distance_nm"]
             total_time_hours += info["time_hours"]
             total_fuel_amount += info["fuel_needed"]
 
+    # distance travelled per mode (multi-modal legs report their hub-to-hub mix)
+    mode_split = {}
+    for ld in leg_details:
+        mode_split[ld.mode] = round(mode_split.get(ld.mode, 0.0) + ld.distance_km, 2)
+
     # simplistic risk score
     risk_score = min(100.0, 10.0 + 0.005 * total_distance_km + (20.0 if req.cargo_type.lower() in {"hazardous", "dangerous"} else 0.0))
 
@@ -291,18 +674,18 @@ def build_plan(req: PlanRequest, carrier_profile: dict = None) -> PlanResponse:
         "risk_score": round(risk_score, 2),
         "paperwork": paperwork,
         "leg_details": [ld.dict() for ld in leg_details],
+        "sequence": sequence.dict() if sequence else None,
+        "mode_split_km": mode_split,
+        "pareto_frontier": [p.dict() for p in pareto_frontier] if pareto_frontier is not None else None,
+        "speed_plan": [sp.dict() for sp in speed_plan] if speed_plan is not None else None,
+        "fuel_saved_vs_service_speed_tons": round(fuel_saved_tons, 3) if speed_plan is not None else None,
+        "carrier_choices": [c.dict() for c in carrier_choices] if carrier_choices is not None else None,
+        "fleet": ([g.dict() for g in fleet_groups]
+                  if any(g.vehicles > 1 for g in fleet_groups) or len(fleet_groups) > len(runs) else None),
+        "warnings": warnings or None,
     }
 
-    # persist plan
-    plan = Plan(route_id=route_id, request=json.loads(json.dumps(req.dict())), response=response_payload)
-    db.add(plan)
-    db.commit()
-    db.refresh(plan)
-
-    # persist legs
-    for idx, ld in enumerate(leg_details):
-        pl = PlanLeg(plan_id=plan.id, idx=idx, from_name=str(ld.from_coord.dict()), to_name=str(ld.to_coord.dict()), distance_nm=ld.distance_nm, time_hours=ld.time_hours, fuel_needed_tons=ld.fuel_needed if ld.fuel_unit == "tons" else None, extra=None)
-        db.add(pl)
-    db.commit()
+    # persist plan, typed legs and fuel stops
+    (store or store_plan)(db, req, response_payload, stop_details)
 
-    return PlanResponse(**response_payload)
\ No newline at end of file
+    return response_payload
\ No newline at end of file
@@ -0,0 +1,301 @@
+"""
+Storing plans and reading them back: build_plan, GET /plans/{route_id} and GET /plans.
+
+Storage layout (migrations/004_plans_compact.sql):
+    plans            summary columns (carrier, medium, cargo type, totals), request_blob and
+                     response_blob: the PlanRequest and PlanResponse as canonical JSON (sorted keys,
+                     no whitespace), zlib-compressed behind a one-byte format tag. Decoding gives
+                     back exactly the stored body, so the blobs are the copies used for replay; the
+                     old `request` and `response` JSON columns are only read for rows the backfill
+                     has not reached yet (request_blob: migrations/006_plans_request_blob.sql).
+    plan_legs        one typed row per LegDetail: mode, from/to POINT geometry, km, nm, hours,
+                     fuel with its unit (tons for ocean, liters otherwise), port fees
+    plan_fuel_stops  one row per FuelStop: node id, name, POINT geometry, amount and unit, price,
+                     cost, waiting time
+Analytics can query legs and stops directly (e.g. fuel bought per port and unit) without
+parsing JSON; the blob is ~40% of the JSON it replaces for a two-leg plan, less for longer ones.
+
+Stored plans never change, so single-plan reads go through a process-local LRU cache
+(PLAN_CACHE_SIZE entries, default 1024): the first read decodes the blob, later ones return it
+without touching the database. store_plan also puts fresh plans into the cache of the process
+that built them.
+
+Listing is keyset-paginated on (created_at, id), newest first: the cursor is the position of the
+last row returned, so each page is one index range scan however deep the client pages, and rows
+inserted meanwhile neither shift nor repeat entries. Filters (carrier_model, transport_medium and
+a created_at range) use the composite indexes of migrations/003_plans_history.sql. List rows are
+projected from the summary columns only; the blobs are never read.
+
+Existing rows are converted by `backfill` in id-ordered batches (one transaction each, so it can
+be stopped and resumed); run migrations/005_plans_drop_legacy.sql once it reports nothing left.
+
+API:
+    store_plan(db, req, response, stops) -> Plan    # stops: FuelStop extras (node id, lat/lon, unit, ...)
+    store_plans(db, [(req, response, stops), ...]) -> [Plan]
+    get_plan(db, route_id) -> response dict | None
+    get_plan_request(db, route_id) -> PlanRequest body | None
+    get_fuel_stops(db, route_id) -> [{"idx", "run_index", "node_id", "name", "amount", "fuel_unit",
+                                      "price_per_unit_usd", "cost_usd"}]
+    list_plans(db, limit=50, cursor=None, since=None, until=None, carrier_model=None,
+               transport_medium=None) -> {"items", "next_cursor"}
+    encode_blob(body) -> bytes, decode_blob(blob) -> dict      (request_blob and response_blob)
+    backfill(db, batch_size=500) -> plans converted
+
+CLI:
+    python -m app.services.plan_store backfill --batch-size 500
+"""
+import argparse
+import base64
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from geoalchemy2.elements import WKTElement
+from sqlalchemy import and_, null, or_, tuple_
+from app.models_orm import Plan, PlanLeg, PlanFuelStop
+from app.services.serialization import dumps, loads
+
+PLAN_CACHE_SIZE = int(os.environ.get("PLAN_CACHE_SIZE", "1024"))
+MAX_PAGE_SIZE = 500
+
+# first byte of response_blob
+FORMAT_JSON_ZLIB = 1
+
+# columns returned by list_plans, in order
+SUMMARY_COLUMNS = (
+    "route_id", "created_at", "carrier_model", "transport_medium", "cargo_type",
+    "total_cost_usd", "total_time_hours", "total_distance_km", "stops",
+)
+
+_lock = threading.Lock()
+_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+
+def remember_plan(route_id: str, response: Dict[str, Any]):
+    if PLAN_CACHE_SIZE <= 0:
+        return
+    with _lock:
+        _cache[route_id] = response
+        _cache.move_to_end(route_id)
+        while len(_cache) > PLAN_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def encode_blob(body: Dict[str, Any]) -> bytes:
+    return bytes([FORMAT_JSON_ZLIB]) + zlib.compress(dumps(body, sort_keys=True), 6)
+
+
+def decode_blob(blob: bytes) -> Dict[str, Any]:
+    blob = bytes(blob)
+    if not blob or blob[0] != FORMAT_JSON_ZLIB:
+        raise ValueError(f"Unknown plan blob format {blob[:1]!r}")
+    return loads(zlib.decompress(blob[1:]))
+
+
+def _point(lat, lon) -> Optional[WKTElement]:
+    if lat is None or lon is None:
+        return None
+    return WKTElement(f"POINT({lon} {lat})", srid=4326)
+
+
+def _typed_rows(plan_id: int, response: Dict[str, Any], stops: Optional[List[Dict[str, Any]]] = None):
+    """PlanLeg and PlanFuelStop rows for a response; stops[i] adds node id/position/unit to fuel_plan[i]."""
+    rows = []
+    for idx, ld in enumerate(response.get("leg_details") or []):
+        a, b = ld.get("from_coord") or {}, ld.get("to_coord") or {}
+        rows.append(PlanLeg(
+            plan_id=plan_id, idx=idx, mode=ld.get("mode"),
+            from_geom=_point(a.get("lat"), a.get("lon")), to_geom=_point(b.get("lat"), b.get("lon")),
+            distance_km=ld.get("distance_km"), distance_nm=ld.get("distance_nm"), time_hours=ld.get("time_hours"),
+            fuel_needed=ld.get("fuel_needed"), fuel_unit=ld.get("fuel_unit"), port_fees_usd=ld.get("port_fees_usd"),
+        ))
+    for idx, fs in enumerate(response.get("fuel_plan") or []):
+        extra = stops[idx] if stops and idx < len(stops) else {}
+        rows.append(PlanFuelStop(
+            plan_id=plan_id, idx=idx, run_index=extra.get("run_index"), node_id=extra.get("node_id"),
+            name=fs.get("port"), geom=_point(extra.get("lat"), extra.get("lon")),
+            # older plans did not record the unit; it follows the plan's total_fuel_unit
+            amount=fs.get("amount_tons_or_liters"), fuel_unit=extra.get("fuel_unit") or response.get("total_fuel_unit"),
+            price_per_unit_usd=fs.get("price_per_unit_usd"), cost_usd=fs.get("cost_usd"),
+            wait_hours=extra.get("wait_hours"),
+        ))
+    return rows
+
+
+def _plan_row(req, response: Dict[str, Any]) -> Plan:
+    return Plan(
+        route_id=response["route_id"],
+        request_blob=encode_blob(req.dict()),
+        response_blob=encode_blob(response),
+        carrier_model=req.carrier_model,
+        transport_medium=req.transport_medium,
+        cargo_type=req.cargo_type,
+        total_cost_usd=response["total_cost_usd"],
+        total_time_hours=response["total_time_hours"],
+        total_distance_km=response["total_distance_km"],
+        stops=response["stops"],
+    )
+
+
+def store_plan(db, req, response: Dict[str, Any], stops: Optional[List[Dict[str, Any]]] = None) -> Plan:
+    """Persist a built plan (summary columns, blob, typed legs and fuel stops) and cache it."""
+    return store_plans(db, [(req, response, stops)])[0]
+
+
+def store_plans(db, items) -> List[Plan]:
+    """Persist many (req, response, stops) at once: one flush for the plans, one commit for all rows."""
+    plans = [_plan_row(req, response) for req, response, _ in items]
+    db.add_all(plans)
+    db.flush()
+    rows = []
+    for plan, (_, response, stops) in zip(plans, items):
+        rows.extend(_typed_rows(plan.id, response, stops))
+    db.add_all(rows)
+    db.commit()
+    for plan, (_, response, _) in zip(plans, items):
+        remember_plan(plan.route_id, response)
+    return plans
+
+
+def get_plan(db, route_id: str) -> Optional[Dict[str, Any]]:
+    """Stored PlanResponse body for route_id (cached); None if unknown."""
+    with _lock:
+        cached = _cache.get(route_id)
+        if cached is not None:
+            _cache.move_to_end(route_id)
+            return cached
+    row = db.query(Plan.response_blob, Plan.response).filter(Plan.route_id == route_id).first()
+    if row is None:
+        return None
+    if row[0] is not None:
+        response = decode_blob(row[0])
+    elif row[1] is not None:
+        # not backfilled yet
+        response = row[1]
+    else:
+        return None
+    remember_plan(route_id, response)
+    return response
+
+
+def get_plan_request(db, route_id: str) -> Optional[Dict[str, Any]]:
+    row = db.query(Plan.request_blob, Plan.request).filter(Plan.route_id == route_id).first()
+    if row is None:
+        return None
+    # not backfilled yet: the request is still in the JSON column
+    return decode_blob(row[0]) if row[0] is not None else row[1]
+
+
+def get_fuel_stops(db, route_id: str) -> List[Dict[str, Any]]:
+    """Typed fuel stop rows of a plan, in plan order (empty for unknown or unconverted plans)."""
+    columns = ("idx", "run_index", "node_id", "name", "amount", "fuel_unit", "price_per_unit_usd", "cost_usd")
+    rows = (db.query(*[getattr(PlanFuelStop, c) for c in columns])
+            .join(Plan, Plan.id == PlanFuelStop.plan_id)
+            .filter(Plan.route_id == route_id)
+            .order_by(PlanFuelStop.idx).all())
+    return [dict(zip(columns, r)) for r in rows]
+
+
+def encode_cursor(created_at: datetime, plan_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{plan_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, plan_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(plan_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def list_plans(db, limit: int = 50, cursor: Optional[str] = None, since: Optional[datetime] = None,
+               until: Optional[datetime] = None, carrier_model: Optional[str] = None,
+               transport_medium: Optional[str] = None) -> Dict[str, Any]:
+    """One page of plan summaries, newest first; pass next_cursor back to get the next page."""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    columns = [getattr(Plan, c) for c in SUMMARY_COLUMNS]
+    q = db.query(Plan.id, *columns)
+    if carrier_model is not None:
+        q = q.filter(Plan.carrier_model == carrier_model)
+    if transport_medium is not None:
+        q = q.filter(Plan.transport_medium == transport_medium)
+    if since is not None:
+        q = q.filter(Plan.created_at >= since)
+    if until is not None:
+        q = q.filter(Plan.created_at < until)
+    if cursor:
+        created_at, plan_id = decode_cursor(cursor)
+        q = q.filter(tuple_(Plan.created_at, Plan.id) < tuple_(created_at, plan_id))
+    # one extra row tells whether another page exists
+    rows = q.order_by(Plan.created_at.desc(), Plan.id.desc()).limit(limit + 1).all()
+
+    items = [dict(zip(SUMMARY_COLUMNS, r[1:])) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def backfill(db, batch_size: int = 500) -> int:
+    """
+    Convert plans still stored as JSON: write the blobs (and typed rows for the response), drop
+    the JSON columns. Each batch is one transaction; rerunning continues where an interrupted
+    run stopped.
+    """
+    done = 0
+    last_id = 0
+    t0 = time.perf_counter()
+    legacy_response = and_(Plan.response_blob.is_(None), Plan.response.isnot(None))
+    legacy_request = and_(Plan.request_blob.is_(None), Plan.request.isnot(None))
+    while True:
+        batch = (db.query(Plan.id, Plan.request, Plan.response)
+                 .filter(Plan.id > last_id, or_(legacy_response, legacy_request))
+                 .order_by(Plan.id).limit(batch_size).all())
+        if not batch:
+            break
+        ids = [plan_id for plan_id, _, response in batch if response is not None]
+        # legs in the old layout (stringified coordinates) are replaced by typed rows
+        db.query(PlanLeg).filter(PlanLeg.plan_id.in_(ids)).delete(synchronize_session=False)
+        db.query(PlanFuelStop).filter(PlanFuelStop.plan_id.in_(ids)).delete(synchronize_session=False)
+        for plan_id, request, response in batch:
+            values = {}
+            if request is not None:
+                values.update(request_blob=encode_blob(request), request=null())
+            if response is not None:
+                values.update(response_blob=encode_blob(response), response=null())
+                db.add_all(_typed_rows(plan_id, response))
+            db.query(Plan).filter(Plan.id == plan_id).update(values, synchronize_session=False)
+        db.commit()
+        done += len(batch)
+        last_id = batch[-1][0]
+        print(f"[plan_store] backfilled {done} plans (up to id {last_id}) in {time.perf_counter() - t0:.1f}s")
+    print(f"[plan_store] backfill complete: {done} plans converted")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stored plan maintenance")
+    sub = parser.add_subparsers(dest="cmd")
+    p_backfill = sub.add_parser("backfill", help="move JSON requests and responses to compressed blobs and typed rows")
+    p_backfill.add_argument("--batch-size", type=int, default=500)
+
+    args = parser.parse_args()
+    if args.cmd == "backfill":
+        from app.db import get_db
+        db = next(get_db())
+        try:
+            backfill(db, batch_size=args.batch_size)
+        finally:
+            db.close()
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
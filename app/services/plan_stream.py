@@ -0,0 +1,64 @@
+"""
+Server-sent events for /plan/stream.
+
+build_plan_payload runs in a worker thread and reports through its progress callback; events are
+queued and written to the response as they arrive, so clients can draw legs before the whole
+itinerary is solved and a long solve never leaves the connection idle long enough to hit a
+proxy or client read timeout (a keep-alive comment is sent every KEEPALIVE_S seconds).
+
+Events (data is JSON):
+    run        {"run_index", "mode", "legs"}                   a refuel/hub run is about to be solved
+    progress   {"run_index", "mode", "expanded", "reached"|"labels", "bound", ...}
+               solver progress; bound is the current heap key, a lower bound on the run's objective
+    fuel_stop  {"run_index", "stop"}                           FuelStop of a solved run
+    leg        {"index", "leg"}                                LegDetail, in itinerary order
+    warning    {"run_index", "message"}                        a run was planned without refuelling stops
+    summary    PlanResponse                                    final plan (same body as POST /plan)
+    error      {"detail"}                                      the plan failed; the stream ends
+
+API:
+    stream_plan(req) -> iterator of SSE-formatted str chunks
+"""
+import queue
+import threading
+from typing import Any, Dict, Iterator
+from app.models import PlanRequest
+from app.services.serialization import dumps
+
+KEEPALIVE_S = 10.0
+
+_DONE = object()
+
+
+def format_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+def stream_plan(req: PlanRequest) -> Iterator[str]:
+    """Run build_plan_payload in a thread and yield its events as SSE chunks, ending with summary or error."""
+    from app.services.optimizer import build_plan_payload
+
+    events = queue.Queue()
+
+    def progress(event: str, data: Dict[str, Any]):
+        events.put((event, data))
+
+    def work():
+        try:
+            events.put(("summary", build_plan_payload(req, progress=progress)))
+        except Exception as e:
+            events.put(("error", {"detail": str(e)}))
+        finally:
+            events.put(_DONE)
+
+    # the plan is still completed and stored if the client goes away mid-stream
+    threading.Thread(target=work, name="plan-stream", daemon=True).start()
+    while True:
+        try:
+            item = events.get(timeout=KEEPALIVE_S)
+        except queue.Empty:
+            yield ": keep-alive\n\n"
+            continue
+        if item is _DONE:
+            return
+        yield format_event(*item)
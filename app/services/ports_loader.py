@@ -6,6 +6,7 @@ In production, load a full UN/World Port List with UN/LOCODEs and pricing feeds.
 from sqlalchemy.orm import Session
 from app.models_orm import Port
 from geoalchemy2.elements import WKTElement
+from app.services.node_store import touch_node_stores
 
 SAMPLE_PORTS = [
     {"name": "Rotterdam", "unlocode": "NLRTM", "country": "NL", "lon": 4.136, "lat": 51.947, "bunker_price": 600.0, "port_fee": 5000.0},
@@ -31,4 +32,5 @@ def seed_ports(db: Session):
             port_fee=p["port_fee"],
         )
         db.add(port)
-    db.commit()
\ No newline at end of file
+    db.commit()
+    touch_node_stores()
\ No newline at end of file
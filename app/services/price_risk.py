@@ -0,0 +1,229 @@
+"""
+Fuel-price risk of a stored plan: GET /plan/{route_id}/price-risk.
+
+A plan is costed at the fuel prices of the day it was built. This samples correlated price
+scenarios over the candidate refuelling nodes and answers two questions:
+
+- what the plan's fuel bill looks like if prices move (P50/P90 and a histogram): the plan's
+  stops and amounts are kept fixed and re-costed for every scenario at once, one matrix product;
+- how stable the choice of stops is: a subset of scenarios, spread across the cost distribution,
+  is re-planned with build_plan_payload at the scenario prices. The score is the share of them whose
+  optimal plan uses the same stops; regret is what the fixed plan costs over the re-planned one.
+
+Scenarios are multiplicative shocks on log prices, multivariate normal and mean-preserving
+(E[shock] = 1), drawn through a Cholesky factor of the covariance of the candidate nodes. Stops
+are re-costed from the price paid in the plan; re-planning applies the shocks to today's prices.
+
+Covariance file (PRICE_COVARIANCE_PATH, default data/price_covariance.json):
+    kinds                    {"port"|"airport"|"station"|"rail_terminal": {"volatility", "correlation"}}
+                             volatility: std of the log price change over the planning horizon;
+                             correlation: between two nodes of that kind
+    cross_kind_correlation   between nodes of different kinds
+    nodes                    {"port:12": {"volatility": ...}} per-node volatility overrides
+    covariance               optional {"ids": [node ids], "matrix": [[...]]}: an estimated
+                             covariance block that replaces the model for those nodes
+
+Latency: sampling and re-costing take milliseconds for thousands of samples; re-planning stops
+early when the next one would overrun budget_ms (reported as truncated).
+
+API:
+    price_risk(db, route_id, samples=5000, resolve=20, budget_ms=2000, random_seed=0) -> dict | None
+    load_covariance() -> dict
+    sample_shocks(cov, samples, rng) -> (samples, nodes) ndarray
+"""
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.models import PlanRequest
+from app.services.node_store import get_node_store
+from app.services.plan_store import get_plan, get_plan_request, get_fuel_stops
+from app.services.refuel_optimizer import NODE_KINDS, node_kind_for_mode
+
+COVARIANCE_PATH = os.environ.get(
+    "PRICE_COVARIANCE_PATH", os.path.join(os.path.dirname(__file__), "..", "..", "data", "price_covariance.json"))
+
+MAX_SAMPLES = 50000
+MAX_RESOLVE = 200
+# candidate nodes per kind, as in refuel_optimizer.prepare_candidates
+MAX_NODES = 200
+HISTOGRAM_BINS = 20
+
+DEFAULT_KIND = {"volatility": 0.1, "correlation": 0.8}
+
+_covariance_cache = (None, None)
+
+
+def load_covariance() -> Dict[str, Any]:
+    """The covariance file, re-read only when it changes; the default model if it is missing."""
+    global _covariance_cache
+    try:
+        mtime = os.stat(COVARIANCE_PATH).st_mtime
+    except OSError:
+        return {}
+    if _covariance_cache[0] != mtime:
+        with open(COVARIANCE_PATH, "r") as f:
+            _covariance_cache = (mtime, json.load(f))
+    return _covariance_cache[1]
+
+
+def covariance_matrix(spec: Dict[str, Any], ids: List[str], kinds: List[str]) -> np.ndarray:
+    """Covariance of log price shocks for the nodes `ids` (kinds[i] is the kind of ids[i])."""
+    kind_spec = spec.get("kinds") or {}
+    node_spec = spec.get("nodes") or {}
+    vol = np.array([node_spec.get(i, {}).get("volatility", kind_spec.get(k, DEFAULT_KIND)["volatility"])
+                    for i, k in zip(ids, kinds)], dtype=np.float64)
+    kind_arr = np.array(kinds)
+    same = kind_arr[:, None] == kind_arr[None, :]
+    rho_kind = np.array([kind_spec.get(k, DEFAULT_KIND)["correlation"] for k in kinds], dtype=np.float64)
+    corr = np.where(same, rho_kind[:, None], float(spec.get("cross_kind_correlation", 0.5)))
+    np.fill_diagonal(corr, 1.0)
+    cov = corr * vol[:, None] * vol[None, :]
+
+    block = spec.get("covariance")
+    if block:
+        pos = {node_id: n for n, node_id in enumerate(ids)}
+        rows = [(n, pos[node_id]) for n, node_id in enumerate(block["ids"]) if node_id in pos]
+        if rows:
+            src, dst = np.array(rows).T
+            cov[np.ix_(dst, dst)] = np.asarray(block["matrix"], dtype=np.float64)[np.ix_(src, src)]
+    return cov
+
+
+def sample_shocks(cov: np.ndarray, samples: int, rng: np.random.Generator) -> np.ndarray:
+    """(samples, nodes) multiplicative price shocks, lognormal with mean 1."""
+    try:
+        factor = np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        # an estimated block may not be positive definite: clip its negative eigenvalues
+        w, v = np.linalg.eigh(cov)
+        factor = v * np.sqrt(np.clip(w, 0.0, None))
+    z = rng.standard_normal((samples, cov.shape[0])) @ factor.T
+    return np.exp(z - 0.5 * np.diag(cov))
+
+
+def _candidates(db, kinds: List[str], stop_ids: List[str]):
+    """(node ids, kinds, today's prices) of the candidate nodes of every kind, plus the plan's stops."""
+    ids, node_kinds, prices = [], [], []
+    for kind in kinds:
+        store = get_node_store(db, kind)
+        n = min(len(store), MAX_NODES)
+        ids += [store.node_id(i) for i in range(n)]
+        node_kinds += [kind] * n
+        prices += store.price[:n].tolist()
+    known = set(ids)
+    for node_id in stop_ids:
+        if node_id not in known:
+            known.add(node_id)
+            ids.append(node_id)
+            node_kinds.append(node_id.split(":")[0])
+            prices.append(float("nan"))
+    return ids, node_kinds, np.array(prices, dtype=np.float64)
+
+
+def _quantiles(values: np.ndarray) -> Dict[str, float]:
+    p05, p50, p90, p95 = np.percentile(values, [5, 50, 90, 95])
+    return {"mean": round(float(values.mean()), 2), "std": round(float(values.std()), 2), "p05": round(float(p05), 2),
+            "p50": round(float(p50), 2), "p90": round(float(p90), 2), "p95": round(float(p95), 2)}
+
+
+def price_risk(db, route_id: str, samples: int = 5000, resolve: int = 20, budget_ms: float = 2000.0,
+               random_seed: int = 0) -> Optional[Dict[str, Any]]:
+    """Cost distribution and stop stability of a stored plan; None if the plan is unknown."""
+    t0 = time.perf_counter()
+    if not 1 <= samples <= MAX_SAMPLES:
+        raise ValueError(f"samples must be between 1 and {MAX_SAMPLES}")
+    if not 0 <= resolve <= MAX_RESOLVE:
+        raise ValueError(f"resolve must be between 0 and {MAX_RESOLVE}")
+    response = get_plan(db, route_id)
+    if response is None:
+        return None
+    stops = get_fuel_stops(db, route_id)
+    stop_ids = [s["node_id"] for s in stops if s["node_id"] and ":" in s["node_id"]]
+    kinds = sorted({node_kind_for_mode(db, ld["mode"]) for ld in response.get("leg_details") or []
+                    if ld.get("mode") in NODE_KINDS})
+    ids, node_kinds, today = _candidates(db, kinds, stop_ids)
+    pos = {node_id: n for n, node_id in enumerate(ids)}
+
+    rng = np.random.default_rng(random_seed)
+    shocks = sample_shocks(covariance_matrix(load_covariance(), ids, node_kinds), samples, rng) if ids \
+        else np.ones((samples, 0))
+
+    # fixed plan: fuel of each stop at its plan price times the stop's shock; fees do not move
+    amount = np.array([s["amount"] or 0.0 for s in stops], dtype=np.float64)
+    price = np.array([s["price_per_unit_usd"] or 0.0 for s in stops], dtype=np.float64)
+    fees = np.array([(s["cost_usd"] or 0.0) for s in stops], dtype=np.float64) - amount * price
+    cols = np.array([pos.get(s["node_id"], -1) for s in stops], dtype=np.int64)
+    priced = cols >= 0
+    stop_cost = np.repeat((amount * price + fees)[None, :], samples, axis=0)
+    if priced.any():
+        stop_cost[:, priced] = (amount * price)[priced][None, :] * shocks[:, cols[priced]] + fees[priced][None, :]
+    fuel_cost = stop_cost.sum(axis=1)
+    base_fuel = float((amount * price + fees).sum())
+    other_cost = float(response["total_cost_usd"]) - base_fuel
+    counts, edges = np.histogram(fuel_cost, bins=HISTOGRAM_BINS)
+
+    result = {
+        "route_id": route_id,
+        "samples": samples,
+        "random_seed": random_seed,
+        "candidate_nodes": len(ids),
+        "base_fuel_cost_usd": round(base_fuel, 2),
+        "fuel_cost_usd": _quantiles(fuel_cost),
+        "total_cost_usd": _quantiles(fuel_cost + other_cost),
+        "histogram": {"edges": [round(e, 2) for e in edges.tolist()], "counts": counts.tolist()},
+        "stops": [{
+            "node_id": s["node_id"],
+            "name": s["name"],
+            "amount": s["amount"],
+            "fuel_unit": s["fuel_unit"],
+            "price_per_unit_usd": s["price_per_unit_usd"],
+            "cost_p50_usd": round(float(np.percentile(stop_cost[:, i], 50)), 2),
+            "cost_p90_usd": round(float(np.percentile(stop_cost[:, i], 90)), 2),
+            "priced": bool(priced[i]),
+        } for i, s in enumerate(stops)],
+    }
+
+    # stability: re-plan scenarios spread evenly over the cost distribution, within the budget
+    request = get_plan_request(db, route_id) if resolve else None
+    stability = {"requested": resolve, "resolved": 0, "same_stops": 0, "score": None,
+                 "mean_regret_usd": None, "max_regret_usd": None, "truncated": False}
+    if request is not None:
+        from app.services.optimizer import build_plan_payload
+
+        req = PlanRequest(**request)
+        plan_stops = [s["node_id"] for s in stops]
+        order = np.argsort(fuel_cost)
+        ranks = np.unique(np.linspace(0, samples - 1, min(resolve, samples)).round().astype(int))
+        # shuffled, so a run cut short by the budget still covers the whole distribution
+        picks = rng.permutation(order[ranks])
+        sells = np.flatnonzero(np.isfinite(today) & (today > 0))
+        regrets = []
+        spent = []
+        for s in picks.tolist():
+            elapsed = (time.perf_counter() - t0) * 1000.0
+            if spent and elapsed + max(spent) > budget_ms:
+                stability["truncated"] = True
+                break
+            t1 = time.perf_counter()
+            overrides = {ids[j]: float(today[j] * shocks[s, j]) for j in sells.tolist()}
+            captured = []
+            try:
+                plan = build_plan_payload(req, db=db, seed=False, price_overrides=overrides,
+                                          store=lambda db_, req_, response_, stops_: captured.append(stops_))
+            except ValueError:
+                spent.append((time.perf_counter() - t1) * 1000.0)
+                continue
+            spent.append((time.perf_counter() - t1) * 1000.0)
+            stability["resolved"] += 1
+            if [d.get("node_id") for d in captured[0]] == plan_stops:
+                stability["same_stops"] += 1
+            regrets.append(float(fuel_cost[s]) - sum(fs["cost_usd"] for fs in plan["fuel_plan"]))
+        if stability["resolved"]:
+            stability["score"] = round(stability["same_stops"] / stability["resolved"], 3)
+            stability["mean_regret_usd"] = round(float(np.mean(regrets)), 2)
+            stability["max_regret_usd"] = round(float(np.max(regrets)), 2)
+    result["stability"] = stability
+    result["elapsed_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    return result
@@ -0,0 +1,183 @@
+"""
+Rail routing for rail legs: a track graph from a local OSM extract, rail terminals snapped onto it
+and a precomputed terminal-to-terminal table.
+
+Rail legs used the great-circle distance at a flat 40 km/h. This builds the freight track network
+with the OSM builder of road_network.py (same compaction, largest component and contraction
+hierarchy, saved to RAIL_NETWORK_PATH, default data/rail_network.npz) and a rail profile:
+
+- railway=rail ways, except usage tourism/military/test; tracks are used in both directions;
+- freight speed by usage (RAIL_SPEEDS_KMH), SERVICE_TRACK_SPEED_KMH on yards, sidings and spurs,
+  capped by maxspeed and FREIGHT_MAX_SPEED_KMH.
+
+Terminals are Station rows with kind "rail_terminal" (node_store kind "rail_terminal"). Each one
+snaps to the nearest track nodes within TERMINAL_SNAP_KM (`snap` lists the ones that do not);
+other points (origins, destinations) snap the same way with a drayage leg at ACCESS_SPEED_KMH.
+
+Terminal-to-terminal track km and hours are precomputed into the memory-mapped matrices of
+distance_matrix.py (kinds rail_terminal and rail_terminal_time), so planning reads terminal pairs
+in O(1); only the rows of an itinerary's own points are routed per request.
+
+API:
+    build_rail_network(osm_path, out_path=RAIL_NETWORK_PATH) -> RoutingNetwork
+    get_rail_network() -> RoutingNetwork | None      (reloaded when the file changes)
+    rail_route(lat1, lon1, lat2, lon2) -> {"distance_km", "time_hours"} | None
+    snap_terminals(db) -> [{"id", "name", "lat", "lon", "snap_km" | None}]
+
+CLI:
+    python -m app.services.rail_network build --osm data/osm/europe-rail.osm.pbf --tables
+    python -m app.services.rail_network snap
+    python -m app.services.rail_network route 51.95,4.14 50.11,8.68
+    python -m app.services.rail_network info
+"""
+import argparse
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.road_network import RoutingNetwork, build_network, parse_maxspeed
+from app.services.utils import haversine_km_np
+
+RAIL_NETWORK_PATH = os.environ.get(
+    "RAIL_NETWORK_PATH", os.path.join(os.path.dirname(__file__), "..", "..", "data", "rail_network.npz"))
+
+# typical freight train speeds per OSM usage (km/h)
+RAIL_SPEEDS_KMH = {"main": 70.0, "branch": 45.0, "industrial": 25.0}
+DEFAULT_SPEED_KMH = 50.0
+SERVICE_TRACK_SPEED_KMH = 15.0
+SERVICE_TRACKS = {"yard", "siding", "spur", "crossover"}
+EXCLUDED_USAGE = {"tourism", "military", "test"}
+FREIGHT_MAX_SPEED_KMH = float(os.environ.get("FREIGHT_MAX_SPEED_KMH", "100"))
+
+TERMINAL_SNAP_KM = 10.0
+ACCESS_SPEED_KMH = 30.0
+
+
+def _track_profile(tags: Dict[str, str]) -> Optional[Tuple[float, int]]:
+    """(freight speed km/h, 0: both directions) of a track, None if it is not freight track."""
+    if tags.get("railway") != "rail" or tags.get("usage") in EXCLUDED_USAGE:
+        return None
+    if tags.get("service") in SERVICE_TRACKS:
+        speed = SERVICE_TRACK_SPEED_KMH
+    else:
+        speed = RAIL_SPEEDS_KMH.get(tags.get("usage"), DEFAULT_SPEED_KMH)
+    limit = parse_maxspeed(tags.get("maxspeed"))
+    if limit:
+        speed = min(speed, limit)
+    return min(speed, FREIGHT_MAX_SPEED_KMH), 0
+
+
+def build_rail_network(osm_path: str, out_path: str = None) -> RoutingNetwork:
+    """Import the tracks of an OSM extract, contract them and save the network."""
+    return build_network(osm_path, out_path or RAIL_NETWORK_PATH, _track_profile, "rail_network",
+                         snap_max_km=TERMINAL_SNAP_KM, access_speed_kmh=ACCESS_SPEED_KMH)
+
+
+_network_lock = threading.Lock()
+_network = (None, None)
+
+
+def get_rail_network() -> Optional[RoutingNetwork]:
+    """The saved rail network, reloaded when a rebuild replaced the file; None if none was built."""
+    global _network
+    try:
+        mtime = os.stat(RAIL_NETWORK_PATH).st_mtime
+    except OSError:
+        return None
+    with _network_lock:
+        if _network[0] != mtime:
+            _network = (mtime, RoutingNetwork.load(RAIL_NETWORK_PATH, snap_max_km=TERMINAL_SNAP_KM,
+                                                   access_speed_kmh=ACCESS_SPEED_KMH))
+        return _network[1]
+
+
+def rail_route(lat1: float, lon1: float, lat2: float, lon2: float) -> Optional[Dict[str, float]]:
+    """Track distance (km) and train time (hours) between two points; None if not on the network."""
+    network = get_rail_network()
+    if network is None:
+        return None
+    route = network.route((lat1, lon1), (lat2, lon2))
+    if route is None:
+        return None
+    return {"distance_km": route["distance_km"], "time_hours": route["time_hours"]}
+
+
+def snap_terminals(db) -> List[Dict[str, Any]]:
+    """Every rail terminal with its distance to the track (snap_km None: further than TERMINAL_SNAP_KM)."""
+    from app.services.node_store import get_node_store
+    network = get_rail_network()
+    store = get_node_store(db, "rail_terminal")
+    out = []
+    for i in range(len(store)):
+        lat, lon = float(store.lat[i]), float(store.lon[i])
+        seeds = network.snap(lat, lon) if network is not None else {}
+        out.append({"id": int(store.obj_id[i]), "name": store.names[i], "lat": lat, "lon": lon,
+                    "snap_km": round(min(km for _, km in seeds.values()), 3) if seeds else None})
+    return out
+
+
+def _point(text: str) -> Tuple[float, float]:
+    lat, lon = text.split(",")
+    return float(lat), float(lon)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rail network and terminal tables")
+    sub = parser.add_subparsers(dest="cmd")
+    p_build = sub.add_parser("build", help="import the tracks of an OSM extract and build the hierarchy")
+    p_build.add_argument("--osm", required=True, help=".osm, .osm.gz, .osm.bz2 or .osm.pbf (needs pyosmium)")
+    p_build.add_argument("--out", default=None, help=f"default {RAIL_NETWORK_PATH}")
+    p_build.add_argument("--tables", action="store_true", help="then build the terminal-to-terminal tables")
+    sub.add_parser("snap", help="list rail terminals and their distance to the track")
+    p_route = sub.add_parser("route", help="time a point-to-point query")
+    p_route.add_argument("origin", help="lat,lon")
+    p_route.add_argument("destination", help="lat,lon")
+    sub.add_parser("info")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        build_rail_network(args.osm, args.out)
+        if args.tables:
+            from app.services.distance_matrix import build_matrix, RAIL_KINDS
+            for kind in RAIL_KINDS:
+                build_matrix(kind)
+    elif args.cmd == "snap":
+        from app.db import get_db
+        db = next(get_db())
+        try:
+            terminals = snap_terminals(db)
+        finally:
+            db.close()
+        for t in terminals:
+            where = f"{t['snap_km']:.2f} km from track" if t["snap_km"] is not None else "NOT SNAPPED"
+            print(f"rail_terminal:{t['id']}  {t['name']}  ({t['lat']:.4f}, {t['lon']:.4f})  {where}")
+        missing = sum(t["snap_km"] is None for t in terminals)
+        print(f"{len(terminals)} terminals, {missing} further than {TERMINAL_SNAP_KM} km from the track")
+    elif args.cmd == "route":
+        network = get_rail_network()
+        if network is None:
+            raise SystemExit(f"No rail network at {RAIL_NETWORK_PATH}; run the build command first")
+        a, b = _point(args.origin), _point(args.destination)
+        t0 = time.perf_counter()
+        route = network.route(a, b)
+        ms = (time.perf_counter() - t0) * 1000.0
+        if route is None:
+            print(f"not routable ({ms:.1f} ms)")
+        else:
+            direct = float(haversine_km_np(a[0], a[1], b[0], b[1]))
+            print(f"{route['distance_km']:.1f} km of track ({direct:.1f} km great circle), "
+                  f"{route['time_hours']:.2f} h ({ms:.1f} ms)")
+    elif args.cmd == "info":
+        network = get_rail_network()
+        if network is None:
+            print(f"No rail network at {RAIL_NETWORK_PATH}")
+            return
+        meta = network.ch.meta
+        print(f"{len(network)} nodes, {len(network.ch.shortcut_mid)} shortcuts, from {meta['source']} "
+              f"built {meta['built_at']}, {os.path.getsize(network.path) / 1e6:.1f} MB")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,325 +11,1356 @@ Transitions:
 
 Notes / assumptions (MVP):
 - Nodes must be pre-populated in DB: ports (for ocean), airports (for air), stations (for road/rail).
+  They are read through the cached struct-of-arrays store in node_store.py; the search loop
+  indexes plain price/fee lists instead of per-node dicts.
 - Each node should expose a price per fuel unit (tons or liters) and a stop fee (port_fee, landing_fee, service_fee).
 - Fuel discretization step is configurable (e.g., 1 ton or 100 liters); smaller step => more precise but slower.
 - The solver assumes refuelling can be done up to full capacity at nodes.
-- This returns cheapest plan given fuel prices and stop fees, with an optional limit on number of stops or time.
+- This returns cheapest plan given fuel prices and stop fees, subject to optional plan constraints (below).
+- Ocean edges use sea-lane distances (see sea_routing.py); other modes use great-circle distances.
+  Both read port/airport pairs from the prebuilt memory-mapped matrices when available
+  (see distance_matrix.py).
+- Road edges use road distances and truck times from the road network (road_network.py) when one
+  has been built; pairs it does not cover keep the great circle at the default road speed. Rail
+  edges do the same on the rail network (rail_network.py), reading terminal pairs from the
+  precomputed terminal tables. Rail refuels at rail terminals (all stations if none are imported).
+- Air edges fly through the upper-air winds of WIND_FIELD_PATH when one is configured
+  (wind_field.py): time and fuel of every airport pair scale by its headwind factor at the
+  carrier's airspeed and flight level; still air otherwise.
+
+Search core: states are packed ints, sid = (node * levels + fuel_idx) * (K + 1) + k. Scalar
+objectives run Dijkstra on flat arrays preallocated per state (key, cost, hours as float64, the
+predecessor sid as int64 and an int32 action code: start, refuel, or the index of the travel edge),
+so there is no per-state dict, tuple or hashing. Refuelling goes through a second "at the pump"
+copy of every state (one fuel step per pop instead of one heap entry per reachable level), so the
+arrays take 2 * FLAT_BYTES_PER_STATE bytes per state; a search whose state space exceeds
+max_states fails immediately instead of exhausting RAM.
+solver="csgraph" solves the same problem on the explicitly expanded state graph with
+scipy.sparse.csgraph (optional dependency; best for coarse grids). Results report the state count
+and an estimate of the search's peak memory (peak_memory_mb).
+
+Objectives (PlanRequest.preferences):
+- cheapest: minimise USD (the default)
+- fastest: minimise hours (travel + REFUEL_STOP_HOURS per stop)
+- weighted: minimise USD + time_value_usd_per_hour * hours
+- pareto: multi-criteria label setting that keeps every non-dominated (cost, hours) label per state
+  and returns the cost/time frontier. Labels are expanded in cost order, so any label slower than
+  an already finished plan is dominated and dropped. Latency is bounded by max_labels_per_state
+  (extra labels at a full state are dropped), max_labels (no new labels, result marked truncated)
+  pareto_epsilon (labels within that relative margin of an existing one count as dominated) and
+  pareto_max_fuel_levels (the fuel step is coarsened so capacity spans at most that many levels).
+  A lower bound on the remaining travel time (ignoring fuel) prunes labels that cannot beat the
+  fastest plan found so far.
+
+Slow steaming (optimize_speed, ocean only): every sea edge is offered at each of the carrier's
+discrete speeds (vessel_speed.py), with fuel per nm from its speed/consumption curve, so the search
+picks a speed per segment. Under "cheapest" without a deadline that is the slowest speed; a
+deadline (max_hours) or a time value makes the trade-off. Deadline searches use the pareto label
+machinery with the objective key in place of cost and return the best plan that arrives in time.
+
+Load-dependent burn (carrier load_curve, see consumption.py): fuel per edge depends on the payload
+and on the fuel on board, so heavier departures need more fuel. Fuel levels are grouped into
+LOAD_BINS bins and every edge's requirement is computed per bin in one vectorized call; states
+look up the requirement list of their bin, so the inner edge loop is unchanged.
+
+Constraints (PlanRequest.constraints) are resources of a resource-constrained shortest path search:
+- max_stops: refuelling stops so far is part of the label; a label needs no more stops than another
+  to dominate it, and refuelling is not offered once the limit is reached.
+- max_hours / arrival_windows: (earliest, latest) hours after departure per destination. Arriving
+  early waits until the window opens; arriving late is infeasible. A lower bound on the travel time
+  to every later destination drops labels that can no longer make one of their windows.
+- opening hours: refuelling starts only while the port is open (daily window on the departure_hour
+  clock); the vessel waits for the port to open otherwise.
+Waiting is always allowed, so an earlier label dominates a later one and the usual (cost, hours)
+dominance stays valid. Constrained searches use the multi-label machinery (coarse fuel grid), so
+the extra pruning keeps them about as fast as unconstrained ones.
+
+Multi-leg itineraries are solved jointly: the state is extended with the index of the next
+required destination, state = (node_id, fuel_level_index, next_destination), so fuel bunkered
+cheaply on an early leg can be carried into later legs. One candidate graph is built per
+itinerary and shared by every leg.
+
+Carrier selection (rank_carriers): the candidate nodes and distance matrix do not depend on the
+carrier, so they are prepared once (prepare_candidates) and every carrier model of the mode is
+solved on them. Capacity and range checks drop carriers without a search, and a lower bound from
+the shortest route distance skips carriers that cannot make the top of the ranking.
 
 API:
-    find_optimal_refuel_route(db, nodes, origin_coord, dest_coord, carrier_profile, mode,
+    find_optimal_refuel_route(origin_coord, dest_coord, carrier_profile, mode,
                               fuel_unit='tons'|'liters', step_size=1.0, reserve=0.1)
+    find_optimal_itinerary_refuel_route(waypoints, carrier_profile, mode,
+                                        fuel_unit='tons'|'liters', step_size=1.0, reserve=0.1,
+                                        initial_fuel=None, objective='cheapest',
+                                        time_value_usd_per_hour=0.0, optimize_speed=False,
+                                        max_hours=None, max_stops=None, arrival_windows=None,
+                                        departure_hour=0.0, port_opening_hours=None,
+                                        port_opening_hours_by_node=None, solver='heap',
+                                        max_states=5_000_000, candidates=None, payload_tonnes=None,
+                                        price_overrides=None)
+    prepare_candidates(waypoints, mode, max_nodes_considered=200) -> Candidates
+    rank_carriers(waypoints, carrier_profiles, mode, fuel_unit, vehicles=None, cargo_tonnes=None,
+                  objective='cheapest', alternatives=3, ...) -> {"best", "result", "ranking"}
 
 Returns:
     dict with keys: total_cost, fuel_plan (list of {node, amount, price, cost}), path (node id list),
                     legs (list of dict with distance, fuel_used, etc.)
+    Itinerary results additionally tag every fuel_plan entry and leg with `leg_index`, the
+    itinerary leg (0-based) during which it happens.
+    All results carry total_time_hours, refuel_hours and wait_hours (waiting for arrival windows and
+    port opening hours; legs and fuel_plan entries that waited carry wait_hours too); pareto results
+    add `pareto`, the list of frontier plans ordered from cheapest to fastest. With optimize_speed, legs carry speed_knots and
+    results add fuel_at_service_speed and fuel_saved_vs_service_speed.
+    Every result carries solver, labels_created, states, peak_memory_mb, truncated and step_size.
 """
+from array import array
 from heapq import heappush, heappop
 from collections import defaultdict, namedtuple
 from math import ceil
 from typing import List, Tuple, Dict, Any
-from app.services.utils import haversine_nm_coords, haversine_km
+import numpy as np
+from app.services.utils import haversine_nm_coords, haversine_km, haversine_km_np
+from app.services.sea_routing import get_port_sea_table
+from app.services.distance_matrix import get_distance_matrix
+from app.services.vessel_speed import speed_options, tons_per_nm
+from app.services.consumption import has_load_curve, leg_burn, min_load_factor
+from app.services.node_store import NodeStore, get_node_store
+from app.services.road_network import get_road_network
+from app.services.rail_network import get_rail_network
+from app.services.wind_field import get_wind_field, flight_level
+from app.services.distance_cache import cached_matrix, node_ids
 from app.db import get_db
-from app.models_orm import Port, Airport, Station
-from geoalchemy2.shape import to_shape
 
-State = namedtuple("State", ["cost", "node_idx", "fuel_idx", "prev"])
-Transition = namedtuple("Transition", ["to_node", "fuel_cost", "travel_fuel", "distance_nm", "time_hours"])
+# carrier-independent part of a solve: candidate nodes (virtual ones first) and their distances
+# (nm for ocean, km otherwise; the other matrix is None); time_hours when the network gives travel
+# times (road network), None when edges are timed at the carrier's speed
+Candidates = namedtuple("Candidates", ["nodes", "distance_nm", "distance_km", "time_hours"], defaults=(None,))
+Transition = namedtuple("Transition", ["to_node", "fuel_cost", "travel_fuel", "distance_nm", "time_hours", "speed_knots"],
+                        defaults=(None,))
 
 INF = float("inf")
 
+OBJECTIVES = ("cheapest", "fastest", "weighted", "pareto")
 
-def _load_nodes_for_mode(db, mode: str) -> List[Dict[str, Any]]:
-    nodes = []
-    if mode == "ocean":
-        rows = db.query(Port).all()
-        for r in rows:
-            shp = to_shape(r.geom)
-            nodes.append({
-                "id": f"port:{r.id}",
-                "type": "port",
-                "obj_id": r.id,
-                "name": r.name,
-                "lat": shp.y,
-                "lon": shp.x,
-                "price_per_unit": float(r.bunker_price or 1e9),  # USD per ton
-                "stop_fee": float(r.port_fee or 0.0),
-            })
-    elif mode == "air":
-        rows = db.query(Airport).all()
-        for r in rows:
-            shp = to_shape(r.geom)
-            nodes.append({
-                "id": f"airport:{r.id}",
-                "type": "airport",
-                "obj_id": r.id,
-                "name": r.name,
-                "lat": shp.y,
-                "lon": shp.x,
-                "price_per_unit": float(r.jet_price_per_l or 1e9),  # USD per liter
-                "stop_fee": float(r.landing_fee or 0.0),
-            })
-    elif mode in ("road", "rail"):
-        rows = db.query(Station).all()
-        for r in rows:
-            shp = to_shape(r.geom)
-            nodes.append({
-                "id": f"station:{r.id}",
-                "type": "station",
-                "obj_id": r.id,
-                "name": r.name or f"station:{r.id}",
-                "lat": shp.y,
-                "lon": shp.x,
-                "price_per_unit": float(r.diesel_price_per_l or 1e9),  # USD per liter
-                "stop_fee": float(r.service_fee or 0.0),
-            })
-    else:
+# hours lost per refuelling stop (berthing/bunkering, taxi/turnaround, pumping); carrier profiles
+# may override with "refuel_stop_hours"
+REFUEL_STOP_HOURS = {"ocean": 12.0, "air": 1.0, "road": 0.5, "rail": 1.0}
+
+SOLVERS = ("heap", "csgraph")
+
+# action codes stored with every state/label; codes >= 0 are the index of the travel edge in edges[node]
+ACT_NONE, ACT_START, ACT_REFUEL = -3, -2, -1
+
+# rough sizes behind peak_memory_mb: flat arrays per state (3 float64, int64 pred, int32 action), one
+# heap entry (tuple, boxed key and sid, list slot) and one multi-label (tuple, boxed fields, dict/list slots)
+FLAT_BYTES_PER_STATE = 36
+HEAP_ENTRY_BYTES = 120
+LABEL_BYTES = 320
+
+# expanded-graph edges allowed for solver="csgraph" (~24 bytes each while building)
+CSGRAPH_MAX_EDGES = 50_000_000
+
+# pops between two progress callbacks
+PROGRESS_EVERY = 20000
+
+# fuel-level bins of a carrier with a load curve; each bin has its own edge fuel requirements
+LOAD_BINS = 8
+
+
+# mode -> node_store kind of its refuelling nodes
+NODE_KINDS = {"ocean": "port", "air": "airport", "road": "station", "rail": "rail_terminal"}
+
+
+def node_kind_for_mode(db, mode: str) -> str:
+    """node_store kind a mode refuels at; rail uses every station while no terminal is imported."""
+    if mode not in NODE_KINDS:
         raise ValueError("Unsupported mode for node loading: " + str(mode))
-    return nodes
+    kind = NODE_KINDS[mode]
+    if kind == "rail_terminal" and len(get_node_store(db, kind)) == 0:
+        return "station"
+    return kind
 
 
-def _nearest_node_index(nodes: List[Dict[str, Any]], lat: float, lon: float) -> int:
-    best = None
-    best_d = float("inf")
-    for i, n in enumerate(nodes):
-        d = haversine_km(lat, lon, n["lat"], n["lon"])
-        if d < best_d:
-            best_d = d
-            best = i
-    return best
+def _node_store_for_mode(db, mode: str) -> NodeStore:
+    return get_node_store(db, node_kind_for_mode(db, mode))
 
 
-def find_optimal_refuel_route(origin_coord: Tuple[float, float],
-                              dest_coord: Tuple[float, float],
-                              carrier_profile: Dict[str, Any],
-                              mode: str,
-                              fuel_unit: str,
-                              step_size: float = 1.0,
-                              reserve: float = 0.1,
-                              max_nodes_considered: int = 200) -> Dict[str, Any]:
-    """
-    origin_coord/dest_coord: (lat, lon)
-    carrier_profile: contains fuel_capacity (tons or liters) and consumption per distance:
-        for ocean: consumption_tons_per_nm
-        for road/rail: consumption_l_per_km or consumption_l_per_100km
-        for air: consumption_kg_per_hr + conversion to liters handled outside or provide consumption_l_per_km
-    fuel_unit: 'tons' or 'liters'
-    step_size: in same unit as fuel_unit (e.g., 1 ton or 100 liters)
-    """
-    db = next(get_db())
-
-    nodes = _load_nodes_for_mode(db, mode)
-
-    # Add origin and destination as virtual nodes (no price unless nearest node used to bunker)
-    nodes.insert(0, {
-        "id": "origin",
-        "type": "origin",
-        "obj_id": None,
-        "name": "Origin",
-        "lat": origin_coord[0],
-        "lon": origin_coord[1],
-        "price_per_unit": None,
-        "stop_fee": 0.0
-    })
-    nodes.append({
-        "id": "destination",
-        "type": "destination",
-        "obj_id": None,
-        "name": "Destination",
-        "lat": dest_coord[0],
-        "lon": dest_coord[1],
-        "price_per_unit": None,
-        "stop_fee": 0.0
-    })
-
-    # limit nodes considered to keep runtime reasonable
-    if len(nodes) > max_nodes_considered:
-        nodes = nodes[:max_nodes_considered]
+def _node_prices(nodes: NodeStore, price_overrides: Dict[str, float] = None) -> np.ndarray:
+    """Fuel price of every node with `price_overrides` (node id -> price) applied; NaN or <= 0 sells no fuel."""
+    if not price_overrides:
+        return nodes.price
+    return np.array([price_overrides.get(nodes.node_id(i), p) for i, p in enumerate(nodes.price.tolist())],
+                    dtype=np.float64)
 
-    N = len(nodes)
-    origin_idx = 0
-    dest_idx = N - 1
 
+def _consumption_and_capacity(mode: str, carrier_profile: Dict[str, Any]) -> Tuple[float, float]:
+    """
+    Return (consumption per distance unit, fuel capacity) for a carrier profile.
+    Ocean consumption is per nm (tons), the other modes are per km (liters).
+    """
     # consumption by distance: we will use fuel_needed = consumption_rate * distance (in appropriate units)
     if mode == "ocean":
-        consumption_per_nm = carrier_profile.get("consumption_tons_per_nm")
+        consumption = carrier_profile.get("consumption_tons_per_nm")
         capacity = carrier_profile.get("fuel_capacity_tons")
         # fuel unit must be 'tons'
     elif mode == "air":
         # expect carrier_profile to optionally provide consumption_l_per_km (preferred)
-        consumption_per_km = carrier_profile.get("consumption_l_per_km")
-        if consumption_per_km is None:
+        consumption = carrier_profile.get("consumption_l_per_km")
+        if consumption is None:
             # fallback compute from kg/hr and cruise speed (approx)
             kg_hr = carrier_profile.get("consumption_kg_per_hr")
             speed_kmh = carrier_profile.get("cruise_speed_kmh", 800.0)
             # kg to liters ~ /0.8
-            consumption_per_km = (kg_hr / speed_kmh) / 0.8
+            consumption = (kg_hr / speed_kmh) / 0.8
         capacity = carrier_profile.get("fuel_capacity_l")
     elif mode in ("road", "rail"):
         # consumption in liters per km (or per 100 km)
         if "consumption_l_per_km" in carrier_profile:
-            consumption_per_km = carrier_profile["consumption_l_per_km"]
+            consumption = carrier_profile["consumption_l_per_km"]
         elif "consumption_l_per_100km" in carrier_profile:
-            consumption_per_km = carrier_profile["consumption_l_per_100km"] / 100.0
+            consumption = carrier_profile["consumption_l_per_100km"] / 100.0
         else:
             raise ValueError("Carrier profile missing consumption for road/rail")
         capacity = carrier_profile.get("fuel_capacity_l")
     else:
         raise ValueError("Unsupported mode: " + str(mode))
+    if not capacity:
+        raise ValueError("Carrier profile has no fuel capacity for mode " + str(mode))
+    return consumption, capacity
+
+
+def _ocean_distance_matrix(db, nodes: NodeStore):
+    """
+    Sea-lane distances (nm) between all nodes: port-to-port pairs come from the precomputed
+    port table, rows/columns of virtual nodes (origin, destinations) go through the shared
+    distance cache (distance_cache.py) and are routed only on a miss.
+    """
+    coords = list(zip(nodes.lat.tolist(), nodes.lon.tolist()))
+    port_pos = np.flatnonzero(nodes.obj_id >= 0).tolist()
+    other_pos = np.flatnonzero(nodes.obj_id < 0).tolist()
+    matrix = np.zeros((len(nodes), len(nodes)))
+    if port_pos:
+        table = get_port_sea_table(db)
+        matrix[np.ix_(port_pos, port_pos)] = table.submatrix(nodes.obj_id[port_pos].tolist())
+    if other_pos:
+        ids = node_ids(nodes)
+        block, _ = cached_matrix("sea", [ids[i] for i in other_pos], [coords[i] for i in other_pos], ids, coords)
+        matrix[other_pos, :] = block
+        matrix[:, other_pos] = block.T
+    return matrix
 
-    # discretize fuel levels: indices 0..M corresponding to amount = idx * step_size
-    max_steps = int(ceil(capacity / step_size))
-    # require reserve
-    reserve_amount = reserve * capacity
 
-    # Build adjacency matrix with travel fuel required and distance/time
+def _great_circle_distance_matrix(nodes: NodeStore, kind: str = None):
+    """
+    Great-circle distances (km) between all nodes. Pairs of DB nodes of `kind` are read from the
+    memory-mapped matrix when it has been built for them at their current positions, and only
+    the rows and columns of the virtual nodes are computed; otherwise the whole matrix is computed.
+    """
+    lat, lon = nodes.lat, nodes.lon
+    mapped = get_distance_matrix(kind) if kind and kind == nodes.kind else None
+    pos = np.flatnonzero(nodes.obj_id >= 0)
+    ids = nodes.obj_id[pos].tolist()
+    if mapped is None or not ids or not mapped.covers(ids, lat[pos], lon[pos]):
+        return haversine_km_np(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+    other = np.flatnonzero(nodes.obj_id < 0)
+    matrix = np.empty((len(nodes), len(nodes)))
+    matrix[np.ix_(pos, pos)] = mapped.submatrix(ids)
+    if len(other):
+        rows = haversine_km_np(lat[other, None], lon[other, None], lat[None, :], lon[None, :])
+        matrix[other, :] = rows
+        matrix[:, other] = rows.T
+    return matrix
+
+
+def _network_matrices(nodes: NodeStore, mode: str, network, tables=None):
+    """
+    km and hours between all nodes on a road or rail network (road_network.py), or (None, None)
+    without one. DB node pairs come from the prebuilt tables (km, hours DistanceMatrix) when they
+    cover them at their current positions, else from the network's block cache; rows and columns of the virtual nodes come
+    from the shared distance cache, routed on a miss. Pairs off the network keep the great circle at the mode's default speed.
+    """
+    if network is None and tables is None:
+        return None, None
+    points = list(zip(nodes.lat.tolist(), nodes.lon.tolist()))
+    N = len(points)
+    km = np.full((N, N), INF)
+    hours = np.full((N, N), INF)
+    node_pos = np.flatnonzero(nodes.obj_id >= 0).tolist()
+    other_pos = np.flatnonzero(nodes.obj_id < 0).tolist()
+    ids = nodes.obj_id[node_pos].tolist()
+    node_lat, node_lon = nodes.lat[node_pos], nodes.lon[node_pos]
+    if (node_pos and tables is not None and tables[0].covers(ids, node_lat, node_lon)
+            and tables[1].covers(ids, node_lat, node_lon)):
+        km[np.ix_(node_pos, node_pos)] = tables[0].submatrix(ids)
+        hours[np.ix_(node_pos, node_pos)] = tables[1].submatrix(ids)
+    elif node_pos and network is not None:
+        block_km, block_hours = network.block([points[i] for i in node_pos])
+        km[np.ix_(node_pos, node_pos)] = block_km
+        hours[np.ix_(node_pos, node_pos)] = block_hours
+    if other_pos and network is not None:
+        keys = node_ids(nodes)
+        other_keys, other_points = [keys[i] for i in other_pos], [points[i] for i in other_pos]
+        row_km, row_hours = cached_matrix(mode, other_keys, other_points, keys, points, network.matrix)
+        km[other_pos, :] = row_km
+        hours[other_pos, :] = row_hours
+        col_km, col_hours = cached_matrix(mode, keys, points, other_keys, other_points, network.matrix)
+        km[:, other_pos] = col_km
+        hours[:, other_pos] = col_hours
+    off = ~np.isfinite(hours)
+    if off.any():
+        gc = _great_circle_distance_matrix(nodes)
+        km[off] = gc[off]
+        hours[off] = gc[off] / _travel_speed(mode, {})
+    np.fill_diagonal(km, 0.0)
+    np.fill_diagonal(hours, 0.0)
+    return km, hours
+
+
+def _air_wind_factors(nodes: NodeStore, carrier_profile: Dict[str, Any], field):
+    """
+    (N, N) wind time factors of all air legs between the nodes (wind_field.py). The DB node block
+    is cached by the field across requests; rows and columns of the virtual nodes are computed here.
+    """
+    tas = _travel_speed("air", carrier_profile)
+    level = flight_level(carrier_profile)
+    lat, lon = nodes.lat, nodes.lon
+    N = len(nodes)
+    factors = np.ones((N, N))
+    node_pos = np.flatnonzero(nodes.obj_id >= 0)
+    other_pos = np.flatnonzero(nodes.obj_id < 0)
+    if len(node_pos):
+        factors[np.ix_(node_pos, node_pos)] = field.block(lat[node_pos], lon[node_pos], tas, level)
+    if len(other_pos):
+        factors[other_pos, :] = field.factors(lat[other_pos], lon[other_pos], lat, lon, tas, level)
+        factors[:, other_pos] = field.factors(lat, lon, lat[other_pos], lon[other_pos], tas, level)
+    return factors
+
+
+def _build_speed_edges(nodes: NodeStore, carrier_profile: Dict[str, Any],
+                       distance_nm_matrix, speeds) -> List[List[Transition]]:
+    """Ocean edges with one transition per speed; fuel and time are computed for all speeds at once."""
+    N = len(nodes)
+    if distance_nm_matrix is None:
+        lat, lon = nodes.lat, nodes.lon
+        distance_nm_matrix = haversine_km_np(lat[:, None], lon[:, None], lat[None, :], lon[None, :]) / 1.852
+    D = np.asarray(distance_nm_matrix, dtype=np.float64)
+    speeds = np.asarray(speeds, dtype=np.float64)
+    # (N, N, S) fuel and hours for every pair and speed
+    fuel = (D[:, :, None] * tons_per_nm(carrier_profile, speeds)[None, None, :]).tolist()
+    hours = (D[:, :, None] / speeds[None, None, :]).tolist()
+    knots = speeds.tolist()
+    D = D.tolist()
+    edges = [[] for _ in range(N)]
+    for i in range(N):
+        for j in range(N):
+            if i == j or D[i][j] == INF:
+                continue
+            for s, v in enumerate(knots):
+                edges[i].append(Transition(to_node=j, fuel_cost=0.0, travel_fuel=fuel[i][j][s], distance_nm=D[i][j],
+                                           time_hours=hours[i][j][s], speed_knots=v))
+    return edges
+
+
+def _travel_speed(mode: str, carrier_profile: Dict[str, Any]) -> float:
+    """Speed at which edges are timed: knots for ocean (service speed), km/h otherwise."""
+    if mode == "ocean":
+        return carrier_profile.get("service_speed_knots", 14.0)
+    if mode == "air":
+        return carrier_profile.get("cruise_speed_kmh", 800.0)
+    # time heuristics
+    return 70.0 if mode == "road" else 40.0
+
+
+def _refuel_stop_hours(mode: str, carrier_profile: Dict[str, Any]) -> float:
+    return float(carrier_profile.get("refuel_stop_hours", REFUEL_STOP_HOURS.get(mode, 1.0)))
+
+
+def _wait_until_open(clock: float, window: Tuple[float, float]) -> float:
+    """Hours to wait at clock (hour of day, any value) until the daily (open, close) window is open."""
+    open_hour, close_hour = window
+    t = clock % 24.0
+    if open_hour == close_hour or (open_hour == 0.0 and close_hour == 24.0):
+        return 0.0
+    if open_hour < close_hour:
+        inside = open_hour <= t < close_hour
+    else:
+        # wraps midnight, e.g. (20, 4)
+        inside = t >= open_hour or t < close_hour
+    return 0.0 if inside else (open_hour - t) % 24.0
+
+
+def _build_edges(nodes: NodeStore, mode: str, carrier_profile: Dict[str, Any],
+                 consumption: float, distance_nm_matrix=None, distance_km_matrix=None,
+                 speeds=None, time_hours_matrix=None, wind_factor_matrix=None) -> List[List[Transition]]:
+    """
+    Build the complete candidate graph with travel fuel required and distance/time per edge.
+    distance_nm_matrix: optional precomputed distances (ocean uses sea lanes); great circle otherwise.
+    distance_km_matrix: optional precomputed distances for road/rail/air.
+    time_hours_matrix: optional travel times for road/rail/air (road network); distance / speed otherwise.
+    wind_factor_matrix: optional air wind factors (wind_field.py) applied to time and fuel.
+    speeds: ocean only; one parallel edge per speed (knots) with fuel from the carrier's speed curve.
+    """
+    N = len(nodes)
+    if mode == "ocean" and speeds is not None:
+        return _build_speed_edges(nodes, carrier_profile, distance_nm_matrix, speeds)
+    lat = nodes.lat.tolist()
+    lon = nodes.lon.tolist()
+    speed = _travel_speed(mode, carrier_profile)
+    wind = wind_factor_matrix.tolist() if wind_factor_matrix is not None else None
     edges = [[] for _ in range(N)]
     for i in range(N):
         for j in range(N):
             if i == j:
                 continue
-            a = nodes[i]
-            b = nodes[j]
             # compute distance in appropriate units
             if mode == "ocean":
-                d_nm = haversine_nm_coords(a["lat"], a["lon"], b["lat"], b["lon"])
-                fuel_needed = d_nm * consumption_per_nm
-                time_hours = d_nm / carrier_profile.get("service_speed_knots", 14.0)
+                if distance_nm_matrix is not None:
+                    d_nm = float(distance_nm_matrix[i][j])
+                    if d_nm == INF:
+                        continue
+                else:
+                    d_nm = haversine_nm_coords(lat[i], lon[i], lat[j], lon[j])
+                fuel_needed = d_nm * consumption
+                time_hours = d_nm / speed
                 edges[i].append(Transition(to_node=j, fuel_cost=0.0, travel_fuel=fuel_needed, distance_nm=d_nm, time_hours=time_hours))
             else:
                 # road/rail/air use km
-                d_km = haversine_km(a["lat"], a["lon"], b["lat"], b["lon"])
-                fuel_needed = d_km * consumption_per_km
-                # time heuristics
-                if mode == "air":
-                    speed = carrier_profile.get("cruise_speed_kmh", 800.0)
-                elif mode == "road":
-                    speed = 70.0
+                if distance_km_matrix is not None:
+                    d_km = float(distance_km_matrix[i][j])
+                else:
+                    d_km = haversine_km(lat[i], lon[i], lat[j], lon[j])
+                fuel_needed = d_km * consumption
+                if time_hours_matrix is not None:
+                    time_hours = float(time_hours_matrix[i][j])
                 else:
-                    speed = 40.0
-                time_hours = d_km / speed
+                    time_hours = d_km / speed
+                if wind is not None:
+                    fuel_needed *= wind[i][j]
+                    time_hours *= wind[i][j]
                 edges[i].append(Transition(to_node=j, fuel_cost=0.0, travel_fuel=fuel_needed, distance_nm=d_km / 1.852, time_hours=time_hours))
+    return edges
 
-    # Dijkstra over (node, fuel_idx)
-    # cost[state] = total USD cost incurred so far (bunkering payments + stop fees)
-    # when we 'travel' fuel is consumed but cost doesn't increment (we assume fuel was paid when bunkered)
-    start_fuel_idx = int(ceil(capacity / step_size))  # we allow starting fully bunkered
-    start_state = (origin_idx, start_fuel_idx)
-    pq = []
-    # (cost, node_idx, fuel_idx, prev_node, prev_fuel_idx, action)
-    heappush(pq, (0.0, origin_idx, start_fuel_idx, None, None, "start"))
-    dist = defaultdict(lambda: INF)
-    prev = dict()
-    dist[(origin_idx, start_fuel_idx)] = 0.0
 
-    target_state = None
+def _flat_search(n_states: int, start: int, K: int, levels: int, stride: int, max_steps: int,
+                 edges: List[List[Transition]], req_idx: List[List[List[int]]], fbin: List[int],
+                 reserve_idx: int, prices: List[float], fees: List[float], step_size: float,
+                 stop_hours: float, w_cost: float, w_hours: float, progress=None) -> Dict[str, Any]:
+    """
+    Scalar Dijkstra over packed states on preallocated flat arrays: dist/cost/hours (float64),
+    pred (int64 predecessor sid) and act (int32 action code), one slot per state.
 
+    Slots n_states + sid are the same state "at the pump": entering pays the stop fee and time,
+    each pop there adds one fuel step, and leaving is free. A pop therefore pushes O(1) refuel
+    entries instead of one per higher level, which keeps the heap small on fine fuel grids.
+    Pump slots carry the sid where refuelling started in pred, so the main layer links straight to it.
+    """
+    size = 2 * n_states
+    dist = array("d", [INF]) * size
+    cost = array("d", [0.0]) * size
+    hours = array("d", [0.0]) * size
+    pred = array("q", [-1]) * size
+    act = array("i", [ACT_NONE]) * size
+    dist[start] = 0.0
+    act[start] = ACT_START
+    pq = [(0.0, start)]
+    peak_heap = 1
+    reached = 1
+    expanded = 0
+    target = -1
     while pq:
-        cost_u, u_node, u_fuel_idx, u_prev_node, u_prev_fuel_idx, action = heappop(pq)
-        if cost_u > dist[(u_node, u_fuel_idx)]:
+        if len(pq) > peak_heap:
+            peak_heap = len(pq)
+        key, sid = heappop(pq)
+        if key > dist[sid]:
+            continue
+        expanded += 1
+        if progress is not None and expanded % PROGRESS_EVERY == 0:
+            # keys pop in order, so the current key bounds the optimum from below
+            progress({"expanded": expanded, "reached": reached, "bound": key})
+
+        if sid >= n_states:
+            # at the pump: leave at this level (a refuel action from pred) or take one more step
+            main = sid - n_states
+            if key < dist[main]:
+                dist[main] = key
+                cost[main] = cost[sid]
+                hours[main] = hours[sid]
+                pred[main] = pred[sid]
+                act[main] = ACT_REFUEL
+                heappush(pq, (key, main))
+            if (main // stride) % levels < max_steps:
+                v = sid + stride
+                c = cost[sid] + step_size * prices[main // stride // levels]
+                nk = w_cost * c + w_hours * hours[sid]
+                if nk < dist[v]:
+                    if dist[v] == INF:
+                        reached += 1
+                    dist[v] = nk
+                    cost[v] = c
+                    hours[v] = hours[sid]
+                    pred[v] = pred[sid]
+                    heappush(pq, (nk, v))
             continue
-        # if we are at destination and have at least reserve fuel (or zero is acceptable), finish
-        fuel_amount = u_fuel_idx * step_size
-        if u_node == dest_idx and fuel_amount >= reserve_amount:
-            target_state = (u_node, u_fuel_idx)
+
+        rest, k = divmod(sid, stride)
+        # all destinations reached (the reserve was checked on arrival): finish
+        if k == K:
+            target = sid
             break
+        node, f = divmod(rest, levels)
+        cost_u = cost[sid]
+        hours_u = hours[sid]
 
-        # Option 1: from node u, try to refuel to higher fuel levels (if node sells fuel)
-        node_obj = nodes[u_node]
-        price = node_obj.get("price_per_unit")
-        stop_fee = node_obj.get("stop_fee", 0.0)
-        # only allow refuel on nodes that have price (not origin/destination unless they have price)
-        if price is not None and price < 1e8:
-            # allow topping up to full capacity
-            for new_idx in range(u_fuel_idx + 1, max_steps + 1):
-                added_amount = (new_idx - u_fuel_idx) * step_size
-                added_cost = added_amount * price
-                # charge stop fee once when we first refuel at this node from a non-refuel state.
-                # To avoid charging stop_fee repeatedly for incremental actions, we'll include stop_fee only
-                # when the prev action was not a refuel at same node. For simplicity we add it the first time we refuel.
-                # Here we look at prev state; since we don't track prev action in dist key, we'll conservatively add stop_fee.
-                # This makes costs slightly pessimistic but safe.
-                new_cost = cost_u + added_cost + stop_fee
-                if new_cost < dist[(u_node, new_idx)]:
-                    dist[(u_node, new_idx)] = new_cost
-                    prev[(u_node, new_idx)] = (u_node, u_fuel_idx, "refuel", added_amount, price, stop_fee)
-                    heappush(pq, (new_cost, u_node, new_idx, u_node, u_fuel_idx, "refuel"))
-
-        # Option 2: travel to neighbors if enough fuel
-        for trans in edges[u_node]:
-            v = trans.to_node
-            required_fuel = trans.travel_fuel
-            required_idx = int(ceil(required_fuel / step_size))
-            if u_fuel_idx >= required_idx:
-                v_fuel_idx = u_fuel_idx - required_idx
-                # arriving at v may incur an implicit stop fee later if refuelling; travel itself does not add cost
-                new_cost = cost_u
-                if new_cost < dist[(v, v_fuel_idx)]:
-                    dist[(v, v_fuel_idx)] = new_cost
-                    prev[(v, v_fuel_idx)] = (u_node, u_fuel_idx, "travel", trans.distance_nm, trans.time_hours, required_fuel)
-                    heappush(pq, (new_cost, v, v_fuel_idx, u_node, u_fuel_idx, "travel"))
-
-    if target_state is None:
-        return {"error": "No feasible route found with given capacity/step/reserve."}
+        # refuel: step onto the pump (stop fee and stop time are charged once per stop)
+        if prices[node] < INF and f < max_steps:
+            v = n_states + sid
+            c = cost_u + fees[node]
+            h = hours_u + stop_hours
+            nk = w_cost * c + w_hours * h
+            if nk < dist[v]:
+                if dist[v] == INF:
+                    reached += 1
+                dist[v] = nk
+                cost[v] = c
+                hours[v] = h
+                pred[v] = sid
+                heappush(pq, (nk, v))
 
-    # reconstruct path states
-    path_states = []
-    cur = target_state
-    while cur in prev:
-        rec = prev[cur]
-        path_states.append((cur, rec))
-        cur = (rec[0], rec[1])
-    path_states = list(reversed(path_states))
-
-    # Build human-friendly plan: nodes visited and refuel actions
-    fuel_plan = []
-    visited_nodes = []
-    legs = []
-    # start from origin full tank
-    # Walk through path_states to collect refuel actions and travels
-    cur_node = origin_idx
-    cur_fuel = start_fuel_idx * step_size
-    for state, rec in path_states:
-        node_idx, fuel_idx = state
-        action = rec[2]
-        if action == "refuel":
-            added_amount = rec[3]
-            price = rec[4]
-            stop_fee = rec[5]
-            fuel_plan.append({
-                "node": nodes[node_idx]["name"],
-                "node_id": nodes[node_idx]["id"],
-                "added_amount": round(added_amount, 3),
-                "price_per_unit": float(price),
-                "cost": round(added_amount * price + stop_fee, 2),
-                "stop_fee": float(stop_fee)
-            })
-            cur_fuel += added_amount
-        elif action == "travel":
-            distance_nm = rec[3]
-            time_hours = rec[4]
-            used = rec[5]
-            prev_node_idx = rec[0]
-            legs.append({
-                "from": nodes[prev_node_idx]["name"],
-                "to": nodes[node_idx]["name"],
-                "distance_nm": round(distance_nm, 2),
-                "time_hours": round(time_hours, 2),
-                "fuel_used": round(used, 3)
-            })
-            cur_fuel -= used
-        cur_node = node_idx
-
-    # compute total cost
-    total_cost = 0.0
-    for f in fuel_plan:
-        total_cost += f["cost"]
-
-    result = {
-        "total_cost": round(total_cost, 2),
-        "fuel_plan": fuel_plan,
-        "legs": legs,
-        "path_nodes": [nodes[origin_idx]["name"]] + [p["to"] for p in legs],
-        "final_fuel_amount": cur_fuel
+        # travel along edge e if enough fuel; destinations only in itinerary order
+        cost_key = w_cost * cost_u
+        reqs = req_idx[fbin[f]][node]
+        for e, trans in enumerate(edges[node]):
+            r = reqs[e]
+            if f < r:
+                continue
+            to = trans.to_node
+            to_k = k
+            if 1 <= to <= K:
+                if to != k + 1 or f - r < reserve_idx:
+                    continue
+                to_k = to
+            h = hours_u + trans.time_hours
+            nk = cost_key + w_hours * h
+            v = (to * levels + f - r) * stride + to_k
+            if nk < dist[v]:
+                if dist[v] == INF:
+                    reached += 1
+                dist[v] = nk
+                cost[v] = cost_u
+                hours[v] = h
+                pred[v] = sid
+                act[v] = e
+                heappush(pq, (nk, v))
+
+    return {
+        "cost": cost, "hours": hours, "pred": pred, "act": act, "target": target, "reached": reached,
+        "peak_bytes": size * FLAT_BYTES_PER_STATE + peak_heap * HEAP_ENTRY_BYTES,
     }
-    return result
\ No newline at end of file
+
+
+def _csgraph_search(n_states: int, start: int, K: int, levels: int, stride: int, max_steps: int,
+                    edges: List[List[Transition]], req_idx: List[List[List[int]]], fbin: List[int],
+                    reserve_idx: int, prices: List[float], fees: List[float], step_size: float,
+                    stop_hours: float, w_cost: float, w_hours: float, progress=None) -> Dict[str, Any]:
+    """
+    Same search on the explicitly expanded state graph with scipy.sparse.csgraph.dijkstra.
+    Vertices are the S states plus a refuelling layer (S + sid): entering it pays the stop fee and
+    time, each step up costs one fuel step, leaving it is free, so refuelling needs O(levels)
+    edges per node instead of O(levels^2). Worth it for coarse grids; memory grows with the edges.
+    """
+    try:
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import dijkstra
+    except ImportError:
+        raise ValueError("solver='csgraph' needs scipy (pip install scipy)")
+
+    N = len(edges)
+    f_all = np.arange(levels, dtype=np.int64)
+    k_open = np.arange(K, dtype=np.int64)  # states with k == K are terminal and need no edges
+    bin_of = np.asarray(fbin, dtype=np.int64)
+    n_bins = len(req_idx)
+
+    def req_by_level(u, e):
+        # fuel steps edge e of u burns from every fuel level
+        return np.array([req_idx[b][u][e] for b in range(n_bins)], dtype=np.int64)[bin_of]
+
+    # count edges first so an oversized graph fails before anything is allocated
+    n_edges = 0
+    for u in range(N):
+        if prices[u] < INF:
+            n_edges += K * (3 * levels - 1)
+        for e, trans in enumerate(edges[u]):
+            r = req_by_level(u, e)
+            if 1 <= trans.to_node <= K:
+                n_edges += int((f_all >= r + reserve_idx).sum())
+            else:
+                n_edges += int((f_all >= r).sum()) * K
+    if n_edges > CSGRAPH_MAX_EDGES:
+        return {"error": f"Expanded graph too large ({n_edges} edges > {CSGRAPH_MAX_EDGES}); "
+                         f"use solver='heap' or a larger step_size."}
+
+    rows, cols, weights = [], [], []
+    for u in range(N):
+        if prices[u] < INF:
+            sid = ((u * levels + f_all[:, None]) * stride + k_open[None, :]).ravel()
+            enter = w_cost * fees[u] + w_hours * stop_hours
+            rows += [sid, n_states + sid]
+            cols += [n_states + sid, sid]
+            weights += [np.full(sid.size, enter), np.zeros(sid.size)]
+            climb = ((u * levels + f_all[:-1, None]) * stride + k_open[None, :]).ravel()
+            rows.append(n_states + climb)
+            cols.append(n_states + climb + stride)
+            weights.append(np.full(climb.size, w_cost * step_size * prices[u]))
+        for e, trans in enumerate(edges[u]):
+            r_all = req_by_level(u, e)
+            to = trans.to_node
+            if 1 <= to <= K:
+                ok = f_all >= r_all + reserve_idx
+                f, r = f_all[ok], r_all[ok]
+                src = (u * levels + f) * stride + (to - 1)
+                dst = (to * levels + f - r) * stride + to
+            else:
+                ok = f_all >= r_all
+                f, r = f_all[ok], r_all[ok]
+                src = ((u * levels + f[:, None]) * stride + k_open[None, :]).ravel()
+                dst = ((to * levels + (f - r)[:, None]) * stride + k_open[None, :]).ravel()
+            rows.append(src)
+            cols.append(dst)
+            weights.append(np.full(src.size, w_hours * trans.time_hours))
+
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+    weights = np.concatenate(weights) if weights else np.zeros(0)
+    # parallel edges (speeds) can map to the same pair of states; coo -> csr would add them up,
+    # so keep only the cheapest of each pair
+    order = np.lexsort((weights, cols, rows))
+    rows, cols, weights = rows[order], cols[order], weights[order]
+    first = np.ones(rows.size, dtype=bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+    rows, cols, weights = rows[first], cols[first], weights[first]
+    build_bytes = rows.nbytes + cols.nbytes + weights.nbytes + order.nbytes + first.nbytes
+    graph = csr_matrix((weights, (rows, cols)), shape=(2 * n_states, 2 * n_states))
+    del rows, cols, weights, order, first
+
+    if progress is not None:
+        progress({"expanded": 0, "reached": 0, "bound": 0.0, "edges": int(graph.nnz)})
+    dist, predecessors = dijkstra(graph, directed=True, indices=start, return_predecessors=True)
+    peak_bytes = build_bytes + graph.data.nbytes + graph.indices.nbytes + graph.indptr.nbytes + \
+        dist.nbytes + predecessors.nbytes
+
+    ends = (K * levels + f_all) * stride + K
+    best = int(ends[np.argmin(dist[ends])])
+    out = {"cost": {}, "hours": {}, "pred": {}, "act": {}, "target": -1,
+           "reached": int(np.isfinite(dist[:n_states]).sum()), "peak_bytes": peak_bytes}
+    if not np.isfinite(dist[best]):
+        return out
+
+    # walk the predecessor tree back to the start and replay it on the main layer
+    path = [best]
+    while path[-1] != start:
+        path.append(int(predecessors[path[-1]]))
+    path = [v for v in reversed(path) if v < n_states]
+    cost, hours, pred, act = out["cost"], out["hours"], out["pred"], out["act"]
+    cost[start], hours[start], pred[start], act[start] = 0.0, 0.0, -1, ACT_START
+    for prev, sid in zip(path, path[1:]):
+        p_node, p_f = divmod(prev // stride, levels)
+        node, f = divmod(sid // stride, levels)
+        if node == p_node:
+            cost[sid] = cost[prev] + fees[node] + ((f - p_f) * step_size) * prices[node]
+            hours[sid] = hours[prev] + stop_hours
+            act[sid] = ACT_REFUEL
+        else:
+            reqs = req_idx[fbin[p_f]][p_node]
+            e = min((e for e, t in enumerate(edges[p_node]) if t.to_node == node and reqs[e] == p_f - f),
+                    key=lambda e: edges[p_node][e].time_hours)
+            cost[sid] = cost[prev]
+            hours[sid] = hours[prev] + edges[p_node][e].time_hours
+            act[sid] = e
+        pred[sid] = prev
+    out["target"] = best
+    return out
+
+
+def prepare_candidates(waypoints: List[Tuple[float, float]], mode: str, max_nodes_considered: int = 200,
+                       db=None) -> Candidates:
+    """
+    Candidate nodes and their distance matrix for an itinerary; nothing here depends on the carrier.
+    Node layout: 0 = origin, 1..K = destinations in order, K+1.. = refuel candidates.
+    """
+    if db is None:
+        db = next(get_db())
+    nodes = _node_store_for_mode(db, mode)
+
+    # limit nodes considered to keep runtime reasonable (virtual nodes are always kept)
+    if len(nodes) > max_nodes_considered:
+        nodes = nodes.head(max_nodes_considered)
+
+    # origin and destinations are virtual nodes that sell no fuel
+    K = len(waypoints) - 1
+    virtual = [("origin", "Origin", waypoints[0][0], waypoints[0][1])]
+    for k in range(1, K + 1):
+        name = "Destination" if K == 1 else f"Destination {k}"
+        virtual.append((f"destination:{k}", name, waypoints[k][0], waypoints[k][1]))
+    nodes = nodes.prepend_virtual(virtual)
+
+    if mode == "ocean":
+        return Candidates(nodes, _ocean_distance_matrix(db, nodes), None)
+    if mode in ("road", "rail"):
+        if mode == "road":
+            km, hours = _network_matrices(nodes, mode, get_road_network())
+        else:
+            tables = (get_distance_matrix("rail_terminal"), get_distance_matrix("rail_terminal_time"))
+            km, hours = _network_matrices(nodes, mode, get_rail_network(),
+                                          tables if nodes.kind == "rail_terminal" and None not in tables else None)
+        if km is not None:
+            return Candidates(nodes, None, km, hours)
+    return Candidates(nodes, None, _great_circle_distance_matrix(nodes, "airport" if mode == "air" else None))
+
+
+def find_optimal_refuel_route(origin_coord: Tuple[float, float],
+                              dest_coord: Tuple[float, float],
+                              carrier_profile: Dict[str, Any],
+                              mode: str,
+                              fuel_unit: str,
+                              step_size: float = 1.0,
+                              reserve: float = 0.1,
+                              max_nodes_considered: int = 200,
+                              initial_fuel: float = None,
+                              objective: str = "cheapest",
+                              time_value_usd_per_hour: float = 0.0,
+                              optimize_speed: bool = False,
+                              max_hours: float = None,
+                              max_stops: int = None,
+                              port_opening_hours: Tuple[float, float] = None,
+                              solver: str = "heap",
+                              max_states: int = 5_000_000,
+                              progress=None) -> Dict[str, Any]:
+    """
+    origin_coord/dest_coord: (lat, lon)
+    carrier_profile: contains fuel_capacity (tons or liters) and consumption per distance:
+        for ocean: consumption_tons_per_nm
+        for road/rail: consumption_l_per_km or consumption_l_per_100km
+        for air: consumption_kg_per_hr + conversion to liters handled outside or provide consumption_l_per_km
+    fuel_unit: 'tons' or 'liters'
+    step_size: in same unit as fuel_unit (e.g., 1 ton or 100 liters)
+    initial_fuel: fuel on board at the origin; defaults to a full tank
+    objective, max_hours, max_stops, port_opening_hours, solver, max_states, progress: see
+    find_optimal_itinerary_refuel_route
+    """
+    return find_optimal_itinerary_refuel_route(
+        waypoints=[origin_coord, dest_coord],
+        carrier_profile=carrier_profile,
+        mode=mode,
+        fuel_unit=fuel_unit,
+        step_size=step_size,
+        reserve=reserve,
+        max_nodes_considered=max_nodes_considered,
+        initial_fuel=initial_fuel,
+        objective=objective,
+        time_value_usd_per_hour=time_value_usd_per_hour,
+        optimize_speed=optimize_speed,
+        max_hours=max_hours,
+        max_stops=max_stops,
+        port_opening_hours=port_opening_hours,
+        solver=solver,
+        max_states=max_states,
+        progress=progress,
+    )
+
+
+def find_optimal_itinerary_refuel_route(waypoints: List[Tuple[float, float]],
+                                        carrier_profile: Dict[str, Any],
+                                        mode: str,
+                                        fuel_unit: str,
+                                        step_size: float = 1.0,
+                                        reserve: float = 0.1,
+                                        max_nodes_considered: int = 200,
+                                        initial_fuel: float = None,
+                                        objective: str = "cheapest",
+                                        time_value_usd_per_hour: float = 0.0,
+                                        max_labels_per_state: int = 8,
+                                        max_labels: int = 500000,
+                                        pareto_epsilon: float = 0.0,
+                                        pareto_max_fuel_levels: int = 250,
+                                        optimize_speed: bool = False,
+                                        max_hours: float = None,
+                                        max_stops: int = None,
+                                        arrival_windows: List[Tuple[float, float]] = None,
+                                        departure_hour: float = 0.0,
+                                        port_opening_hours: Tuple[float, float] = None,
+                                        port_opening_hours_by_node: Dict[str, Tuple[float, float]] = None,
+                                        solver: str = "heap",
+                                        max_states: int = 5_000_000,
+                                        progress=None,
+                                        candidates: "Candidates" = None,
+                                        payload_tonnes: float = None,
+                                        price_overrides: Dict[str, float] = None) -> Dict[str, Any]:
+    """
+    Jointly optimize refuelling over a whole itinerary origin -> d1 -> ... -> dK.
+
+    waypoints: [(lat, lon)] with the origin first followed by the destinations in visiting order.
+    initial_fuel: fuel on board at the origin (same unit as fuel_unit); defaults to a full tank.
+    The reserve fraction must be on board on arrival at every destination.
+    objective: "cheapest" | "fastest" | "weighted" (cost + time_value_usd_per_hour * hours) | "pareto".
+    max_labels_per_state / max_labels / pareto_epsilon / pareto_max_fuel_levels bound the pareto
+    search (see module notes).
+    optimize_speed: ocean only; choose a speed per segment from the carrier's speed options.
+    max_hours: arrival deadline at the last destination, in hours after departure.
+    max_stops: most refuelling stops.
+    arrival_windows: one (earliest, latest) per destination in hours after departure; latest may be None.
+    departure_hour: hour of day at departure, the clock of the opening hours.
+    port_opening_hours: (open_hour, close_hour) for every refuelling node; port_opening_hours_by_node
+    overrides it per node id ("port:12") or name.
+    solver: "heap" (flat-array Dijkstra) or "csgraph" (scipy on the expanded graph); scalar objectives only.
+    max_states: states (node x fuel level x destinations reached) a scalar search may allocate; larger
+    problems fail immediately with an error instead of running out of memory.
+    progress: optional callable(dict) called every PROGRESS_EVERY expanded states/labels with
+    expanded, reached (or labels and frontier) and bound, the current key.
+    candidates: prepare_candidates() for these waypoints and mode, to share across solves.
+    payload_tonnes: cargo on board; with a carrier load_curve (consumption.py) edge fuel depends on
+    it and on the fuel on board. None = fully loaded.
+    price_overrides: node id -> fuel price for this solve only (price scenarios, see price_risk.py).
+    """
+    if len(waypoints) < 2:
+        raise ValueError("Itinerary needs an origin and at least one destination")
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective {objective!r}; expected one of {', '.join(OBJECTIVES)}")
+    if arrival_windows is not None and len(arrival_windows) != len(waypoints) - 1:
+        raise ValueError("arrival_windows needs one (earliest, latest) entry per destination")
+
+    if candidates is None:
+        candidates = prepare_candidates(waypoints, mode, max_nodes_considered)
+    nodes = candidates.nodes
+    K = len(waypoints) - 1
+    N = len(nodes)
+    origin_idx = 0
+
+    consumption, capacity = _consumption_and_capacity(mode, carrier_profile)
+
+    # arrival windows per destination (index 1..K); the deadline tightens the last one
+    earliest = [0.0] * (K + 1)
+    latest = [INF] * (K + 1)
+    for k, (lo, hi) in enumerate(arrival_windows or [], start=1):
+        earliest[k] = float(lo or 0.0)
+        latest[k] = INF if hi is None else float(hi)
+    if max_hours is not None:
+        latest[K] = min(latest[K], float(max_hours))
+
+    # daily opening hours of each refuelling node (None = always open)
+    by_node = port_opening_hours_by_node or {}
+    opening = [by_node.get(nodes.node_id(i), by_node.get(nodes.names[i], port_opening_hours)) for i in range(N)]
+
+    # plain lists for the search loop (indexing a list is much cheaper than a numpy scalar)
+    # (missing and zero prices mean the node sells no fuel)
+    node_price = _node_prices(nodes, price_overrides)
+    prices = np.where(np.isnan(node_price) | (node_price <= 0.0), INF, node_price).tolist()
+    fees = np.nan_to_num(nodes.fee).tolist()
+    stop_cap = INF if max_stops is None else max_stops
+
+    # pareto and constrained searches keep several labels per state, so they use a coarser fuel grid
+    constrained = (max_stops is not None or any(h < INF for h in latest) or any(earliest)
+                   or any(w is not None for w in opening))
+    multi = objective == "pareto" or constrained
+    if multi and capacity / step_size > pareto_max_fuel_levels:
+        step_size = capacity / pareto_max_fuel_levels
+
+    # discretize fuel levels: indices 0..M corresponding to amount = idx * step_size
+    max_steps = int(ceil(capacity / step_size))
+    # require reserve
+    reserve_amount = reserve * capacity
+
+    # Build adjacency once; it is shared by every leg of the itinerary
+    speeds = speed_options(carrier_profile) if optimize_speed and mode == "ocean" else None
+    wind = get_wind_field() if mode == "air" else None
+    edges = _build_edges(nodes, mode, carrier_profile, consumption, candidates.distance_nm,
+                         candidates.distance_km, speeds, candidates.time_hours,
+                         _air_wind_factors(nodes, carrier_profile, wind) if wind is not None else None)
+
+    # Label-setting search over states (node, fuel_idx, k) where k = number of destinations reached.
+    # A label is a partial plan with (cost, hours): cost = USD incurred so far (bunkering + stop fees;
+    # travel adds no cost, fuel was paid when bunkered), hours = travel time + refuelling stops.
+    # Scalar objectives keep one label per state (plain Dijkstra on the objective key). "pareto" and
+    # constrained searches keep every non-dominated label per state, up to max_labels_per_state; a
+    # constrained search returns its first (best) plan that satisfies the constraints. Labels also
+    # carry the refuelling stops made so far.
+    if initial_fuel is None:
+        start_fuel_idx = max_steps  # we allow starting fully bunkered
+    else:
+        start_fuel_idx = min(max_steps, int(initial_fuel // step_size))
+    stop_hours = _refuel_stop_hours(mode, carrier_profile)
+    pareto = objective == "pareto"
+    slack = 1.0 + pareto_epsilon
+
+    # objectives minimise w_cost * USD + w_hours * hours; both only grow along a path
+    w_cost, w_hours = {
+        "fastest": (0.0, 1.0),
+        "weighted": (1.0, time_value_usd_per_hour),
+    }.get(objective, (1.0, 0.0))
+
+    if multi:
+        # lower bound on the hours still needed from (node, k): fastest travel through the remaining
+        # destinations ignoring fuel. A label that cannot make the deadline, or beat the fastest plan
+        # found so far, even with that bound is dropped (plans are found in objective order).
+        hop = np.full((N, N), INF)
+        np.fill_diagonal(hop, 0.0)
+        for u in range(N):
+            for t in edges[u]:
+                hop[u, t.to_node] = min(hop[u, t.to_node], t.time_hours)
+        for via in range(N):
+            np.minimum(hop, hop[:, via, None] + hop[None, via, :], out=hop)
+        # from destination j onwards (destination nodes are 1..K)
+        after = [0.0] * (K + 1)
+        for j in range(K - 1, 0, -1):
+            after[j] = hop[j, j + 1] + after[j + 1]
+        remaining = np.zeros((N, K + 1))
+        for k in range(K):
+            remaining[:, k] = hop[:, k + 1] + after[k + 1]
+        remaining = remaining.tolist()
+        # latest hours at (node, k) that can still make every later window: at destination j the
+        # limit is min over later windows of (latest - fastest chain there); elsewhere one hop less
+        at_dest = [INF] * (K + 1)
+        for j in range(K - 1, 0, -1):
+            at_dest[j] = min(latest[j + 1], at_dest[j + 1]) - hop[j, j + 1]
+        limit = np.full((N, K + 1), INF)
+        for k in range(K):
+            limit[:, k] = min(latest[k + 1], at_dest[k + 1]) - hop[:, k + 1]
+        limit = limit.tolist()
+
+    # states are packed into one int, sid = (node * levels + fuel_idx) * (K + 1) + k, so labels and
+    # heap entries hold only atoms (cheap to hash, and untracked by the garbage collector)
+    levels = max_steps + 1
+    stride = K + 1
+    n_states = N * levels * stride
+    start = (origin_idx * levels + start_fuel_idx) * stride
+    # fuel each edge burns and the steps it needs, per bin of departure fuel levels: one bin for a
+    # fixed-rate carrier; with a load curve LOAD_BINS bins, each charged the burn from its fullest
+    # (heaviest) level, so every plan found stays within the fuel on board. Evaluated for all edges
+    # and bins at once; the search picks the bin once per state, not per edge.
+    n_bins = min(LOAD_BINS, levels) if has_load_curve(carrier_profile) else 1
+    fbin = [f * n_bins // levels for f in range(levels)]
+    top_fuel = np.minimum(np.array([((b + 1) * levels - 1) // n_bins for b in range(n_bins)]) * step_size, capacity)
+    laden = np.array([t.travel_fuel for out in edges for t in out], dtype=np.float64)
+    burn = leg_burn(carrier_profile, mode, laden[None, :], payload_tonnes, top_fuel[:, None])
+    need = np.ceil(burn / step_size).astype(np.int64).tolist()
+    burn = burn.tolist()
+    bounds = np.cumsum([0] + [len(out) for out in edges]).tolist()
+    req_idx = [[row[bounds[u]:bounds[u + 1]] for u in range(N)] for row in need]
+    burn_of = [[row[bounds[u]:bounds[u + 1]] for u in range(N)] for row in burn]
+    # the lowest level that keeps the reserve on arrival
+    reserve_idx = int(ceil(reserve_amount / step_size))
+    while reserve_idx > 0 and (reserve_idx - 1) * step_size >= reserve_amount:
+        reserve_idx -= 1
+    while reserve_idx * step_size < reserve_amount:
+        reserve_idx += 1
+
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver {solver!r}; expected one of {', '.join(SOLVERS)}")
+    if multi and solver == "csgraph":
+        raise ValueError("solver='csgraph' only supports cheapest/fastest/weighted without constraints")
+
+    truncated = False
+    targets = []  # labels that reached the last destination, in key order
+    if not multi:
+        # one label per state on preallocated arrays: fail before allocating an oversized state space
+        if n_states > max_states:
+            return {"error": f"State space too large ({n_states} states > max_states {max_states}); "
+                             f"use a larger step_size or fewer candidate nodes."}
+        search = _csgraph_search if solver == "csgraph" else _flat_search
+        core = search(n_states, start, K, levels, stride, max_steps, edges, req_idx, fbin, reserve_idx,
+                      prices, fees, step_size, stop_hours, w_cost, w_hours, progress)
+        if "error" in core:
+            return core
+        if core["target"] >= 0:
+            targets.append(core["target"])
+        cost_of, hours_of, pred_of, act_of = core["cost"], core["hours"], core["pred"], core["act"]
+        labels_created = core["reached"]
+        peak_bytes = core["peak_bytes"]
+
+        def label(lid):
+            # (cost, hours, sid, parent, wait, action); scalar label ids are the sids
+            return cost_of[lid], hours_of[lid], lid, pred_of[lid], 0.0, act_of[lid]
+    else:
+        # labels: id -> (cost, hours, sid, parent id, stops, wait hours before this action, action code).
+        # Labels get sequential ids; a state keeps the ids of its live (non-dominated) labels.
+        lab = {}
+        alive = []  # label id -> still non-dominated
+        primary = []  # label id -> objective key
+        labels = defaultdict(list)  # sid -> ids of its live labels
+        pq = []
+        best_target_hours = INF
+        peak_heap = 1
+        expanded = 0
+
+        def push(cost, hours, sid, parent, stops, wait, action):
+            nonlocal truncated
+            key = w_cost * cost + w_hours * hours
+            rest, k = divmod(sid, stride)
+            node = rest // levels
+            if hours > limit[node][k] or hours + remaining[node][k] >= best_target_hours:
+                return
+            # dominance on (objective key, hours, stops when limited); for pareto the key is the cost
+            existing = labels[sid]
+            for j in existing:
+                if primary[j] <= key * slack and lab[j][1] <= hours * slack and (max_stops is None or lab[j][4] <= stops):
+                    return
+            for j in existing:
+                if key <= primary[j] and hours <= lab[j][1] and (max_stops is None or stops <= lab[j][4]):
+                    alive[j] = False
+            existing[:] = [j for j in existing if alive[j]]
+            if len(existing) >= max_labels_per_state:
+                return
+            if len(alive) >= max_labels:
+                truncated = True
+                return
+            lid = len(alive)
+            lab[lid] = (cost, hours, sid, parent, stops, wait, action)
+            alive.append(True)
+            primary.append(key)
+            existing.append(lid)
+            heappush(pq, (key, hours, lid))
+
+        push(0.0, 0.0, start, -1, 0, 0.0, ACT_START)
+
+        while pq:
+            if len(pq) > peak_heap:
+                peak_heap = len(pq)
+            key, _, lid = heappop(pq)
+            if not alive[lid]:
+                continue
+            expanded += 1
+            if progress is not None and expanded % PROGRESS_EVERY == 0:
+                progress({"expanded": expanded, "labels": len(alive), "frontier": len(targets), "bound": key})
+            cost_u, hours_u, sid, _, stops_u, _, _ = lab[lid]
+            u_rest, u_k = divmod(sid, stride)
+            u_node, u_fuel_idx = divmod(u_rest, levels)
+            # all destinations reached (the reserve was checked on arrival): finish
+            if u_k == K:
+                if not pareto:
+                    targets.append(lid)
+                    break
+                if hours_u < best_target_hours:
+                    targets.append(lid)
+                    best_target_hours = hours_u
+                continue
+            if hours_u + remaining[u_node][u_k] >= best_target_hours:
+                continue
+
+            # Option 1: from node u, try to refuel to higher fuel levels (if node sells fuel)
+            price = prices[u_node]
+            stop_fee = fees[u_node]
+            # only allow refuel on nodes that sell fuel (virtual origin/destination nodes do not)
+            if price < INF and stops_u < stop_cap:
+                # allow topping up to full capacity
+                # stop fee and stop time are charged with every refuel action; a single action can
+                # reach any level, so an optimal plan refuels once per stop.
+                wait = _wait_until_open(departure_hour + hours_u, opening[u_node]) if opening[u_node] else 0.0
+                base_cost = cost_u + stop_fee
+                new_hours = hours_u + wait + stop_hours
+                # consecutive fuel levels of a node are `stride` apart
+                for new_idx in range(u_fuel_idx + 1, max_steps + 1):
+                    added_amount = (new_idx - u_fuel_idx) * step_size
+                    push(base_cost + added_amount * price, new_hours, sid + (new_idx - u_fuel_idx) * stride, lid,
+                         stops_u + 1, wait, ACT_REFUEL)
+
+            # Option 2: travel to neighbors if enough fuel
+            reqs = req_idx[fbin[u_fuel_idx]][u_node]
+            for e, trans in enumerate(edges[u_node]):
+                v = trans.to_node
+                v_k = u_k
+                if 1 <= v <= K:
+                    # destinations can only be entered in itinerary order
+                    if v != u_k + 1:
+                        continue
+                    v_k = v
+                required_idx = reqs[e]
+                if u_fuel_idx >= required_idx:
+                    v_fuel_idx = u_fuel_idx - required_idx
+                    arrival = hours_u + trans.time_hours
+                    wait = 0.0
+                    if v_k != u_k:
+                        if v_fuel_idx < reserve_idx or arrival > latest[v_k]:
+                            continue
+                        # early: wait for the arrival window to open
+                        wait = max(0.0, earliest[v_k] - arrival)
+                    push(cost_u, arrival + wait, (v * levels + v_fuel_idx) * stride + v_k, lid, stops_u, wait, e)
+
+        labels_created = len(alive)
+        peak_bytes = len(alive) * LABEL_BYTES + peak_heap * HEAP_ENTRY_BYTES
+
+        def label(lid):
+            cost, hours, sid, parent, _, wait, action = lab[lid]
+            return cost, hours, sid, parent, wait, action
+
+    if not targets:
+        if constrained and not truncated:
+            unmet = []
+            if max_hours is not None:
+                unmet.append(f"arrival within {max_hours:g} hours")
+            if arrival_windows:
+                unmet.append("destination arrival windows")
+            if max_stops is not None:
+                unmet.append(f"at most {max_stops} refuel stops")
+            if any(w is not None for w in opening):
+                unmet.append("port opening hours")
+            return {"error": f"No feasible route (capacity/step/reserve) meets the constraints: {', '.join(unmet)}."}
+        if truncated:
+            return {"error": f"Label budget ({max_labels}) exhausted before reaching the destination."}
+        return {"error": "No feasible route found with given capacity/step/reserve."}
+
+    if speeds is not None:
+        service_per_nm = float(tons_per_nm(carrier_profile, [carrier_profile.get("service_speed_knots", 14.0)])[0])
+
+    def plan_for(target):
+        # reconstruct the label chain back to the origin
+        chain = []
+        cur = target
+        while label(cur)[5] != ACT_START:
+            chain.append(cur)
+            cur = label(cur)[3]
+        chain.reverse()
+
+        # Build human-friendly plan: nodes visited and refuel actions
+        fuel_plan = []
+        legs = []
+        cur_fuel = start_fuel_idx * step_size
+        service_fuel = 0.0
+        waited = 0.0
+        for cur in chain:
+            _, _, sid, parent, wait, action = label(cur)
+            waited += wait
+            rest, k = divmod(sid, stride)
+            node_idx, fuel_idx = divmod(rest, levels)
+            rest, prev_k = divmod(label(parent)[2], stride)
+            prev_node_idx, prev_fuel_idx = divmod(rest, levels)
+            if action == ACT_REFUEL:
+                added_amount = (fuel_idx - prev_fuel_idx) * step_size
+                price = prices[node_idx]
+                stop_fee = fees[node_idx]
+                fuel_plan.append({
+                    "node": nodes.names[node_idx],
+                    "node_id": nodes.node_id(node_idx),
+                    "lat": float(nodes.lat[node_idx]),
+                    "lon": float(nodes.lon[node_idx]),
+                    "added_amount": round(added_amount, 3),
+                    "price_per_unit": float(price),
+                    "cost": round(added_amount * price + stop_fee, 2),
+                    "stop_fee": float(stop_fee),
+                    "leg_index": k
+                })
+                if wait:
+                    fuel_plan[-1]["wait_hours"] = round(wait, 2)
+                cur_fuel += added_amount
+            else:
+                # travel: the action code is the edge index in edges[prev_node]
+                trans = edges[prev_node_idx][action]
+                used = burn_of[fbin[prev_fuel_idx]][prev_node_idx][action]
+                leg = {
+                    "from": nodes.names[prev_node_idx],
+                    "to": nodes.names[node_idx],
+                    "distance_nm": round(trans.distance_nm, 2),
+                    "time_hours": round(trans.time_hours, 2),
+                    "fuel_used": round(used, 3),
+                    "leg_index": prev_k
+                }
+                if wait:
+                    leg["wait_hours"] = round(wait, 2)
+                if trans.speed_knots is not None:
+                    leg["speed_knots"] = trans.speed_knots
+                    # at the same load as the chosen speed
+                    load = used / trans.travel_fuel if trans.travel_fuel else 1.0
+                    service_fuel += trans.distance_nm * service_per_nm * load
+                legs.append(leg)
+                cur_fuel -= used
+
+        # compute total cost
+        total_cost = 0.0
+        for f in fuel_plan:
+            total_cost += f["cost"]
+
+        plan = {
+            "total_cost": round(total_cost, 2),
+            "total_time_hours": round(label(target)[1], 2),
+            "refuel_hours": round(stop_hours * len(fuel_plan), 2),
+            "wait_hours": round(waited, 2),
+            "fuel_plan": fuel_plan,
+            "legs": legs,
+            "path_nodes": [nodes.names[origin_idx]] + [p["to"] for p in legs],
+            "initial_fuel_amount": start_fuel_idx * step_size,
+            "final_fuel_amount": cur_fuel
+        }
+        if speeds is not None:
+            # same track sailed at service speed throughout
+            used = sum(leg["fuel_used"] for leg in legs)
+            plan["fuel_at_service_speed"] = round(service_fuel, 3)
+            plan["fuel_saved_vs_service_speed"] = round(service_fuel - used, 3) + 0.0  # no "-0.0"
+        return plan
+
+    # the first target is the cheapest plan (pareto) or the optimum of the scalar objective
+    result = plan_for(targets[0])
+    result["objective"] = objective
+    result["solver"] = "labels" if multi else solver
+    result["labels_created"] = labels_created
+    result["states"] = n_states
+    result["peak_memory_mb"] = round(peak_bytes / 1e6, 1)
+    result["truncated"] = truncated
+    result["step_size"] = step_size
+    if pareto:
+        # frontier ordered from cheapest to fastest
+        result["pareto"] = [plan_for(t) for t in targets]
+    return result
+
+
+def carrier_payload_tonnes(carrier_profile: Dict[str, Any]):
+    """Cargo the carrier can lift in tonnes (max_payload_kg or deadweight_tons); None if unknown."""
+    if carrier_profile.get("max_payload_kg") is not None:
+        return carrier_profile["max_payload_kg"] / 1000.0
+    if carrier_profile.get("deadweight_tons") is not None:
+        return float(carrier_profile["deadweight_tons"])
+    return None
+
+
+def _carrier_score(objective: str, cost: float, hours: float, time_value_usd_per_hour: float) -> float:
+    if objective == "fastest":
+        return hours
+    if objective == "weighted":
+        return cost + time_value_usd_per_hour * hours
+    # cheapest, and pareto runs are ranked on their cheapest plan
+    return cost
+
+
+def rank_carriers(waypoints: List[Tuple[float, float]],
+                  carrier_profiles: Dict[str, Dict[str, Any]],
+                  mode: str,
+                  fuel_unit: str,
+                  vehicles=None,
+                  cargo_tonnes: float = None,
+                  objective: str = "cheapest",
+                  time_value_usd_per_hour: float = 0.0,
+                  optimize_speed: bool = False,
+                  alternatives: int = 3,
+                  max_nodes_considered: int = 200,
+                  candidates: Candidates = None,
+                  price_overrides: Dict[str, float] = None,
+                  **solve_kwargs) -> Dict[str, Any]:
+    """
+    Evaluate several carrier models of one mode on the same itinerary and rank them.
+
+    The candidate nodes and their distance matrix are built once and shared by every carrier.
+    vehicles: optional callable(profile) -> (vehicles needed for the cargo, reason); 0 vehicles
+    means the carrier cannot take the cargo. Costs are for the whole fleet of that carrier.
+    cargo_tonnes: total cargo, spread evenly over the fleet (payload_tonnes of each solve).
+    Carriers that cannot take the cargo, or whose tank range is shorter than the longest hop
+    between fuel-selling nodes that every route has to make, are dropped without a search. The
+    rest get a lower bound on their score from the shortest distance through the waypoints
+    (fuel at the lowest consumption and cheapest candidate price; hours at top speed) and are
+    solved in bound order; once `alternatives` + 1 carriers are solved, a carrier whose bound
+    cannot beat any of them is reported as pruned instead of being solved.
+
+    Score: the objective's value, where cost also charges fuel taken from the tank (on board at the
+    start minus left at the end) at the cheapest candidate price, so a carrier is not preferred just
+    because it leaves with more free fuel on board. price_overrides (node id -> price) apply to the
+    bound, that valuation and every solve alike. solve_kwargs go to
+    find_optimal_itinerary_refuel_route.
+
+    Returns {"best": carrier key or None, "result": solver result of the best carrier (None if no
+    carrier is feasible), "ranking": option dicts, solved ones best first, then pruned, then infeasible}.
+    """
+    if candidates is None:
+        candidates = prepare_candidates(waypoints, mode, max_nodes_considered)
+    nodes = candidates.nodes
+    unit = "nm" if mode == "ocean" else "km"
+    D = np.asarray(candidates.distance_nm if mode == "ocean" else candidates.distance_km, dtype=np.float64)
+    N = len(nodes)
+    K = len(waypoints) - 1
+
+    # shortest distance through the waypoints, and the longest hop between fuel-selling nodes that
+    # every route has to make (bottleneck path), both on the shared matrix
+    shortest = D.copy()
+    np.fill_diagonal(shortest, 0.0)
+    for via in range(N):
+        np.minimum(shortest, shortest[:, via, None] + shortest[None, via, :], out=shortest)
+    # the prices every solve below uses, so the range check, bound and tank valuation agree with them
+    node_price = _node_prices(nodes, price_overrides)
+    sells = ~np.isnan(node_price) & (np.nan_to_num(node_price) > 0.0)
+    bottleneck = D.copy()
+    for via in np.flatnonzero(sells).tolist():
+        np.minimum(bottleneck, np.maximum(bottleneck[:, via, None], bottleneck[None, via, :]), out=bottleneck)
+    route_distance = float(sum(shortest[k, k + 1] for k in range(K)))
+    route_hours = None
+    if candidates.time_hours is not None:
+        # network travel times do not depend on the carrier: fastest route through the waypoints
+        fastest = np.asarray(candidates.time_hours, dtype=np.float64).copy()
+        np.fill_diagonal(fastest, 0.0)
+        for via in range(N):
+            np.minimum(fastest, fastest[:, via, None] + fastest[None, via, :], out=fastest)
+        route_hours = float(sum(fastest[k, k + 1] for k in range(K)))
+    longest_hop = float(max(bottleneck[k, k + 1] for k in range(K)))
+    min_price = float(node_price[sells].min()) if sells.any() else 0.0
+    wind = get_wind_field() if mode == "air" else None
+
+    options = {}
+    queue = []
+    for key, profile in carrier_profiles.items():
+        option = {"carrier_model": key, "name": profile.get("name")}
+        options[key] = option
+        fleet, reason = vehicles(profile) if vehicles is not None else (1, None)
+        if fleet < 1:
+            option.update(status="infeasible", reason=reason)
+            continue
+        option["vehicles"] = fleet
+        try:
+            consumption, capacity = _consumption_and_capacity(mode, profile)
+        except (TypeError, ValueError) as e:
+            option.update(status="infeasible", reason=str(e))
+            continue
+        speed = _travel_speed(mode, profile)
+        if optimize_speed and mode == "ocean":
+            speeds = speed_options(profile)
+            consumption = float(tons_per_nm(profile, speeds).min())
+            speed = float(speeds.max())
+        # lightest load of the carrier's load curve, so range and bound stay optimistic
+        consumption *= min_load_factor(profile)
+        if wind is not None:
+            # a tailwind of the strongest wind on every hop is the best any air route can do
+            lowest = wind.min_factor(speed, flight_level(profile))
+            consumption *= lowest
+            speed /= lowest
+        if capacity < longest_hop * consumption:
+            option.update(status="infeasible",
+                          reason=f"range {capacity / consumption:.0f} {unit} is shorter than an unavoidable "
+                                 f"{longest_hop:.0f} {unit} hop")
+            continue
+        bound_hours = route_hours if route_hours is not None else route_distance / speed
+        bound = _carrier_score(objective, fleet * route_distance * consumption * min_price, bound_hours,
+                               time_value_usd_per_hour)
+        option["bound"] = round(bound, 2)
+        queue.append((bound, key, profile, fleet))
+
+    queue.sort(key=lambda q: q[0])
+    results = {}
+    scores = []
+    for bound, key, profile, fleet in queue:
+        option = options[key]
+        if len(scores) > alternatives and bound >= sorted(scores)[alternatives]:
+            option.update(status="pruned", reason="lower bound is no better than the ranked carriers")
+            continue
+        result = find_optimal_itinerary_refuel_route(
+            waypoints, profile, mode, fuel_unit, max_nodes_considered=max_nodes_considered, objective=objective,
+            time_value_usd_per_hour=time_value_usd_per_hour, optimize_speed=optimize_speed, candidates=candidates,
+            payload_tonnes=None if cargo_tonnes is None else cargo_tonnes / fleet, price_overrides=price_overrides,
+            **solve_kwargs)
+        if "error" in result:
+            option.update(status="infeasible", reason=result["error"])
+            continue
+        used_from_tank = result["initial_fuel_amount"] - result["final_fuel_amount"]
+        # the vehicles of a fleet travel together, so hours are per vehicle and costs add up
+        cost = fleet * (result["total_cost"] + used_from_tank * min_price)
+        score = _carrier_score(objective, cost, result["total_time_hours"], time_value_usd_per_hour)
+        option.update(status="ok", total_cost_usd=round(fleet * result["total_cost"], 2),
+                      total_time_hours=result["total_time_hours"], score=round(score, 2))
+        results[key] = result
+        scores.append(score)
+
+    order = {"ok": 0, "pruned": 1, "infeasible": 2}
+    ranking = sorted(options.values(), key=lambda o: (order[o["status"]], o.get("score", o.get("bound", INF))))
+    best = ranking[0]["carrier_model"] if ranking and ranking[0]["status"] == "ok" else None
+    return {"best": best, "result": results.get(best), "ranking": ranking}
@@ -0,0 +1,460 @@
+"""
+Road routing for truck legs on a contraction hierarchy built from a local OSM extract.
+
+Road legs used the great-circle distance at a flat 70 km/h, which understates both distance and
+time. This module builds a compact road graph from an OpenStreetMap extract and answers queries
+on a contraction hierarchy (contraction.py) that is preprocessed once and saved to disk.
+
+Builder (python -m app.services.road_network build --osm extract.osm.pbf):
+- keeps ways whose highway class has a truck speed in TRUCK_SPEEDS_KMH, drops ways closed to
+  heavy goods vehicles (hgv/motor_vehicle/access = no, private...), honours oneway and roundabouts;
+- speed per way: the class speed, capped by maxspeed (maxspeed:hgv when tagged) and by
+  TRUCK_MAX_SPEED_KMH;
+- graph nodes are way ends and intersections only: shape points in between are folded into the
+  edge's length (km) and time (hours), which typically removes 80-90% of the OSM nodes;
+- keeps the largest connected component, so every snapped point can reach every other;
+- contracts on travel time with the length carried along shortcuts, and saves everything to
+  ROAD_NETWORK_PATH (default data/road_network.npz), swapped in atomically.
+Reads .osm / .osm.gz / .osm.bz2 with the stdlib (two streaming passes) and .pbf with pyosmium
+(optional dependency).
+
+Queries: a free point (origin, destination, fuel station) attaches to its SNAP_K nearest road
+nodes within SNAP_MAX_KM, with an access leg at ACCESS_SPEED_KMH. Point-to-point queries are a
+bidirectional CH search (about a millisecond); one-to-many and many-to-many use CH buckets, with
+each point's upward search space cached. Points the network does not cover return None / INF, and
+callers fall back to the great circle.
+
+The builder and RoutingNetwork take the way profile and snapping radius as parameters, so other
+OSM networks reuse them (rail_network.py).
+
+API:
+    build_road_network(osm_path, out_path=ROAD_NETWORK_PATH) -> RoutingNetwork
+    build_network(osm_path, out_path, profile, label) -> RoutingNetwork
+    get_road_network() -> RoutingNetwork | None      (reloaded when the file changes)
+    road_route(lat1, lon1, lat2, lon2) -> {"distance_km", "time_hours"} | None
+    RoutingNetwork.route(a, b), .matrix(from_points, to_points) -> (km, hours), .block(points)
+
+CLI:
+    python -m app.services.road_network build --osm data/osm/germany-latest.osm.pbf
+    python -m app.services.road_network route 52.52,13.40 48.14,11.58
+    python -m app.services.road_network info
+"""
+import argparse
+import bz2
+import gzip
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from math import ceil, cos, radians
+from typing import Any, Dict, List, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+import numpy as np
+from app.services.contraction import ContractionHierarchy, INF
+from app.services.utils import haversine_km_np
+
+try:
+    import osmium
+except ImportError:  # optional: only needed for .pbf extracts
+    osmium = None
+
+ROAD_NETWORK_PATH = os.environ.get(
+    "ROAD_NETWORK_PATH", os.path.join(os.path.dirname(__file__), "..", "..", "data", "road_network.npz"))
+
+# typical truck speeds per OSM highway class (km/h); classes not listed are not routable
+TRUCK_SPEEDS_KMH = {
+    "motorway": 80.0, "motorway_link": 50.0,
+    "trunk": 70.0, "trunk_link": 45.0,
+    "primary": 60.0, "primary_link": 40.0,
+    "secondary": 50.0, "secondary_link": 35.0,
+    "tertiary": 40.0, "tertiary_link": 30.0,
+    "unclassified": 30.0, "road": 25.0,
+    "residential": 20.0, "service": 15.0, "living_street": 8.0,
+}
+TRUCK_MAX_SPEED_KMH = float(os.environ.get("TRUCK_MAX_SPEED_KMH", "80"))
+CLOSED = {"no", "private", "agricultural", "forestry", "delivery_no"}
+ONEWAY_CLASSES = {"motorway", "motorway_link"}
+
+SNAP_K = 4
+SNAP_MAX_KM = 30.0
+ACCESS_SPEED_KMH = 30.0
+# snapping grid cell (degrees)
+GRID_DEG = 0.25
+# points whose upward search spaces are kept, and cached point-set blocks
+SPACE_CACHE_SIZE = 5000
+BLOCK_CACHE_SIZE = 8
+
+
+# ---- OSM import ----------------------------------------------------------------------------
+
+def parse_maxspeed(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    v = value.strip().lower()
+    factor = 1.609344 if v.endswith("mph") else 1.0
+    try:
+        return float(v.replace("mph", "").replace("km/h", "").strip()) * factor
+    except ValueError:
+        # "none", "signals", "DE:urban"...
+        return None
+
+
+def _way_profile(tags: Dict[str, str]) -> Optional[Tuple[float, int]]:
+    """(truck speed km/h, oneway: 1 forward, -1 backward, 0 both) of a way, None if trucks cannot use it."""
+    speed = TRUCK_SPEEDS_KMH.get(tags.get("highway"))
+    if speed is None or tags.get("area") == "yes":
+        return None
+    if tags.get("hgv") in CLOSED or tags.get("motor_vehicle") in CLOSED:
+        return None
+    if tags.get("access") in CLOSED and tags.get("hgv") not in ("yes", "designated", "destination"):
+        return None
+    limit = parse_maxspeed(tags.get("maxspeed:hgv")) or parse_maxspeed(tags.get("maxspeed"))
+    if limit:
+        speed = min(speed, limit)
+    speed = min(speed, TRUCK_MAX_SPEED_KMH)
+    oneway = tags.get("oneway")
+    if oneway in ("yes", "true", "1"):
+        direction = 1
+    elif oneway == "-1":
+        direction = -1
+    elif oneway == "no":
+        direction = 0
+    else:
+        direction = 1 if tags.get("highway") in ONEWAY_CLASSES or tags.get("junction") == "roundabout" else 0
+    return speed, direction
+
+
+def _open_xml(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def _iter_elements(path: str, tag: str):
+    with _open_xml(path) as f:
+        context = iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event == "end" and elem.tag in ("node", "way", "relation"):
+                if elem.tag == tag:
+                    yield elem
+                root.clear()
+
+
+def _read_osm_xml(path: str, profile_of):
+    """Two streaming passes: routable ways first, then the coordinates of the nodes they use."""
+    ways = []
+    needed = set()
+    for elem in _iter_elements(path, "way"):
+        profile = profile_of({t.get("k"): t.get("v") for t in elem.iter("tag")})
+        if profile is None:
+            continue
+        refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+        if len(refs) > 1:
+            ways.append((refs, profile[0], profile[1]))
+            needed.update(refs)
+    coords = {}
+    for elem in _iter_elements(path, "node"):
+        nid = int(elem.get("id"))
+        if nid in needed:
+            coords[nid] = (float(elem.get("lat")), float(elem.get("lon")))
+    return ways, coords
+
+
+def _read_osm_pbf(path: str, profile_of):
+    if osmium is None:
+        raise RuntimeError("Reading .pbf extracts needs pyosmium (pip install osmium); "
+                           "or convert the extract to .osm.bz2 with osmium-tool")
+    ways = []
+    coords = {}
+
+    class Handler(osmium.SimpleHandler):
+        def way(self, w):
+            profile = profile_of({t.k: t.v for t in w.tags})
+            if profile is None or len(w.nodes) < 2:
+                return
+            refs = []
+            for n in w.nodes:
+                if n.location.valid():
+                    coords[n.ref] = (n.location.lat, n.location.lon)
+                refs.append(n.ref)
+            ways.append((refs, profile[0], profile[1]))
+
+    Handler().apply_file(path, locations=True)
+    return ways, coords
+
+
+def read_osm(path: str, profile_of=_way_profile):
+    """
+    Routable ways [(node refs, speed km/h, oneway)] and {node id: (lat, lon)} of an extract;
+    profile_of(tags) -> (speed, oneway) or None picks the ways (trucks by default).
+    """
+    if path.endswith(".pbf"):
+        return _read_osm_pbf(path, profile_of)
+    return _read_osm_xml(path, profile_of)
+
+
+def _segments(ways, coords):
+    """
+    Split ways at intersections and way ends: (graph nodes' OSM ids, edges (a, b, hours, km)).
+    Shape points in between only add to the edge's length and time.
+    """
+    uses = defaultdict(int)
+    for refs, _, _ in ways:
+        for r in refs:
+            uses[r] += 1
+        uses[refs[0]] += 1
+        uses[refs[-1]] += 1
+    edges = []
+    for refs, speed, oneway in ways:
+        pts = [coords.get(r, (np.nan, np.nan)) for r in refs]
+        lat = np.array([p[0] for p in pts])
+        lon = np.array([p[1] for p in pts])
+        # length of every step at once; a ref missing from a clipped extract gives nan and ends the segment
+        steps = haversine_km_np(lat[:-1], lon[:-1], lat[1:], lon[1:]).tolist()
+        start = refs[0] if pts[0][0] == pts[0][0] else None
+        km = 0.0
+        for r, step, p in zip(refs[1:], steps, pts[1:]):
+            if step != step:
+                start = r if p[0] == p[0] else None
+                km = 0.0
+                continue
+            km += step
+            if uses[r] > 1:
+                hours = km / speed
+                if oneway >= 0:
+                    edges.append((start, r, hours, km))
+                if oneway <= 0:
+                    edges.append((r, start, hours, km))
+                start, km = r, 0.0
+    return edges
+
+
+def _largest_component(n: int, pairs) -> np.ndarray:
+    """Mask of the nodes in the largest weakly connected component (union-find)."""
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[ra] = rb
+    roots = np.array([find(x) for x in range(n)], dtype=np.int64)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    return roots == np.bincount(roots).argmax()
+
+
+def build_road_network(osm_path: str, out_path: str = None) -> "RoutingNetwork":
+    """Import an OSM extract, contract it and save it; returns the loaded network."""
+    return build_network(osm_path, out_path or ROAD_NETWORK_PATH, _way_profile, "road_network")
+
+
+def build_network(osm_path: str, out_path: str, profile_of, label: str, **network_kwargs) -> "RoutingNetwork":
+    """Build and save the network of the ways profile_of accepts; network_kwargs go to RoutingNetwork."""
+    t0 = time.perf_counter()
+    ways, coords = read_osm(osm_path, profile_of)
+    edges = _segments(ways, coords)
+    osm_nodes = len(coords)
+    ids = sorted({e[0] for e in edges} | {e[1] for e in edges})
+    index = {nid: i for i, nid in enumerate(ids)}
+    keep = _largest_component(len(ids), ((index[a], index[b]) for a, b, _, _ in edges))
+    kept = np.flatnonzero(keep)
+    dense = np.full(len(ids), -1, dtype=np.int64)
+    dense[kept] = np.arange(kept.size)
+    lat = np.array([coords[ids[i]][0] for i in kept.tolist()], dtype=np.float64)
+    lon = np.array([coords[ids[i]][1] for i in kept.tolist()], dtype=np.float64)
+    graph = [(int(dense[index[a]]), int(dense[index[b]]), h, km) for a, b, h, km in edges if keep[index[a]]]
+    t1 = time.perf_counter()
+    print(f"[{label}] {len(ways)} ways, {osm_nodes} OSM nodes -> {kept.size} graph nodes, "
+          f"{len(graph)} edges ({len(ids) - kept.size} nodes off the main component) in {t1 - t0:.1f}s")
+
+    ch = ContractionHierarchy(int(kept.size), graph)
+    print(f"[{label}] contracted with {len(ch.shortcut_mid)} shortcuts in {time.perf_counter() - t1:.1f}s")
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    tmp = out_path + ".tmp"
+    ch.save(tmp, lat=lat, lon=lon, source=os.path.basename(osm_path),
+            built_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+    os.replace(tmp, out_path)
+    print(f"[{label}] saved {os.path.getsize(out_path) / 1e6:.1f} MB -> {out_path}")
+    return RoutingNetwork(ch, lat, lon, out_path, **network_kwargs)
+
+
+# ---- queries -------------------------------------------------------------------------------
+
+class RoutingNetwork:
+    def __init__(self, ch: ContractionHierarchy, lat: np.ndarray, lon: np.ndarray, path: str = None,
+                 snap_max_km: float = SNAP_MAX_KM, access_speed_kmh: float = ACCESS_SPEED_KMH):
+        self.ch = ch
+        self.snap_max_km = snap_max_km
+        self.access_speed_kmh = access_speed_kmh
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.path = path
+        # grid cell -> node indices, for snapping
+        cells = defaultdict(list)
+        for i, key in enumerate(zip(np.floor(self.lat / GRID_DEG).astype(np.int64).tolist(),
+                                    np.floor(self.lon / GRID_DEG).astype(np.int64).tolist())):
+            cells[key].append(i)
+        self.cells = {key: np.array(v, dtype=np.int64) for key, v in cells.items()}
+        self._spaces = OrderedDict()
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.lat)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "RoutingNetwork":
+        ch = ContractionHierarchy.load(path)
+        return cls(ch, ch.meta["lat"], ch.meta["lon"], path, **kwargs)
+
+    def snap(self, lat: float, lon: float) -> Dict[int, Tuple[float, float]]:
+        """Nearest graph nodes within snap_max_km: node -> (access hours, access km); {} if none."""
+        cy, cx = int(np.floor(lat / GRID_DEG)), int(np.floor(lon / GRID_DEG))
+        ry = int(ceil(self.snap_max_km / (111.0 * GRID_DEG)))
+        rx = int(ceil(self.snap_max_km / (111.0 * GRID_DEG * max(cos(radians(lat)), 0.05))))
+        near = [self.cells[(y, x)] for y in range(cy - ry, cy + ry + 1) for x in range(cx - rx, cx + rx + 1)
+                if (y, x) in self.cells]
+        if not near:
+            return {}
+        cand = np.concatenate(near)
+        km = haversine_km_np(lat, lon, self.lat[cand], self.lon[cand])
+        order = np.argsort(km)[:SNAP_K]
+        return {int(cand[i]): (float(km[i]) / self.access_speed_kmh, float(km[i]))
+                for i in order.tolist() if km[i] <= self.snap_max_km}
+
+    def _space(self, point: Tuple[float, float]):
+        """(forward, backward) upward search spaces of a point, LRU-cached by coordinates."""
+        key = (float(point[0]), float(point[1]))
+        with self._lock:
+            hit = self._spaces.get(key)
+            if hit is not None:
+                self._spaces.move_to_end(key)
+                return hit
+        seeds = self.snap(*key)
+        hit = (self.ch.search_space(seeds, forward=True), self.ch.search_space(seeds, forward=False))
+        with self._lock:
+            self._spaces[key] = hit
+            if len(self._spaces) > SPACE_CACHE_SIZE:
+                self._spaces.popitem(last=False)
+        return hit
+
+    def matrix(self, from_points: List[Tuple[float, float]],
+               to_points: List[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(km, hours) from every point to every point, INF where not covered or unreachable."""
+        fwd = [self._space(p)[0] for p in from_points]
+        bwd = [self._space(p)[1] for p in to_points]
+        hours, km = self.ch.join(fwd, bwd)
+        return km, hours
+
+    def block(self, points: List[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """matrix(points, points), cached per point set (the refuel candidates repeat across requests)."""
+        key = tuple((float(a), float(b)) for a, b in points)
+        with self._lock:
+            hit = self._blocks.get(key)
+            if hit is not None:
+                self._blocks.move_to_end(key)
+                return hit
+        hit = self.matrix(points, points)
+        with self._lock:
+            self._blocks[key] = hit
+            if len(self._blocks) > BLOCK_CACHE_SIZE:
+                self._blocks.popitem(last=False)
+        return hit
+
+    def route(self, a: Tuple[float, float], b: Tuple[float, float]) -> Optional[Dict[str, Any]]:
+        """Fastest route between two points: distance_km, time_hours and the graph node path."""
+        src, dst = self.snap(*a), self.snap(*b)
+        if not src or not dst:
+            return None
+        hours, path = self.ch.query_multi({n: h for n, (h, _) in src.items()},
+                                          {n: h for n, (h, _) in dst.items()})
+        if hours == INF:
+            return None
+        km = src[path[0]][1] + self.ch.path_length(path) + dst[path[-1]][1]
+        return {"distance_km": km, "time_hours": hours, "path": path}
+
+
+_network_lock = threading.Lock()
+_network = (None, None)
+
+
+def get_road_network() -> Optional[RoutingNetwork]:
+    """The saved network, reloaded when a rebuild replaced the file; None if none was built."""
+    global _network
+    try:
+        mtime = os.stat(ROAD_NETWORK_PATH).st_mtime
+    except OSError:
+        return None
+    with _network_lock:
+        if _network[0] != mtime:
+            _network = (mtime, RoutingNetwork.load(ROAD_NETWORK_PATH))
+        return _network[1]
+
+
+def road_route(lat1: float, lon1: float, lat2: float, lon2: float) -> Optional[Dict[str, float]]:
+    """Road distance (km) and truck time (hours) between two points; None if not on the network."""
+    network = get_road_network()
+    if network is None:
+        return None
+    route = network.route((lat1, lon1), (lat2, lon2))
+    if route is None:
+        return None
+    return {"distance_km": route["distance_km"], "time_hours": route["time_hours"]}
+
+
+def _point(text: str) -> Tuple[float, float]:
+    lat, lon = text.split(",")
+    return float(lat), float(lon)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Road network for truck routing")
+    sub = parser.add_subparsers(dest="cmd")
+    p_build = sub.add_parser("build", help="import an OSM extract and build the contraction hierarchy")
+    p_build.add_argument("--osm", required=True, help=".osm, .osm.gz, .osm.bz2 or .osm.pbf (needs pyosmium)")
+    p_build.add_argument("--out", default=None, help=f"default {ROAD_NETWORK_PATH}")
+    p_route = sub.add_parser("route", help="time a point-to-point query")
+    p_route.add_argument("origin", help="lat,lon")
+    p_route.add_argument("destination", help="lat,lon")
+    sub.add_parser("info")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        build_road_network(args.osm, args.out)
+    elif args.cmd == "route":
+        network = get_road_network()
+        if network is None:
+            raise SystemExit(f"No road network at {ROAD_NETWORK_PATH}; run the build command first")
+        t0 = time.perf_counter()
+        route = network.route(_point(args.origin), _point(args.destination))
+        ms = (time.perf_counter() - t0) * 1000.0
+        if route is None:
+            print(f"not routable ({ms:.1f} ms)")
+        else:
+            print(f"{route['distance_km']:.1f} km, {route['time_hours']:.2f} h, "
+                  f"{len(route['path'])} road nodes ({ms:.1f} ms)")
+    elif args.cmd == "info":
+        network = get_road_network()
+        if network is None:
+            print(f"No road network at {ROAD_NETWORK_PATH}")
+            return
+        meta = network.ch.meta
+        print(f"{len(network)} nodes, {sum(len(a) for a in network.ch.up_out)} upward edges, "
+              f"{len(network.ch.shortcut_mid)} shortcuts, from {meta['source']} built {meta['built_at']}, "
+              f"{os.path.getsize(network.path) / 1e6:.1f} MB")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
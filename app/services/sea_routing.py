@@ -0,0 +1,266 @@
+"""
+Sea-lane routing for ocean legs over a navigable waypoint graph.
+
+Great-circle distances between ports cut across continents (Rotterdam -> Shanghai is ~4,900 nm
+"as the crow flies" but ~10,500 nm via Suez). This module routes over a graph of waypoints on
+the major shipping lanes and canal chokepoints loaded from data/sea_lanes.json.
+
+- Free points (ports, origins, destinations) attach to their nearest waypoint and to any other
+  waypoint within ATTACH_RATIO times that distance (at most ATTACH_MAX).
+- Point-to-point queries run a bidirectional A* with the symmetric great-circle potential.
+- Waypoint-to-waypoint distances are precomputed once (the graph is small), so distance
+  matrices between many points are a vectorized min over attachment pairs.
+- PortSeaTable holds the port-to-port matrix for all ports in the DB; planning looks distances
+  up by port id in O(1). It is rebuilt when ports are added, removed, moved or renamed, or
+  served from the shared memory-mapped matrix when that was built for the current ports at
+  their current positions (python -m app.services.distance_matrix build).
+
+Points closer than DIRECT_MAX_NM are also joined directly (harbour-to-harbour hops).
+
+API:
+    get_sea_router() -> SeaRouter
+    sea_distance_nm(lat1, lon1, lat2, lon2) -> float
+    get_port_sea_table(db) -> PortSeaTable
+"""
+import json
+import os
+import threading
+from functools import lru_cache
+from heapq import heappush, heappop
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from app.services.utils import haversine_km_np, KM_PER_NM
+from app.services.distance_matrix import get_distance_matrix
+from app.services.node_store import get_node_store
+
+SEA_LANES_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "data", "sea_lanes.json")
+
+ATTACH_RATIO = 1.5
+ATTACH_MAX = 3
+DIRECT_MAX_NM = 150.0
+
+INF = float("inf")
+
+
+def _nm(lat1, lon1, lat2, lon2):
+    return haversine_km_np(lat1, lon1, lat2, lon2) / KM_PER_NM
+
+
+class SeaRouter:
+    def __init__(self, waypoints: List[Dict[str, Any]], lanes: List[List[str]]):
+        self.ids = [w["id"] for w in waypoints]
+        self.names = [w.get("name", w["id"]) for w in waypoints]
+        self.lat = np.array([w["lat"] for w in waypoints], dtype=np.float64)
+        self.lon = np.array([w["lon"] for w in waypoints], dtype=np.float64)
+        index = {wid: i for i, wid in enumerate(self.ids)}
+        A = len(self.ids)
+        self.adj: List[List[Tuple[int, float]]] = [[] for _ in range(A)]
+        for a, b in lanes:
+            i, j = index[a], index[b]
+            d = float(_nm(self.lat[i], self.lon[i], self.lat[j], self.lon[j]))
+            self.adj[i].append((j, d))
+            self.adj[j].append((i, d))
+        # all-pairs waypoint distances (one Dijkstra per waypoint)
+        self.table = np.full((A, A), INF)
+        for s in range(A):
+            self.table[s] = self._dijkstra(s)
+
+    def _dijkstra(self, source: int) -> np.ndarray:
+        dist = np.full(len(self.ids), INF)
+        dist[source] = 0.0
+        pq = [(0.0, source)]
+        while pq:
+            d, u = heappop(pq)
+            if d > dist[u]:
+                continue
+            for v, w in self.adj[u]:
+                if d + w < dist[v]:
+                    dist[v] = d + w
+                    heappush(pq, (d + w, v))
+        return dist
+
+    def attach(self, lat: float, lon: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Waypoints a free point connects to, and the straight-line nm to each."""
+        d = _nm(lat, lon, self.lat, self.lon)
+        order = np.argsort(d)[:ATTACH_MAX]
+        keep = order[d[order] <= d[order[0]] * ATTACH_RATIO + 1e-9]
+        return keep, d[keep]
+
+    def route(self, a: Tuple[float, float], b: Tuple[float, float]) -> Dict[str, Any]:
+        """
+        Shortest sea route between two (lat, lon) points with bidirectional A*.
+        Returns dict with distance_nm, waypoints (names) and path [(lat, lon)].
+        """
+        A = len(self.ids)
+        s, t = A, A + 1
+        lat = np.append(self.lat, [a[0], b[0]])
+        lon = np.append(self.lon, [a[1], b[1]])
+        s_idx, s_len = self.attach(*a)
+        t_idx, t_len = self.attach(*b)
+        s_links = dict(zip(s_idx.tolist(), s_len.tolist()))
+        t_links = dict(zip(t_idx.tolist(), t_len.tolist()))
+        direct = float(_nm(a[0], a[1], b[0], b[1]))
+
+        def neighbours(v):
+            if v == s:
+                out = list(s_links.items())
+                if direct <= DIRECT_MAX_NM:
+                    out.append((t, direct))
+                return out
+            if v == t:
+                out = list(t_links.items())
+                if direct <= DIRECT_MAX_NM:
+                    out.append((s, direct))
+                return out
+            out = list(self.adj[v])
+            if v in s_links:
+                out.append((s, s_links[v]))
+            if v in t_links:
+                out.append((t, t_links[v]))
+            return out
+
+        # symmetric potential: pi(v) = (h(v, t) - h(s, v)) / 2 keeps both searches consistent
+        to_t = _nm(lat, lon, b[0], b[1])
+        from_s = _nm(lat, lon, a[0], a[1])
+        pi = (to_t - from_s) / 2.0
+
+        dist = ({s: 0.0}, {t: 0.0})
+        prev = ({}, {})
+        pq = ([(pi[s], s)], [(-pi[t], t)])
+        sign = (1.0, -1.0)
+        best, meet = INF, None
+        while pq[0] or pq[1]:
+            top_f = pq[0][0][0] if pq[0] else INF
+            top_b = pq[1][0][0] if pq[1] else INF
+            if top_f + top_b >= best:
+                break
+            side = 0 if top_f <= top_b else 1
+            key, u = heappop(pq[side])
+            d_u = dist[side][u]
+            if key > d_u + sign[side] * pi[u] + 1e-12:
+                continue
+            for v, w in neighbours(u):
+                nd = d_u + w
+                if nd < dist[side].get(v, INF):
+                    dist[side][v] = nd
+                    prev[side][v] = u
+                    heappush(pq[side], (nd + sign[side] * pi[v], v))
+                    other = dist[1 - side].get(v)
+                    if other is not None and nd + other < best:
+                        best, meet = nd + other, v
+
+        if meet is None:
+            return {"distance_nm": INF, "waypoints": [], "path": []}
+        nodes = [meet]
+        while nodes[-1] in prev[0]:
+            nodes.append(prev[0][nodes[-1]])
+        nodes.reverse()
+        x = meet
+        while x in prev[1]:
+            x = prev[1][x]
+            nodes.append(x)
+        return {
+            "distance_nm": best,
+            "waypoints": [self.names[v] for v in nodes if v < A],
+            "path": [(float(lat[v]), float(lon[v])) for v in nodes],
+        }
+
+    def distance_matrix_nm(self, points_a: List[Tuple[float, float]],
+                           points_b: List[Tuple[float, float]] = None) -> np.ndarray:
+        """Sea distances between every point of points_a and points_b (defaults to points_a)."""
+        if points_b is None:
+            points_b = points_a
+        att_a = [self.attach(lat, lon) for lat, lon in points_a]
+        att_b = [self.attach(lat, lon) for lat, lon in points_b]
+        idx_a, len_a = self._pad_attachments(att_a)
+        idx_b, len_b = self._pad_attachments(att_b)
+        out = np.full((len(points_a), len(points_b)), INF)
+        for ka in range(ATTACH_MAX):
+            for kb in range(ATTACH_MAX):
+                via = len_a[:, ka, None] + self.table[idx_a[:, ka, None], idx_b[None, :, kb]] + len_b[None, :, kb]
+                np.minimum(out, via, out=out)
+        pa = np.asarray(points_a, dtype=np.float64).reshape(-1, 2)
+        pb = np.asarray(points_b, dtype=np.float64).reshape(-1, 2)
+        direct = _nm(pa[:, 0, None], pa[:, 1, None], pb[None, :, 0], pb[None, :, 1])
+        close = direct <= DIRECT_MAX_NM
+        out[close] = np.minimum(out[close], direct[close])
+        return out
+
+    @staticmethod
+    def _pad_attachments(attachments):
+        # unused attachment slots point at waypoint 0 with infinite length
+        n = len(attachments)
+        idx = np.zeros((n, ATTACH_MAX), dtype=np.int64)
+        length = np.full((n, ATTACH_MAX), INF)
+        for row, (i, d) in enumerate(attachments):
+            idx[row, :len(i)] = i
+            length[row, :len(d)] = d
+        return idx, length
+
+
+@lru_cache(maxsize=1)
+def get_sea_router() -> SeaRouter:
+    with open(SEA_LANES_PATH, "r") as f:
+        data = json.load(f)
+    return SeaRouter(data["waypoints"], data["lanes"])
+
+
+def sea_distance_nm(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Sea-lane distance between two points; falls back to great circle if no route exists."""
+    d = get_sea_router().route((lat1, lon1), (lat2, lon2))["distance_nm"]
+    if d == INF:
+        return float(_nm(lat1, lon1, lat2, lon2))
+    return d
+
+
+class PortSeaTable:
+    """Precomputed port-to-port sea distances, indexed by Port.id."""
+
+    def __init__(self, ports: List[Tuple[int, float, float]], matrix: np.ndarray = None):
+        self.index = {pid: row for row, (pid, _, _) in enumerate(ports)}
+        if matrix is None:
+            coords = [(lat, lon) for _, lat, lon in ports]
+            matrix = get_sea_router().distance_matrix_nm(coords) if coords else np.zeros((0, 0))
+        self.matrix = matrix
+
+    @classmethod
+    def from_mapped(cls, mapped) -> "PortSeaTable":
+        # shares the memory-mapped matrix built by distance_matrix.py
+        table = cls([], mapped.matrix)
+        table.index = mapped.index
+        return table
+
+    def distance_nm(self, port_a: int, port_b: int) -> float:
+        return float(self.matrix[self.index[port_a], self.index[port_b]])
+
+    def submatrix(self, port_ids: List[int]) -> np.ndarray:
+        rows = np.array([self.index[p] for p in port_ids], dtype=np.int64)
+        return self.matrix[np.ix_(rows, rows)].astype(np.float64)
+
+
+_table_lock = threading.Lock()
+_cached_table = None
+_cached_key = None
+
+
+def get_port_sea_table(db) -> PortSeaTable:
+    """
+    Return the port table, rebuilding it when the port node store was reloaded with different
+    rows (node_store.py). A prebuilt memory-mapped matrix (distance_matrix.py, kind "port_sea")
+    is used when its index lists exactly the current port ids at the current positions.
+    """
+    global _cached_table, _cached_key
+    store = get_node_store(db, "port")
+    mapped = get_distance_matrix("port_sea")
+    with _table_lock:
+        # the store object only changes when ports do; holding `mapped` also notices a rebuilt matrix
+        if _cached_table is None or _cached_key[0] is not store or _cached_key[1] is not mapped:
+            ids = store.obj_id.tolist()
+            if mapped is not None and mapped.matches(ids, store.lat, store.lon):
+                _cached_table = PortSeaTable.from_mapped(mapped)
+            else:
+                if mapped is not None:
+                    print("[sea_routing] port_sea matrix is stale (ports changed); building the table in-process")
+                _cached_table = PortSeaTable(list(zip(ids, store.lat.tolist(), store.lon.tolist())))
+            _cached_key = (store, mapped)
+        return _cached_table
@@ -0,0 +1,150 @@
+"""
+Destination sequencing for multi-drop itineraries.
+
+Reorders the stops of an open path origin -> s1 -> ... -> sn so the total travelled distance is
+small, before the itinerary is handed to the per-leg planner.
+
+Approach:
+- A dense distance matrix over origin + destinations is computed with vectorized haversine.
+- A nearest-neighbour tour seeds the search.
+- 2-opt (segment reversal) and Or-opt (moving chains of 1-3 stops) improve it until no move
+  helps or the time budget is spent. Move evaluation is vectorized over all candidate positions.
+
+The origin is always first. Optionally the first and/or last destination keep their position.
+An open (not fixed) end is modelled with a dummy terminal at zero distance from every stop, so
+both local-search moves always work on a path with fixed endpoints.
+
+API:
+    distance_matrix_km(coords) -> (n, n) ndarray
+    optimize_sequence(matrix, fix_first=False, fix_last=False, time_budget_s=1.0)
+"""
+import time
+from typing import List, Tuple, Dict, Any
+import numpy as np
+from app.services.utils import haversine_km_np
+
+
+def distance_matrix_km(coords: List[Tuple[float, float]]) -> np.ndarray:
+    """Great-circle distance matrix (km) between all (lat, lon) pairs."""
+    pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    lat = pts[:, 0][:, None]
+    lon = pts[:, 1][:, None]
+    return haversine_km_np(lat, lon, lat.T, lon.T)
+
+
+def path_length(matrix: np.ndarray, order: List[int]) -> float:
+    """Length of the open path visiting `order` (matrix indices) in sequence."""
+    idx = np.asarray(order, dtype=np.int64)
+    return float(matrix[idx[:-1], idx[1:]].sum())
+
+
+def _nearest_neighbour(D: np.ndarray, start: int, free: List[int]) -> List[int]:
+    out = []
+    remaining = np.asarray(free, dtype=np.int64)
+    cur = start
+    while remaining.size:
+        k = int(np.argmin(D[cur, remaining]))
+        cur = int(remaining[k])
+        out.append(cur)
+        remaining = np.delete(remaining, k)
+    return out
+
+
+def _two_opt_pass(D: np.ndarray, path: np.ndarray, lo: int, hi: int, deadline: float) -> bool:
+    """One sweep of best-improvement 2-opt over path[lo..hi]; returns True if the path changed."""
+    improved = False
+    for i in range(lo, hi):
+        if time.perf_counter() >= deadline:
+            break
+        a = path[i - 1]
+        b = path[i]
+        js = np.arange(i + 1, hi + 1)
+        c = path[js]
+        d = path[js + 1]
+        delta = D[a, c] + D[b, d] - D[a, b] - D[c, d]
+        k = int(np.argmin(delta))
+        if delta[k] < -1e-9:
+            j = int(js[k])
+            path[i:j + 1] = path[i:j + 1][::-1].copy()
+            improved = True
+    return improved
+
+
+def _or_opt_pass(D: np.ndarray, path: np.ndarray, lo: int, hi: int, deadline: float) -> bool:
+    """One sweep of Or-opt: relocate chains of 1-3 stops (optionally reversed) inside path[lo..hi]."""
+    improved = False
+    for seg_len in (1, 2, 3):
+        i = lo
+        while i + seg_len - 1 <= hi and time.perf_counter() < deadline:
+            j = i + seg_len - 1
+            p, s0, s1, n = path[i - 1], path[i], path[j], path[j + 1]
+            removal_gain = D[p, s0] + D[s1, n] - D[p, n]
+            # insertion edges (q, q+1) of the path without the segment, restricted to the movable range
+            rest = np.concatenate((path[:i], path[j + 1:]))
+            qs = np.arange(lo - 1, hi - seg_len + 1)
+            u = rest[qs]
+            v = rest[qs + 1]
+            fwd = D[u, s0] + D[s1, v] - D[u, v]
+            rev = D[u, s1] + D[s0, v] - D[u, v]
+            best_fwd = int(np.argmin(fwd))
+            best_rev = int(np.argmin(rev))
+            if rev[best_rev] < fwd[best_fwd]:
+                q, add, reverse = int(qs[best_rev]), rev[best_rev], True
+            else:
+                q, add, reverse = int(qs[best_fwd]), fwd[best_fwd], False
+            if add - removal_gain < -1e-9:
+                seg = path[i:j + 1].copy()
+                if reverse:
+                    seg = seg[::-1]
+                path[:] = np.concatenate((rest[:q + 1], seg, rest[q + 1:]))
+                improved = True
+            else:
+                i += 1
+    return improved
+
+
+def optimize_sequence(matrix: np.ndarray,
+                      fix_first: bool = False,
+                      fix_last: bool = False,
+                      time_budget_s: float = 1.0) -> Dict[str, Any]:
+    """
+    matrix: (n+1, n+1) distance/cost matrix; index 0 is the origin, 1..n the stops in given order.
+    fix_first / fix_last: keep stop 1 / stop n at the start / end of the tour.
+    time_budget_s: wall-clock limit for the local search (the constructive step always runs).
+
+    Returns dict with keys: order (stop indices 1..n in visiting order), given_cost, cost.
+    """
+    deadline = time.perf_counter() + max(0.0, time_budget_s)
+    D = np.asarray(matrix, dtype=np.float64)
+    n = D.shape[0] - 1
+    given = list(range(1, n + 1))
+    given_cost = path_length(D, [0] + given)
+    if n < 2:
+        return {"order": given, "given_cost": given_cost, "cost": given_cost}
+
+    head = [1] if fix_first else []
+    tail = [n] if fix_last else []
+    free = [s for s in given if s not in head and s not in tail]
+
+    # open end: dummy terminal at zero distance keeps both path endpoints fixed
+    if not tail:
+        D = np.pad(D, ((0, 1), (0, 1)))
+        tail = [n + 1]
+
+    start = head[-1] if head else 0
+    path = np.asarray([0] + head + _nearest_neighbour(D, start, free) + tail, dtype=np.int64)
+    lo = 1 + len(head)
+    hi = len(path) - 2
+
+    while hi - lo >= 1 and time.perf_counter() < deadline:
+        improved = _two_opt_pass(D, path, lo, hi, deadline)
+        improved = _or_opt_pass(D, path, lo, hi, deadline) or improved
+        if not improved:
+            break
+
+    order = [int(s) for s in path[1:] if s <= n]
+    cost = path_length(matrix, [0] + order)
+    # never return something worse than the given order
+    if cost > given_cost:
+        order, cost = given, given_cost
+    return {"order": order, "given_cost": given_cost, "cost": cost}
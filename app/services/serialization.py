@@ -0,0 +1,207 @@
+"""
+JSON encoding and response compression for the plan endpoints.
+
+Plans are built once as plain dicts (optimizer.build_plan_payload) and written straight to bytes:
+with orjson when it is installed (optional dependency), with the stdlib json module otherwise.
+Endpoints return those bytes in a Response, so FastAPI neither validates the plan against
+response_model again nor runs it through jsonable_encoder on the way out; response_model stays
+on the route for the OpenAPI schema.
+
+Compression is negotiated from Accept-Encoding for bodies of at least MIN_COMPRESS_BYTES: br
+(when the brotli package is installed) or gzip, whichever the client weighs higher, br on a tie.
+Streams (batch NDJSON) are compressed incrementally and flushed after every chunk, so clients
+still get each result as soon as it is planned.
+
+API:
+    dumps(obj, sort_keys=False) -> bytes
+    loads(data) -> object
+    negotiate_encoding(accept_encoding) -> "br" | "gzip" | None
+    json_response(request, payload, status_code=200) -> Response
+    streaming_response(request, chunks, media_type) -> StreamingResponse
+    compress_stream(chunks, encoding) -> iterator of bytes
+
+CLI:
+    python -m app.services.serialization bench --legs 40 --stops 12 --repeat 300
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+import zlib
+from typing import Any, Iterable, Iterator, Optional
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip is offered then
+    brotli = None
+
+MIN_COMPRESS_BYTES = int(os.environ.get("MIN_COMPRESS_BYTES", "1024"))
+GZIP_LEVEL = 6
+# brotli's 11 is far too slow for per-request bodies; 5 compresses better than gzip -6 at similar speed
+BROTLI_QUALITY = 5
+
+if orjson is not None:
+    _ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    """Compact UTF-8 JSON; values JSON cannot represent (datetimes with the stdlib, numpy, ...) as str."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=_ORJSON_OPTS | (orjson.OPT_SORT_KEYS if sort_keys else 0))
+    return json.dumps(obj, default=str, sort_keys=sort_keys, separators=(",", ":")).encode()
+
+
+def loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Preferred supported content coding of an Accept-Encoding header, or None."""
+    weights = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    offered = (["br"] if brotli is not None else []) + ["gzip"]
+    best = max(offered, key=lambda enc: weights.get(enc, weights.get("*", 0.0)))
+    return best if weights.get(best, weights.get("*", 0.0)) > 0.0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def json_response(request, payload: Any, status_code: int = 200) -> Response:
+    """Response with the payload as JSON, compressed when large and the client accepts it."""
+    body = dumps(payload)
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= MIN_COMPRESS_BYTES:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        if encoding:
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def compress_stream(chunks: Iterable, encoding: str) -> Iterator[bytes]:
+    """Compress a stream chunk by chunk, flushing after each so nothing waits for the next one."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            out = compressor.process(chunk.encode() if isinstance(chunk, str) else chunk) + compressor.flush()
+            if out:
+                yield out
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        out = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        out += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def streaming_response(request, chunks: Iterable, media_type: str) -> StreamingResponse:
+    """StreamingResponse over chunks, compressed if the client accepts it."""
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding is None:
+        return StreamingResponse(chunks, media_type=media_type, headers={"Vary": "Accept-Encoding"})
+    return StreamingResponse(compress_stream(chunks, encoding), media_type=media_type,
+                             headers={"Vary": "Accept-Encoding", "Content-Encoding": encoding})
+
+
+# ---- benchmark -----------------------------------------------------------------------------
+
+def _sample_payload(legs: int, stops: int) -> dict:
+    """A plan-shaped payload of the given size, its legs and stops built through the models."""
+    from app.models import LegDetail, FuelStop, Coordinate
+    leg_details = [LegDetail(
+        from_coord=Coordinate(lat=10.0 + i * 0.5, lon=20.0 + i * 0.25),
+        to_coord=Coordinate(lat=10.5 + i * 0.5, lon=20.25 + i * 0.25),
+        mode="ocean", distance_km=1234.56 + i, distance_nm=666.61 + i, time_hours=45.97,
+        fuel_needed=53.329, fuel_unit="tons", port_fees_usd=0.0).dict() for i in range(legs)]
+    fuel_plan = [FuelStop(port=f"Port {i}", amount_tons_or_liters=412.0 + i, price_per_unit_usd=605.5,
+                          cost_usd=254466.0 + i).dict() for i in range(stops)]
+    return {
+        "route_id": "00000000-0000-0000-0000-000000000000", "total_distance_km": 25000.0,
+        "total_distance_nm": 13498.92, "total_time_hours": 950.4, "total_fuel": 2133.16,
+        "total_fuel_unit": "tons", "total_cost_usd": 3054012.0, "fuel_plan": fuel_plan, "stops": stops,
+        "risk_score": 100.0, "paperwork": ["Bill of Lading", "Commercial Invoice", "Packing List"],
+        "leg_details": leg_details, "sequence": None, "mode_split_km": {"ocean": 25000.0},
+        "pareto_frontier": None, "speed_plan": None, "fuel_saved_vs_service_speed_tons": None,
+        "carrier_choices": None, "fleet": None,
+    }
+
+
+def _time(fn, repeat: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def bench(legs: int = 40, stops: int = 12, repeat: int = 300):
+    """Per-request cost (µs) of turning a built plan into response bytes, old path vs new."""
+    from fastapi.encoders import jsonable_encoder
+    from app.models import PlanResponse
+
+    payload = _sample_payload(legs, stops)
+
+    def before():
+        # build_plan's PlanResponse(**payload), then FastAPI: validate against response_model,
+        # jsonable_encoder, json.dumps
+        plan = PlanResponse(**payload)
+        checked = PlanResponse.model_validate(plan.dict())
+        return json.dumps(jsonable_encoder(checked), ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":")).encode()
+
+    body = dumps(payload)
+    rows = [
+        ("before: model rebuild + FastAPI encode", _time(before, repeat)),
+        ("after: " + ("orjson" if orjson is not None else "json") + " dumps", _time(lambda: dumps(payload), repeat)),
+        ("after: dumps + gzip", _time(lambda: compress(dumps(payload), "gzip"), repeat)),
+    ]
+    if brotli is not None:
+        rows.append(("after: dumps + br", _time(lambda: compress(dumps(payload), "br"), repeat)))
+    print(f"plan with {legs} legs, {stops} fuel stops: {len(body)} bytes JSON, "
+          f"{len(compress(body, 'gzip'))} gzip" + (f", {len(compress(body, 'br'))} br" if brotli is not None else ""))
+    for name, us in rows:
+        print(f"  {name:<42} {us:9.1f} µs")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan serialization tools")
+    sub = parser.add_subparsers(dest="cmd")
+    p_bench = sub.add_parser("bench", help="time response serialization before/after the fast path")
+    p_bench.add_argument("--legs", type=int, default=40)
+    p_bench.add_argument("--stops", type=int, default=12)
+    p_bench.add_argument("--repeat", type=int, default=300)
+    args = parser.parse_args()
+    if args.cmd == "bench":
+        bench(args.legs, args.stops, args.repeat)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 """Shared utility functions for logistics services (haversine, etc.)."""
 from math import radians, sin, cos, sqrt, atan2
+import numpy as np
 
 KM_PER_NM = 1.852
 
@@ -18,3 +19,10 @@ def haversine_km(lat1, lon1, lat2, lon2):
 def haversine_nm_coords(lat1, lon1, lat2, lon2):
     """Calculate distance in nautical miles between two points on Earth."""
     return haversine_km(lat1, lon1, lat2, lon2) / KM_PER_NM
+
+
+def haversine_km_np(lat1, lon1, lat2, lon2):
+    """Vectorized haversine (km); arguments broadcast like numpy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    return 2.0 * 6371.0 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
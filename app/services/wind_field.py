@@ -0,0 +1,389 @@
+"""
+Upper-air winds for air legs: headwind-corrected flight time and fuel from a local gridded wind file.
+
+Air legs were timed and fuelled in still air at the carrier's cruise_speed_kmh. When WIND_FIELD_PATH
+points to a wind file, air legs fly through its winds instead:
+
+- the file is a GRIB (.grib/.grib2, needs xarray + cfgrib) or NetCDF (.nc, needs xarray) forecast
+  with u/v wind on pressure levels (first time step), or a plain .npz with arrays lat, lon,
+  pressure_hpa (or flight_level), u and v (level, lat, lon) in m/s;
+- it is converted once into a cache directory under WIND_CACHE_DIR (default data/wind_cache), one
+  .npy per flight level (pressure levels become flight levels in the standard atmosphere) holding
+  u/v in km/h; workers memory-map those arrays, so a new file is read once, not per process;
+- a leg samples WIND_SAMPLES points along its great circle, interpolates the wind at the carrier's
+  flight level (profile "cruise_flight_level", nearest level in the file) and solves the wind
+  triangle for the ground speed: gs = sqrt(tas^2 - crosswind^2) + tailwind;
+- its time factor is time in wind / time in still air, the mean of tas / gs over the samples. Fuel
+  flow is set by the airspeed, so fuel scales by the same factor as time.
+
+All pairs of a point set are evaluated at once (numpy over pairs, one pass per sample). The
+airport-to-airport block is cached per (point set, airspeed, level), so a refuel solve on a warm
+worker only computes the rows of its origin and destinations.
+
+API:
+    get_wind_field() -> WindField | None      (reloaded when the file changes)
+    load_wind_field(path) -> WindField
+    flight_level(carrier) -> float
+    leg_wind_factor(carrier, lat1, lon1, lat2, lon2) -> float      (1.0 without a wind file)
+    WindField.factors(from_lat, from_lon, to_lat, to_lon, tas_kmh, level) -> (F, T) ndarray
+    WindField.block(lat, lon, tas_kmh, level), .min_factor(tas_kmh, level)
+
+CLI:
+    python -m app.services.wind_field cache --file data/wind/gfs.t00z.pgrb2.0p25.f006
+    python -m app.services.wind_field info
+    python -m app.services.wind_field leg 51.47,-0.45 40.64,-73.78 --tas 910 --fl 350
+    python -m app.services.wind_field bench --points 200
+"""
+import argparse
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import numpy as np
+from app.services.utils import haversine_km_np
+
+try:
+    import xarray
+except ImportError:  # optional: only needed for GRIB/NetCDF files (GRIB also needs cfgrib)
+    xarray = None
+
+WIND_FIELD_PATH = os.environ.get("WIND_FIELD_PATH", "")
+WIND_CACHE_DIR = os.environ.get(
+    "WIND_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "data", "wind_cache"))
+
+DEFAULT_FLIGHT_LEVEL = 350.0
+WIND_SAMPLES = 16
+# ground speed never drops below this share of the airspeed (protects against absurd fields)
+MIN_GROUND_SPEED_FRACTION = 0.25
+BLOCK_CACHE_SIZE = 8
+
+GRIB_SUFFIXES = (".grib", ".grib2", ".grb", ".grb2")
+U_NAMES = ("u", "ugrd", "UGRD", "u_component_of_wind")
+V_NAMES = ("v", "vgrd", "VGRD", "v_component_of_wind")
+LAT_NAMES = ("latitude", "lat")
+LON_NAMES = ("longitude", "lon")
+LEVEL_NAMES = ("isobaricInhPa", "pressure_level", "level", "plev", "lev")
+
+
+def pressure_to_flight_level(hpa) -> np.ndarray:
+    """Flight level (hundreds of ft pressure altitude) of pressure levels in hPa, standard atmosphere."""
+    hpa = np.asarray(hpa, dtype=np.float64)
+    return 145366.45 * (1.0 - (hpa / 1013.25) ** 0.190284) / 100.0
+
+
+def flight_level(carrier: Dict) -> float:
+    return float(carrier.get("cruise_flight_level", DEFAULT_FLIGHT_LEVEL))
+
+
+class WindField:
+    """u/v winds (km/h) per flight level on a lat/lon grid; lat and lon ascending."""
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, levels: np.ndarray, winds, source: str = None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.levels = np.asarray(levels, dtype=np.float64)
+        # winds[i]: (2, nlat, nlon) u (east) and v (north) at levels[i]; plain views of the mapped files
+        self.winds = [np.asarray(w) for w in winds]
+        self.source = source
+        # a grid spanning the globe wraps around in longitude
+        step = self.lon[1] - self.lon[0] if len(self.lon) > 1 else 360.0
+        self.wraps = bool(self.lon[-1] - self.lon[0] + step >= 359.999)
+        self._lon_ext = np.append(self.lon, self.lon[0] + 360.0) if self.wraps else self.lon
+        # regular grids (the usual case) index by arithmetic instead of a search
+        self._regular = all(len(g) > 1 and np.allclose(np.diff(g), g[1] - g[0]) for g in (self.lat, self._lon_ext))
+        self._max_speed = {}
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def level_index(self, level: float) -> int:
+        """Index of the level nearest to a flight level."""
+        return int(np.abs(self.levels - float(level)).argmin())
+
+    def wind(self, level: float, lat, lon) -> Tuple[np.ndarray, np.ndarray]:
+        """(u, v) km/h at points, bilinear between grid points; clamped at the edges of regional grids."""
+        w = self.winds[self.level_index(level)]
+        nlat, nlon = len(self.lat), len(self.lon)
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if self.wraps:
+            lon = self.lon[0] + np.mod(lon - self.lon[0], 360.0)
+        last_i, last_j = nlat - 1, len(self._lon_ext) - 1
+        if self._regular:
+            fi = np.clip((lat - self.lat[0]) / (self.lat[1] - self.lat[0]), 0.0, last_i)
+            fj = np.clip((lon - self._lon_ext[0]) / (self._lon_ext[1] - self._lon_ext[0]), 0.0, last_j)
+        else:
+            fi = np.interp(lat, self.lat, np.arange(nlat, dtype=np.float64))
+            fj = np.interp(lon, self._lon_ext, np.arange(last_j + 1, dtype=np.float64))
+        i0 = np.minimum(fi.astype(np.int64), max(last_i - 1, 0))
+        j0 = np.minimum(fj.astype(np.int64), max(last_j - 1, 0))
+        wi = fi - i0
+        wj = fj - j0
+        i1 = np.minimum(i0 + 1, last_i)
+        j1 = np.minimum(j0 + 1, last_j)
+        if self.wraps:
+            j0 = j0 % nlon
+            j1 = j1 % nlon
+        # flat gathers on u and v
+        r0, r1 = i0 * nlon, i1 * nlon
+        out = []
+        for comp in (w[0].reshape(-1), w[1].reshape(-1)):
+            top = comp.take(r0 + j0) * (1.0 - wj) + comp.take(r0 + j1) * wj
+            bottom = comp.take(r1 + j0) * (1.0 - wj) + comp.take(r1 + j1) * wj
+            out.append(top * (1.0 - wi) + bottom * wi)
+        return out[0], out[1]
+
+    def factors(self, from_lat, from_lon, to_lat, to_lon, tas_kmh: float, level: float) -> np.ndarray:
+        """(F, T) time factor (wind / still air) of every great circle from a from-point to a to-point."""
+        a = _unit(from_lat, from_lon)
+        b = _unit(to_lat, to_lon)
+        # x, y, z components as (F, 1) and (1, T) so every pair array is a contiguous (F, T)
+        ax, ay, az = (a[:, c, None] for c in range(3))
+        bx, by, bz = (b[None, :, c] for c in range(3))
+        d = np.arccos(np.clip(ax * bx + ay * by + az * bz, -1.0, 1.0))
+        moving = d > 1e-6
+        sin_d = np.where(moving, np.sin(d), 1.0)
+        tas = float(tas_kmh)
+        floor = (MIN_GROUND_SPEED_FRACTION * tas) ** 2
+        total = np.zeros(d.shape)
+        for k in range(WIND_SAMPLES):
+            t = (k + 0.5) / WIND_SAMPLES
+            # point at fraction t of the arc and the direction of travel there
+            sa, sb = np.sin((1.0 - t) * d) / sin_d, np.sin(t * d) / sin_d
+            ca, cb = -np.cos((1.0 - t) * d), np.cos(t * d)
+            px, py, pz = sa * ax + sb * bx, sa * ay + sb * by, sa * az + sb * bz
+            tx, ty, tz = ca * ax + cb * bx, ca * ay + cb * by, ca * az + cb * bz
+            # local east and north components of the direction of travel (scaled by cos lat)
+            east = px * ty - py * tx
+            north = tz * (px * px + py * py) - pz * (px * tx + py * ty)
+            norm = np.hypot(east, north)
+            norm[norm == 0.0] = 1.0
+            u, v = self.wind(level, np.degrees(np.arcsin(np.clip(pz, -1.0, 1.0))), np.degrees(np.arctan2(py, px)))
+            along = (u * east + v * north) / norm
+            cross = (u * north - v * east) / norm
+            gs = np.sqrt(np.maximum(tas * tas - cross * cross, floor)) + along
+            total += tas / np.maximum(gs, MIN_GROUND_SPEED_FRACTION * tas)
+        return np.where(moving, total / WIND_SAMPLES, 1.0)
+
+    def block(self, lat, lon, tas_kmh: float, level: float) -> np.ndarray:
+        """factors(points, points), cached per (point set, airspeed, level)."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        key = (lat.tobytes(), lon.tobytes(), float(tas_kmh), self.level_index(level))
+        with self._lock:
+            hit = self._blocks.get(key)
+            if hit is not None:
+                self._blocks.move_to_end(key)
+                return hit
+        hit = self.factors(lat, lon, lat, lon, tas_kmh, level)
+        with self._lock:
+            self._blocks[key] = hit
+            if len(self._blocks) > BLOCK_CACHE_SIZE:
+                self._blocks.popitem(last=False)
+        return hit
+
+    def min_factor(self, tas_kmh: float, level: float) -> float:
+        """Lowest time factor any leg can have at a level: a tailwind of the strongest wind all the way."""
+        i = self.level_index(level)
+        if i not in self._max_speed:
+            self._max_speed[i] = float(np.hypot(self.winds[i][0], self.winds[i][1]).max())
+        return float(tas_kmh) / (float(tas_kmh) + self._max_speed[i])
+
+
+def _unit(lat, lon) -> np.ndarray:
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+# ---- reading and caching -------------------------------------------------------------------
+
+def _first(names, available, what: str, path: str) -> str:
+    for name in names:
+        if name in available:
+            return name
+    raise ValueError(f"{path}: no {what} (looked for {', '.join(names)})")
+
+
+def _read_npz(path: str):
+    """(lat, lon, flight levels, u, v) from a plain .npz; u/v (level, lat, lon) in m/s."""
+    with np.load(path) as f:
+        if "flight_level" in f:
+            levels = np.asarray(f["flight_level"], dtype=np.float64)
+        else:
+            levels = pressure_to_flight_level(f["pressure_hpa"])
+        return f["lat"], f["lon"], levels, f["u"], f["v"]
+
+
+def _read_xarray(path: str):
+    """(lat, lon, flight levels, u, v) of the first time step of a GRIB or NetCDF file."""
+    if xarray is None:
+        raise ValueError(f"{path}: reading GRIB/NetCDF wind files needs xarray (and cfgrib for GRIB)")
+    if path.lower().endswith(GRIB_SUFFIXES):
+        ds = xarray.open_dataset(path, engine="cfgrib",
+                                 backend_kwargs={"filter_by_keys": {"typeOfLevel": "isobaricInhPa"}})
+    else:
+        ds = xarray.open_dataset(path)
+    try:
+        u = ds[_first(U_NAMES, ds.data_vars, "u wind", path)]
+        v = ds[_first(V_NAMES, ds.data_vars, "v wind", path)]
+        lat_name = _first(LAT_NAMES, u.dims, "latitude", path)
+        lon_name = _first(LON_NAMES, u.dims, "longitude", path)
+        level_name = _first(LEVEL_NAMES, u.dims, "pressure level", path)
+        extra = {d: 0 for d in u.dims if d not in (lat_name, lon_name, level_name)}
+        u = u.isel(extra).transpose(level_name, lat_name, lon_name)
+        v = v.isel(extra).transpose(level_name, lat_name, lon_name)
+        hpa = np.asarray(u[level_name].values, dtype=np.float64)
+        if hpa.max() > 2000.0:  # given in Pa
+            hpa = hpa / 100.0
+        return (np.asarray(u[lat_name].values), np.asarray(u[lon_name].values), pressure_to_flight_level(hpa),
+                np.asarray(u.values), np.asarray(v.values))
+    finally:
+        ds.close()
+
+
+def _cache_dir(path: str) -> str:
+    stem = os.path.basename(path).split(".")[0] or "wind"
+    return os.path.join(WIND_CACHE_DIR, f"{stem}-{int(os.stat(path).st_mtime)}")
+
+
+def precompute(path: str) -> str:
+    """Convert a wind file into its per-level cache directory (once per file version); returns it."""
+    out = _cache_dir(path)
+    if os.path.exists(os.path.join(out, "grid.npz")):
+        return out
+    t0 = time.time()
+    lat, lon, levels, u, v = (_read_npz if path.lower().endswith(".npz") else _read_xarray)(path)
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    # ascending lat (GRIB grids run north to south) and lon in [-180, 360)
+    lat_order = np.argsort(lat)
+    lon = np.where(lon >= 360.0, lon - 360.0, lon)
+    lon_order = np.argsort(lon)
+    level_order = np.argsort(levels)
+    tmp = out + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for i in level_order.tolist():
+        # m/s -> km/h
+        uv = np.stack([np.asarray(u[i], dtype=np.float64)[np.ix_(lat_order, lon_order)],
+                       np.asarray(v[i], dtype=np.float64)[np.ix_(lat_order, lon_order)]]) * 3.6
+        np.save(os.path.join(tmp, f"FL{levels[i]:.0f}.npy"), np.nan_to_num(uv).astype(np.float32))
+    np.savez(os.path.join(tmp, "grid.npz"), lat=lat[lat_order], lon=lon[lon_order], levels=levels[level_order],
+             source=os.path.abspath(path))
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    print(f"[wind_field] cached {len(levels)} levels of {len(lat)}x{len(lon)} from {path} "
+          f"in {time.time() - t0:.1f}s -> {out}")
+    return out
+
+
+def load_wind_field(path: str) -> WindField:
+    """A wind file (cached on first use) or a cache directory, memory-mapped."""
+    out = path if os.path.isdir(path) else precompute(path)
+    with np.load(os.path.join(out, "grid.npz")) as grid:
+        lat, lon, levels, source = grid["lat"], grid["lon"], grid["levels"], str(grid["source"])
+    winds = [np.load(os.path.join(out, f"FL{level:.0f}.npy"), mmap_mode="r") for level in levels]
+    return WindField(lat, lon, levels, winds, source=source)
+
+
+_field_lock = threading.Lock()
+_field = (None, None)
+
+
+def get_wind_field() -> Optional[WindField]:
+    """The wind file at WIND_FIELD_PATH, reloaded when it changes; None if none is configured."""
+    global _field
+    if not WIND_FIELD_PATH:
+        return None
+    try:
+        mtime = os.stat(WIND_FIELD_PATH).st_mtime
+    except OSError:
+        return None
+    with _field_lock:
+        if _field[0] != mtime:
+            _field = (mtime, load_wind_field(WIND_FIELD_PATH))
+        return _field[1]
+
+
+def leg_wind_factor(carrier: Dict, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Time (and fuel) factor of one air leg in the current winds; 1.0 in still air."""
+    field = get_wind_field()
+    if field is None:
+        return 1.0
+    tas = float(carrier.get("cruise_speed_kmh", 800.0))
+    return float(field.factors([lat1], [lon1], [lat2], [lon2], tas, flight_level(carrier))[0, 0])
+
+
+def _point(text: str) -> Tuple[float, float]:
+    lat, lon = text.split(",")
+    return float(lat), float(lon)
+
+
+def _require_field() -> WindField:
+    field = get_wind_field()
+    if field is None:
+        raise SystemExit("No wind file; set WIND_FIELD_PATH")
+    return field
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upper-air wind fields for air legs")
+    sub = parser.add_subparsers(dest="cmd")
+    p_cache = sub.add_parser("cache", help="convert a wind file into its per-level cache")
+    p_cache.add_argument("--file", default=None, help="GRIB, NetCDF or .npz (default WIND_FIELD_PATH)")
+    sub.add_parser("info")
+    p_leg = sub.add_parser("leg", help="still-air vs wind time of one leg")
+    p_leg.add_argument("origin", help="lat,lon")
+    p_leg.add_argument("destination", help="lat,lon")
+    p_leg.add_argument("--tas", type=float, default=900.0, help="true airspeed km/h")
+    p_leg.add_argument("--fl", type=float, default=DEFAULT_FLIGHT_LEVEL)
+    p_bench = sub.add_parser("bench", help="time the all-pairs factors of random points")
+    p_bench.add_argument("--points", type=int, default=200)
+    p_bench.add_argument("--tas", type=float, default=900.0)
+    p_bench.add_argument("--fl", type=float, default=DEFAULT_FLIGHT_LEVEL)
+    args = parser.parse_args()
+
+    if args.cmd == "cache":
+        path = args.file or WIND_FIELD_PATH
+        if not path:
+            raise SystemExit("Give --file or set WIND_FIELD_PATH")
+        precompute(path)
+    elif args.cmd == "info":
+        field = _require_field()
+        print(f"{field.source}: {len(field.lat)}x{len(field.lon)} grid, lat {field.lat[0]:.2f}..{field.lat[-1]:.2f}, "
+              f"lon {field.lon[0]:.2f}..{field.lon[-1]:.2f}{' (global)' if field.wraps else ''}")
+        for i, level in enumerate(field.levels.tolist()):
+            speed = np.hypot(field.winds[i][0], field.winds[i][1])
+            print(f"  FL{level:.0f}: mean {float(speed.mean()):.0f} km/h, max {float(speed.max()):.0f} km/h")
+    elif args.cmd == "leg":
+        field = _require_field()
+        a, b = _point(args.origin), _point(args.destination)
+        t0 = time.perf_counter()
+        factor = float(field.factors([a[0]], [a[1]], [b[0]], [b[1]], args.tas, args.fl)[0, 0])
+        ms = (time.perf_counter() - t0) * 1000.0
+        km = float(haversine_km_np(a[0], a[1], b[0], b[1]))
+        level = field.levels[field.level_index(args.fl)]
+        print(f"{km:.0f} km at FL{level:.0f}: still air {km / args.tas:.2f} h, in wind {km / args.tas * factor:.2f} h "
+              f"(factor {factor:.3f}, {ms:.1f} ms)")
+    elif args.cmd == "bench":
+        field = _require_field()
+        rng = np.random.default_rng(0)
+        lat = rng.uniform(field.lat[0], field.lat[-1], args.points)
+        lon = rng.uniform(field.lon[0], field.lon[-1], args.points)
+        t0 = time.perf_counter()
+        field.block(lat, lon, args.tas, args.fl)
+        t1 = time.perf_counter()
+        field.block(lat, lon, args.tas, args.fl)
+        t2 = time.perf_counter()
+        field.factors(lat[:2], lon[:2], lat, lon, args.tas, args.fl)
+        t3 = time.perf_counter()
+        print(f"{args.points} points x {WIND_SAMPLES} samples: block {(t1 - t0) * 1000:.1f} ms, "
+              f"cached {(t2 - t1) * 1000:.2f} ms, 2 rows {(t3 - t2) * 1000:.1f} ms")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,7 @@ export default function App() {
   const [origin, setOrigin] = useState(null);
   const [destination, setDestination] = useState(null);
   const [plan, setPlan] = useState(null);
+  const [planStatus, setPlanStatus] = useState("");
   const [refuelResult, setRefuelResult] = useState(null);
   const [mapCenter, setMapCenter] = useState([20, 0]);
 
@@ -72,10 +73,55 @@ export default function App() {
       destinations: [{ coord: destination, mode: selectedMode }],
       preferences: "cheapest"
     };
-    const r = await axios.post(`${backendBase}/plan`, payload);
-    setPlan(r.data);
-    // center map on first leg
+    // stream the plan (server-sent events) so legs show up while later ones are still being solved
+    setPlan({ leg_details: [], fuel_plan: [] });
+    setPlanStatus("Planning...");
     setMapCenter([origin.lat, origin.lon]);
+    const resp = await fetch(`${backendBase}/plan/stream`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(payload)
+    });
+    if (!resp.ok) {
+      setPlanStatus(`Error: ${resp.status} ${await resp.text()}`);
+      return;
+    }
+    const onEvent = (event, data) => {
+      if (event === "leg") {
+        setPlan(p => ({ ...p, leg_details: [...p.leg_details, data.leg] }));
+      } else if (event === "fuel_stop") {
+        setPlan(p => ({ ...p, fuel_plan: [...p.fuel_plan, data.stop] }));
+      } else if (event === "run") {
+        setPlanStatus(`Solving ${data.mode} legs ${data.legs.map(i => i + 1).join(", ")}...`);
+      } else if (event === "progress") {
+        setPlanStatus(`Solving ${data.mode}: ${data.expanded} states expanded, bound $${Math.round(data.bound)}`);
+      } else if (event === "summary") {
+        setPlan(data);
+        setPlanStatus("");
+      } else if (event === "error") {
+        setPlanStatus(`Error: ${data.detail}`);
+      }
+    };
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = "";
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buf += decoder.decode(value, { stream: true });
+      let end;
+      while ((end = buf.indexOf("\n\n")) >= 0) {
+        const block = buf.slice(0, end);
+        buf = buf.slice(end + 2);
+        let event = "message";
+        let data = "";
+        for (const line of block.split("\n")) {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5);
+        }
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
   };
 
   const runRefuel = async () => {
@@ -159,6 +205,8 @@ export default function App() {
           </ul>
         </div>
 
+        {planStatus && <div style={{marginTop:8}}>{planStatus}</div>}
+
         {plan && (
           <>
             <h4>Plan Summary</h4>
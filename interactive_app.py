@@ -63,6 +63,43 @@ with col2:
         except Exception as e:
             st.error(f"Error: {e}")
 
+
+def stream_plan(payload: Dict[str, Any], status, partial):
+    """
+    POST /plan/stream and show legs and solver progress as they arrive.
+    Returns (plan, error); the read timeout only applies between events (the backend sends keep-alives).
+    """
+    event = None
+    with requests.post(f"{BACKEND_URL}/plan/stream", json=payload, stream=True, timeout=(5, 60)) as resp:
+        if resp.status_code != 200:
+            return None, f"{resp.status_code}: {resp.text}"
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+                continue
+            if not line.startswith("data:"):
+                continue
+            data = json.loads(line[len("data:"):])
+            if event == "summary":
+                status.empty()
+                return data, None
+            if event == "error":
+                status.empty()
+                return None, data["detail"]
+            if event == "run":
+                status.info(f"Solving {data['mode']} legs {', '.join(str(i + 1) for i in data['legs'])}...")
+            elif event == "progress":
+                status.info(f"Solving {data['mode']}: {data['expanded']:,} states expanded, "
+                            f"bound ${data['bound']:,.0f}")
+            elif event == "leg":
+                leg = data["leg"]
+                partial.write(f"Leg {data['index'] + 1} ({leg['mode']}): {leg['distance_nm']:.1f} NM, "
+                              f"{leg['time_hours']:.1f} h")
+            elif event == "fuel_stop":
+                partial.write(f"Fuel stop: {data['stop']['port']} (${data['stop']['cost_usd']:,.2f})")
+    return None, "stream ended without a plan"
+
+
 # Plan button
 st.header("Generate Plan")
 if st.button("Plan Route"):
@@ -78,11 +115,11 @@ if st.button("Plan Route"):
     }
     
     try:
-        with st.spinner("Planning route..."):
-            resp = requests.post(f"{BACKEND_URL}/plan", json=payload, timeout=30)
-        
-        if resp.status_code == 200:
-            result = resp.json()
+        status = st.empty()
+        status.info("Planning route...")
+        result, error = stream_plan(payload, status, st.container())
+
+        if result is not None:
             st.success("Route planned successfully!")
             
             # Display summary
@@ -115,8 +152,7 @@ if st.button("Plan Route"):
             with st.expander("View Raw JSON"):
                 st.json(result)
         else:
-            st.error(f"Error from backend: {resp.status_code}")
-            st.write(resp.text)
+            st.error(f"Error from backend: {error}")
     except requests.exceptions.ConnectionError:
         st.error(f"Cannot connect to backend at {BACKEND_URL}. Is it running?")
     except requests.exceptions.Timeout:
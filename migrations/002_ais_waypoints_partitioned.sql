@@ -0,0 +1,44 @@
+-- Convert ais_waypoints into a table range-partitioned by day for bulk AIS ingestion
+-- (app/services/ais_ingest.py creates the daily partitions on demand).
+-- Safe to run once after the tables were created by SQLAlchemy; existing rows are preserved.
+BEGIN;
+
+ALTER TABLE IF EXISTS ais_waypoints RENAME TO ais_waypoints_legacy;
+ALTER INDEX IF EXISTS ix_ais_waypoints_id RENAME TO ix_ais_waypoints_legacy_id;
+ALTER INDEX IF EXISTS ix_ais_waypoints_mmsi RENAME TO ix_ais_waypoints_legacy_mmsi;
+
+CREATE TABLE ais_waypoints (
+    id BIGSERIAL,
+    mmsi VARCHAR,
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),
+    geom geometry(POINT, 4326) NOT NULL,
+    sog DOUBLE PRECISION,
+    cog DOUBLE PRECISION,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- per-vessel track scans and lane/dwell analysis by area
+CREATE INDEX ix_ais_waypoints_mmsi_ts ON ais_waypoints (mmsi, timestamp);
+CREATE INDEX ix_ais_waypoints_geom ON ais_waypoints USING GIST (geom);
+
+-- partitions for days already present in the legacy table
+DO $$
+DECLARE
+    d date;
+BEGIN
+    IF to_regclass('ais_waypoints_legacy') IS NOT NULL THEN
+        FOR d IN SELECT DISTINCT (timestamp AT TIME ZONE 'UTC')::date FROM ais_waypoints_legacy WHERE timestamp IS NOT NULL LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF ais_waypoints FOR VALUES FROM (%L) TO (%L)',
+                'ais_waypoints_' || to_char(d, 'YYYYMMDD'),
+                d::text || ' 00:00:00+00',
+                (d + 1)::text || ' 00:00:00+00'
+            );
+        END LOOP;
+        INSERT INTO ais_waypoints (mmsi, timestamp, geom, sog, cog)
+            SELECT mmsi, timestamp, geom, sog, cog FROM ais_waypoints_legacy WHERE timestamp IS NOT NULL;
+        DROP TABLE ais_waypoints_legacy;
+    END IF;
+END $$;
+
+COMMIT;
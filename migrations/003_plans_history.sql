@@ -0,0 +1,31 @@
+-- Summary columns and indexes behind GET /plans (app/services/plan_store.py).
+-- Safe to run more than once; new databases get the same schema from SQLAlchemy.
+BEGIN;
+
+ALTER TABLE plans ADD COLUMN IF NOT EXISTS carrier_model VARCHAR;
+ALTER TABLE plans ADD COLUMN IF NOT EXISTS transport_medium VARCHAR;
+ALTER TABLE plans ADD COLUMN IF NOT EXISTS cargo_type VARCHAR;
+ALTER TABLE plans ADD COLUMN IF NOT EXISTS total_cost_usd DOUBLE PRECISION;
+ALTER TABLE plans ADD COLUMN IF NOT EXISTS total_time_hours DOUBLE PRECISION;
+ALTER TABLE plans ADD COLUMN IF NOT EXISTS total_distance_km DOUBLE PRECISION;
+ALTER TABLE plans ADD COLUMN IF NOT EXISTS stops INTEGER;
+
+-- backfill from the stored JSON
+UPDATE plans SET
+    carrier_model = request::jsonb ->> 'carrier_model',
+    transport_medium = request::jsonb ->> 'transport_medium',
+    cargo_type = request::jsonb ->> 'cargo_type',
+    total_cost_usd = (response::jsonb ->> 'total_cost_usd')::double precision,
+    total_time_hours = (response::jsonb ->> 'total_time_hours')::double precision,
+    total_distance_km = (response::jsonb ->> 'total_distance_km')::double precision,
+    stops = (response::jsonb ->> 'stops')::integer
+WHERE total_cost_usd IS NULL AND response IS NOT NULL;
+
+UPDATE plans SET created_at = now() WHERE created_at IS NULL;
+ALTER TABLE plans ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS ix_plans_created_at_id ON plans (created_at, id);
+CREATE INDEX IF NOT EXISTS ix_plans_carrier_created_at ON plans (carrier_model, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_plans_medium_created_at ON plans (transport_medium, created_at, id);
+
+COMMIT;
@@ -0,0 +1,39 @@
+-- Compact, typed plan storage (app/services/plan_store.py):
+--   plans.response_blob   compressed canonical PlanResponse (replaces the response JSON)
+--   plan_legs             typed columns with POINT geometry and fuel units
+--   plan_fuel_stops       one row per fuel stop
+-- Additive and safe to run more than once. Afterwards convert existing rows in batches with
+--   python -m app.services.plan_store backfill --batch-size 500
+-- and, once it reports 0 plans left, run 005_plans_drop_legacy.sql.
+BEGIN;
+
+ALTER TABLE plans ADD COLUMN IF NOT EXISTS response_blob BYTEA;
+
+ALTER TABLE plan_legs ADD COLUMN IF NOT EXISTS mode VARCHAR;
+ALTER TABLE plan_legs ADD COLUMN IF NOT EXISTS from_geom geometry(POINT, 4326);
+ALTER TABLE plan_legs ADD COLUMN IF NOT EXISTS to_geom geometry(POINT, 4326);
+ALTER TABLE plan_legs ADD COLUMN IF NOT EXISTS distance_km DOUBLE PRECISION;
+ALTER TABLE plan_legs ADD COLUMN IF NOT EXISTS fuel_needed DOUBLE PRECISION;
+ALTER TABLE plan_legs ADD COLUMN IF NOT EXISTS fuel_unit VARCHAR;
+ALTER TABLE plan_legs ADD COLUMN IF NOT EXISTS port_fees_usd DOUBLE PRECISION;
+CREATE INDEX IF NOT EXISTS ix_plan_legs_plan_id ON plan_legs (plan_id);
+
+CREATE TABLE IF NOT EXISTS plan_fuel_stops (
+    id SERIAL PRIMARY KEY,
+    plan_id INTEGER REFERENCES plans (id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    run_index INTEGER,
+    node_id VARCHAR,
+    name VARCHAR,
+    geom geometry(POINT, 4326),
+    amount DOUBLE PRECISION,
+    fuel_unit VARCHAR,
+    price_per_unit_usd DOUBLE PRECISION,
+    cost_usd DOUBLE PRECISION,
+    wait_hours DOUBLE PRECISION
+);
+CREATE INDEX IF NOT EXISTS ix_plan_fuel_stops_id ON plan_fuel_stops (id);
+CREATE INDEX IF NOT EXISTS ix_plan_fuel_stops_plan_id ON plan_fuel_stops (plan_id);
+CREATE INDEX IF NOT EXISTS ix_plan_fuel_stops_node_id ON plan_fuel_stops (node_id);
+
+COMMIT;
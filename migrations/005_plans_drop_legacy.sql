@@ -0,0 +1,12 @@
+-- Drop the pre-004 plan storage columns. Run only after
+--   python -m app.services.plan_store backfill
+-- has converted every plan; this should return 0 first:
+--   SELECT count(*) FROM plans WHERE response_blob IS NULL AND response IS NOT NULL;
+BEGIN;
+
+ALTER TABLE plan_legs DROP COLUMN IF EXISTS from_name;
+ALTER TABLE plan_legs DROP COLUMN IF EXISTS to_name;
+ALTER TABLE plan_legs DROP COLUMN IF EXISTS fuel_needed_tons;
+ALTER TABLE plan_legs DROP COLUMN IF EXISTS extra;
+
+COMMIT;
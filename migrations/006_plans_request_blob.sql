@@ -0,0 +1,11 @@
+-- Store the PlanRequest as a compressed canonical blob, like the response since 004
+-- (app/services/plan_store.py). New plans only write request_blob; the request JSON column is
+-- kept, nullable, for rows the backfill has not reached yet. Safe to run more than once.
+-- Afterwards convert existing rows with
+--   python -m app.services.plan_store backfill --batch-size 500
+BEGIN;
+
+ALTER TABLE plans ADD COLUMN IF NOT EXISTS request_blob BYTEA;
+ALTER TABLE plans ALTER COLUMN request DROP NOT NULL;
+
+COMMIT;
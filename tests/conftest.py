@@ -0,0 +1,81 @@
+"""
+Shared fixtures. Nothing here needs PostGIS: solver tests read a fixed set of ports through a
+NodeStore, the plan store runs on an in-memory SQLite table, and caches and brokers use temporary
+files.
+"""
+import json
+import os
+import pytest
+import app.services.distance_cache as distance_cache
+import app.services.refuel_optimizer as refuel_optimizer
+from app.services.node_store import NodeStore
+from app.services.sea_routing import PortSeaTable
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+# name, lat, lon, bunker price (USD/t), port fee (USD)
+PORTS = [
+    ("Rotterdam", 51.947, 4.136, 600.0, 5000.0),
+    ("Bremerhaven", 53.543, 8.586, 605.0, 4800.0),
+    ("Singapore", 1.3521, 103.8198, 620.0, 7000.0),
+    ("Hong Kong", 22.3964, 114.1095, 610.0, 6500.0),
+    ("Shanghai", 31.2304, 121.4737, 615.0, 7200.0),
+    ("Port Said", 31.26, 32.30, 500.0, 3000.0),
+    ("Colombo", 6.93, 79.84, 560.0, 3000.0),
+]
+ROTTERDAM_SHANGHAI = [(51.9, 4.1), (31.2, 121.5)]
+
+
+@pytest.fixture(autouse=True)
+def memory_distance_cache(monkeypatch):
+    """Keep the routed-distance cache in memory so tests never write to data/."""
+    cache = distance_cache.DistanceCache(path=None)
+    monkeypatch.setattr(distance_cache, "_cache", cache)
+    return cache
+
+
+@pytest.fixture(scope="session")
+def port_sea_table():
+    return PortSeaTable([(i + 1, lat, lon) for i, (_, lat, lon, _, _) in enumerate(PORTS)])
+
+
+@pytest.fixture
+def ocean_ports(monkeypatch, port_sea_table):
+    """Refuel optimizer wired to PORTS instead of the ports table."""
+    def node_store(db, mode):
+        return NodeStore("port", list(range(1, len(PORTS) + 1)), [p[1] for p in PORTS], [p[2] for p in PORTS],
+                         [p[3] for p in PORTS], [p[4] for p in PORTS], [p[0] for p in PORTS])
+
+    def no_db():
+        yield None
+
+    monkeypatch.setattr(refuel_optimizer, "_node_store_for_mode", node_store)
+    monkeypatch.setattr(refuel_optimizer, "get_db", no_db)
+    monkeypatch.setattr(refuel_optimizer, "get_port_sea_table", lambda db: port_sea_table)
+    return PORTS
+
+
+@pytest.fixture(scope="session")
+def carriers():
+    with open(os.path.join(DATA_DIR, "carriers.json"), "r") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def ship(carriers):
+    profile = dict(carriers["ocean"]["containership-20000TEU"])
+    # small tank, so Rotterdam -> Shanghai needs refuelling stops
+    profile["fuel_capacity_tons"] = 1500
+    return profile
+
+
+@pytest.fixture
+def solve(ocean_ports, ship):
+    """Ocean refuel solve over PORTS on a coarse fuel grid; fails the test on an error result."""
+    def run(waypoints=ROTTERDAM_SHANGHAI, **kwargs):
+        kwargs.setdefault("step_size", 50)
+        kwargs.setdefault("initial_fuel", 200)
+        result = refuel_optimizer.find_optimal_itinerary_refuel_route(waypoints, ship, "ocean", "tons", **kwargs)
+        assert "error" not in result, result.get("error")
+        return result
+    return run
@@ -0,0 +1,41 @@
+"""Random directed test graphs and a plain Dijkstra to check hierarchy answers against."""
+import random
+from heapq import heappush, heappop
+import numpy as np
+from app.services.contraction import INF
+
+NODES = 60
+
+
+def random_graph(seed: int, n: int = NODES, degree: int = 3):
+    """Directed edges (u, v, weight, length); distinct random weights so shortest paths are unique."""
+    rng = random.Random(seed)
+    edges = []
+    for u in range(n):
+        for v in rng.sample(range(n), degree):
+            if v != u:
+                edges.append((u, v, rng.uniform(1.0, 10.0), rng.uniform(1.0, 10.0)))
+    return edges
+
+
+def dijkstra(n, edges, sources):
+    """(cost, length) to every node from {node: (initial cost, initial length)}."""
+    adj = [[] for _ in range(n)]
+    for u, v, w, l in edges:
+        adj[u].append((v, w, l))
+    dist = [INF] * n
+    length = [INF] * n
+    pq = []
+    for s, (c, l) in sources.items():
+        dist[s], length[s] = c, l
+        heappush(pq, (c, s))
+    while pq:
+        d, x = heappop(pq)
+        if d > dist[x]:
+            continue
+        for y, w, l in adj[x]:
+            if d + w < dist[y]:
+                dist[y] = d + w
+                length[y] = length[x] + l
+                heappush(pq, (d + w, y))
+    return np.array(dist), np.array(length)
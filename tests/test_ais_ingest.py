@@ -0,0 +1,54 @@
+"""AIS parsing: NMEA times come from the feed, never the clock, and COPY rows stay well formed."""
+import io
+from datetime import datetime, timezone
+from app.services import ais_ingest
+from app.services.ais_ingest import CopyWriter, Downsampler, IngestStats, Position, read_nmea
+
+PAYLOAD = "!AIVDM,1,1,,B,15M67FC000G?ufbE`Fep0@05p00,0*2D"
+MMSI = "366053209"
+T = datetime(2009, 5, 5, 17, 20, 35, tzinfo=timezone.utc)
+
+
+def nmea(*lines, base_time=None):
+    return list(read_nmea(io.StringIO("\n".join(lines) + "\n"), base_time))
+
+
+def test_tag_block_time():
+    [pos] = nmea(f"\\s:rx,c:1241544035*5A\\{PAYLOAD}")
+    assert pos.mmsi == MMSI and pos.ts == T
+
+
+def test_receiver_time_in_seconds_or_milliseconds():
+    assert nmea(f"{PAYLOAD},1241544035")[0].ts == T
+    assert nmea(f"{PAYLOAD},1241544035000")[0].ts == T
+
+
+def test_untimed_sentences_follow_the_file_not_the_clock():
+    # before any timestamp there is no time; afterwards the last one carries over
+    first, second, third = nmea(PAYLOAD, f"{PAYLOAD},1241544035", PAYLOAD)
+    assert first.ts is None
+    assert second.ts == T and third.ts == T
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert nmea(PAYLOAD, base_time=base)[0].ts == base
+
+
+def test_untimed_and_non_numeric_mmsi_positions_are_invalid():
+    stats = IngestStats()
+    positions = [
+        Position(MMSI, None, 51.9, 4.1, 10.0, 90.0),
+        Position("36605\t3209", T, 51.9, 4.1, 10.0, 90.0),
+        Position(MMSI, T, 51.9, 4.1, 10.0, 90.0),
+    ]
+    kept = list(Downsampler().filter(positions, stats))
+    assert [p.mmsi for p in kept] == [MMSI]
+    assert stats.invalid == 2
+
+
+def test_copy_rows_escape_text():
+    writer = CopyWriter(conn=None)
+    writer.write(Position("a\tb\\c\nd", T, 51.9, 4.1, None, 90.0))
+    row = writer.buffer.getvalue()
+    assert row.count("\n") == 1 and row.count("\t") == 4
+    assert row.split("\t")[0] == "a\\tb\\\\c\\nd"
+    assert row.split("\t")[3] == "\\N"
+    assert ais_ingest._copy_value(12.5) == "12.5"
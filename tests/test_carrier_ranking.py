@@ -0,0 +1,31 @@
+"""Carrier ranking prices its bound, tank valuation and solves from the same, overridden, prices."""
+import pytest
+from app.services.refuel_optimizer import find_optimal_itinerary_refuel_route, rank_carriers
+
+ROTTERDAM_SHANGHAI = [(51.9, 4.1), (31.2, 121.5)]
+
+
+def rank(ship, **kwargs):
+    return rank_carriers(ROTTERDAM_SHANGHAI, {"ship": ship}, "ocean", "tons", step_size=50, initial_fuel=200,
+                         **kwargs)
+
+
+def test_price_overrides_reach_bound_and_solve(ocean_ports, ship):
+    base = rank(ship)
+    # every port at half price: the cheapest price, and so the bound, halves too
+    half = {f"port:{i}": p[3] / 2 for i, p in enumerate(ocean_ports, start=1)}
+    cheap = rank(ship, price_overrides=half)
+    assert cheap["ranking"][0]["bound"] == pytest.approx(base["ranking"][0]["bound"] / 2, abs=0.01)
+    expected = find_optimal_itinerary_refuel_route(ROTTERDAM_SHANGHAI, ship, "ocean", "tons", step_size=50,
+                                                   initial_fuel=200, price_overrides=half)
+    assert cheap["result"]["total_cost"] == pytest.approx(expected["total_cost"])
+    assert cheap["result"]["total_cost"] < base["result"]["total_cost"]
+
+
+def test_overridden_nodes_count_for_the_range_check(ocean_ports, ship):
+    ship = dict(ship, fuel_capacity_tons=600)
+    assert rank(ship)["best"] == "ship"
+    # only Rotterdam and Shanghai sell fuel: the whole voyage is one unavoidable hop, dropped unsolved
+    only_ends = {f"port:{i}": 0.0 for i in (2, 3, 4, 6, 7)}
+    option = rank(ship, price_overrides=only_ends)["ranking"][0]
+    assert option["status"] == "infeasible" and "unavoidable" in option["reason"]
@@ -0,0 +1,38 @@
+"""Contraction hierarchy point-to-point queries against plain Dijkstra on random directed graphs."""
+import pytest
+from app.services.contraction import ContractionHierarchy, INF
+from graphs import NODES, dijkstra, random_graph
+
+
+@pytest.fixture(scope="module", params=[1, 2, 3])
+def graph(request):
+    edges = random_graph(request.param)
+    return edges, ContractionHierarchy(NODES, edges)
+
+
+def test_query_matches_dijkstra(graph):
+    edges, ch = graph
+    weight = {(u, v): w for u, v, w, _ in edges}
+    for source in range(0, NODES, 7):
+        expected, expected_length = dijkstra(NODES, edges, {source: (0.0, 0.0)})
+        for target in range(NODES):
+            cost, path = ch.query(source, target)
+            assert cost == pytest.approx(expected[target])
+            if cost < INF:
+                # the unpacked path uses original edges only and costs what the query reported
+                assert path[0] == source and path[-1] == target
+                assert sum(weight[(u, v)] for u, v in zip(path, path[1:])) == pytest.approx(cost)
+                assert ch.path_length(path) == pytest.approx(expected_length[target])
+            else:
+                assert path == []
+
+
+def test_query_multi_with_access_costs(graph):
+    edges, ch = graph
+    sources = {0: 2.5, 11: 0.5}
+    targets = {29: 1.0, 47: 4.0}
+    expected, _ = dijkstra(NODES, edges, {s: (c, 0.0) for s, c in sources.items()})
+    best = min(expected[t] + c for t, c in targets.items())
+    cost, path = ch.query_multi(sources, targets)
+    assert cost == pytest.approx(best)
+    assert path[0] in sources and path[-1] in targets
@@ -0,0 +1,37 @@
+"""Bucket many-to-many queries and saved hierarchies against plain Dijkstra."""
+import numpy as np
+import pytest
+from app.services.contraction import ContractionHierarchy, INF
+from graphs import NODES, dijkstra, random_graph
+
+
+@pytest.fixture(scope="module", params=[1, 2, 3])
+def graph(request):
+    edges = random_graph(request.param)
+    return edges, ContractionHierarchy(NODES, edges)
+
+
+def test_many_to_many_matches_dijkstra(graph):
+    edges, ch = graph
+    sources = [{s: (0.0, 0.0)} for s in (0, 5, 17, 33)] + [{2: (1.5, 3.0), 40: (0.25, 0.5)}]
+    targets = [{t: (0.0, 0.0)} for t in (1, 8, 21, 59)] + [{12: (2.0, 1.0), 50: (0.5, 4.0)}]
+    costs, lengths = ch.many_to_many(sources, targets)
+    assert costs.shape == lengths.shape == (len(sources), len(targets))
+    for i, seeds in enumerate(sources):
+        dist, length = dijkstra(NODES, edges, seeds)
+        for j, ends in enumerate(targets):
+            # best target node including its final (cost, length)
+            t, (c, l) = min(ends.items(), key=lambda item: dist[item[0]] + item[1][0])
+            assert costs[i, j] == pytest.approx(dist[t] + c)
+            if dist[t] < INF:
+                assert lengths[i, j] == pytest.approx(length[t] + l)
+
+
+def test_save_and_load_give_the_same_answers(graph, tmp_path):
+    edges, ch = graph
+    path = str(tmp_path / "ch.npz")
+    ch.save(path, extra=np.arange(3))
+    loaded = ContractionHierarchy.load(path)
+    assert list(loaded.meta["extra"]) == [0, 1, 2]
+    for source, target in [(0, 10), (3, 44), (59, 1)]:
+        assert loaded.query(source, target) == ch.query(source, target)
@@ -0,0 +1,133 @@
+"""Distance cache hits, invalidation and versioning, with a counting stand-in for the router."""
+import numpy as np
+import pytest
+import app.services.distance_cache as distance_cache
+from app.services.distance_cache import DistanceCache, point_id
+
+ROTTERDAM = (51.947, 4.136)
+SINGAPORE = (1.3521, 103.8198)
+SHANGHAI = (31.2304, 121.4737)
+
+
+class Router:
+    """compute callback that counts the pairs it is asked for; distance = lat difference + lon difference."""
+
+    def __init__(self, timed: bool = False):
+        self.timed = timed
+        self.pairs = 0
+
+    def __call__(self, from_points, to_points):
+        self.pairs += len(from_points) * len(to_points)
+        a = np.asarray(from_points, dtype=np.float64)
+        b = np.asarray(to_points, dtype=np.float64)
+        values = np.abs(a[:, None, 0] - b[None, :, 0]) + np.abs(a[:, None, 1] - b[None, :, 1])
+        return values, (values / 10.0 if self.timed else None)
+
+
+def computed(cache, metric="sea"):
+    return cache.stats()["metrics"][metric]["computed"]
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "distance_cache.sqlite3")
+
+
+def lookup(cache, router, metric="sea", points=(ROTTERDAM, SINGAPORE, SHANGHAI), ids=None):
+    ids = ids or ["port:1", "port:2", "port:3"]
+    return cache.matrix(metric, ids, list(points), ids, list(points), compute=router)
+
+
+def test_repeat_lookups_hit_memory(cache_path):
+    cache, router = DistanceCache(cache_path), Router()
+    first, _ = lookup(cache, router)
+    assert router.pairs == 9
+    second, _ = lookup(cache, router)
+    assert router.pairs == 9
+    np.testing.assert_array_equal(first, second)
+    counts = cache.stats()["metrics"]["sea"]
+    assert counts["memory_hits"] == 9 and counts["computed"] == 9
+
+
+def test_symmetric_metrics_store_a_pair_once(cache_path):
+    cache, router = DistanceCache(cache_path), Router()
+    there, _ = cache.matrix("sea", ["port:1"], [ROTTERDAM], ["port:2"], [SINGAPORE], compute=router)
+    back, _ = cache.matrix("sea", ["port:2"], [SINGAPORE], ["port:1"], [ROTTERDAM], compute=router)
+    assert router.pairs == 1
+    assert back[0, 0] == there[0, 0]
+    assert cache.stats()["metrics"]["sea"]["disk_entries"] == 1
+
+
+def test_directed_metrics_keep_both_directions_and_hours(cache_path):
+    cache, router = DistanceCache(cache_path), Router(timed=True)
+    ids = ["station:1", "station:2"]
+    values, hours = cache.matrix("road", ids, [ROTTERDAM, SINGAPORE], ids, [ROTTERDAM, SINGAPORE], compute=router)
+    assert router.pairs == 4
+    np.testing.assert_allclose(hours, values / 10.0)
+    assert cache.stats()["metrics"]["road"]["disk_entries"] == 4
+
+
+def test_other_processes_read_the_disk_tier(cache_path):
+    first, router = DistanceCache(cache_path), Router()
+    expected, _ = lookup(first, router)
+    second = DistanceCache(cache_path)
+    values, _ = lookup(second, router)
+    assert router.pairs == 9
+    np.testing.assert_array_equal(values, expected)
+    assert second.stats()["metrics"]["sea"]["disk_hits"] == 9
+
+
+def test_moved_node_is_recomputed(cache_path):
+    cache, router = DistanceCache(cache_path), Router()
+    lookup(cache, router)
+    moved = (SHANGHAI[0] + 0.5, SHANGHAI[1])
+    values, _ = lookup(cache, router, points=(ROTTERDAM, SINGAPORE, moved))
+    # only the pairs touching port:3 miss: its row and column, the diagonal once
+    assert computed(cache) == 9 + 5
+    assert values[0, 2] == pytest.approx(abs(ROTTERDAM[0] - moved[0]) + abs(ROTTERDAM[1] - moved[1]))
+    # the disk copy was overwritten too
+    fresh = DistanceCache(cache_path)
+    lookup(fresh, router, points=(ROTTERDAM, SINGAPORE, moved))
+    assert computed(fresh) == 0
+
+
+def test_invalidate_by_node_and_metric(cache_path):
+    cache, router = DistanceCache(cache_path), Router()
+    lookup(cache, router, metric="sea")
+    lookup(cache, router, metric="great_circle")
+    assert router.pairs == 18
+    assert cache.invalidate(["port:1"], metric="sea") == 3
+    lookup(cache, router, metric="sea")
+    lookup(cache, router, metric="great_circle")
+    assert computed(cache, "sea") == 9 + 5
+    assert computed(cache, "great_circle") == 9
+    assert cache.invalidate() == 12
+    assert cache.stats()["metrics"]["sea"]["disk_entries"] == 0
+
+
+def test_network_rebuild_invalidates_and_purges(cache_path, monkeypatch):
+    cache, router = DistanceCache(cache_path), Router()
+    monkeypatch.setattr(distance_cache, "_version", lambda metric: "v1")
+    lookup(cache, router)
+    monkeypatch.setattr(distance_cache, "_version", lambda metric: "v2")
+    lookup(cache, router)
+    assert router.pairs == 18
+    lookup(cache, router, ids=["port:4", "port:5", "port:6"])
+    assert cache.purge() == 0
+    monkeypatch.setattr(distance_cache, "_version", lambda metric: "v3")
+    assert cache.purge() == 12
+
+
+def test_memory_only_cache(memory_distance_cache):
+    router = Router()
+    lookup(memory_distance_cache, router)
+    lookup(memory_distance_cache, router)
+    assert router.pairs == 9
+    assert memory_distance_cache.invalidate() == 0
+    lookup(memory_distance_cache, router)
+    assert router.pairs == 18
+
+
+def test_point_ids_are_rounded():
+    assert point_id(51.9470001, 4.1360004) == point_id(51.947, 4.136)
+    assert point_id(51.947, 4.136) != point_id(51.948, 4.136)
@@ -0,0 +1,47 @@
+"""Prebuilt distance matrices are only used for nodes at the positions they were built for."""
+import numpy as np
+import pytest
+import app.services.refuel_optimizer as refuel_optimizer
+from app.services.distance_matrix import DistanceMatrix
+from app.services.node_store import NodeStore
+from app.services.utils import haversine_km_np
+
+IDS = [1, 2, 3]
+LAT = [51.947, 1.3521, 31.2304]
+LON = [4.136, 103.8198, 121.4737]
+
+
+def mapped(lat=LAT, lon=LON, positions=True):
+    # a sentinel matrix, so reads from it are recognisable
+    matrix = np.full((len(IDS), len(IDS)), 1.0)
+    return DistanceMatrix("airport", "km", IDS, matrix, path=None,
+                          lat=lat if positions else None, lon=lon if positions else None)
+
+
+def airports(lat=LAT):
+    return NodeStore("airport", IDS, lat, LON, [0.8] * 3, [500.0] * 3, ["A", "B", "C"])
+
+
+def test_covers_checks_positions():
+    table = mapped()
+    assert table.covers([3, 1])
+    assert table.covers([3, 1], [LAT[2], LAT[0]], [LON[2], LON[0]])
+    assert not table.covers([3, 1], [LAT[2] + 0.1, LAT[0]], [LON[2], LON[0]])
+    assert not table.covers([4])
+    assert not mapped(positions=False).covers([1], [LAT[0]], [LON[0]])
+
+
+@pytest.mark.parametrize("lat, positions, from_matrix", [
+    (LAT, True, True),
+    ([LAT[0], LAT[1], LAT[2] + 0.5], True, False),
+    (LAT, False, False),
+])
+def test_great_circle_matrix_recomputes_moved_nodes(monkeypatch, lat, positions, from_matrix):
+    monkeypatch.setattr(refuel_optimizer, "get_distance_matrix", lambda kind: mapped(positions=positions))
+    nodes = airports(lat)
+    matrix = refuel_optimizer._great_circle_distance_matrix(nodes, "airport")
+    expected = haversine_km_np(nodes.lat[:, None], nodes.lon[:, None], nodes.lat[None, :], nodes.lon[None, :])
+    if from_matrix:
+        np.testing.assert_array_equal(matrix, np.full((3, 3), 1.0))
+    else:
+        np.testing.assert_allclose(matrix, expected)
@@ -0,0 +1,102 @@
+"""Job brokers (retries with backoff, priorities, lost workers) and the worker pool's timeouts."""
+import time
+import pytest
+import app.services.jobs as jobs
+from app.services.jobs import Broker, MemoryBroker, SQLiteBroker, WorkerPool
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def broker(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteBroker(str(tmp_path / "jobs.sqlite3"))
+    return MemoryBroker()
+
+
+def test_broker_is_abstract():
+    with pytest.raises(TypeError):
+        Broker()
+
+
+def test_retry_delay_doubles():
+    assert [jobs._retry_delay(a) for a in (1, 2, 3)] == [jobs.RETRY_BACKOFF_S * f for f in (1, 2, 4)]
+
+
+def test_higher_priority_first_then_submission_order(broker):
+    low = broker.enqueue("plan", {"n": 1}, priority=0, timeout_s=10, max_retries=0)
+    high = broker.enqueue("plan", {"n": 2}, priority=5, timeout_s=10, max_retries=0)
+    low_2 = broker.enqueue("plan", {"n": 3}, priority=0, timeout_s=10, max_retries=0)
+    assert [broker.claim().id for _ in range(3)] == [high, low, low_2]
+    assert broker.claim() is None
+
+
+def test_failed_attempts_are_retried_after_backoff(broker, monkeypatch):
+    monkeypatch.setattr(jobs, "RETRY_BACKOFF_S", 0.2)
+    job_id = broker.enqueue("plan", {"n": 1}, priority=0, timeout_s=10, max_retries=1)
+    job = broker.claim()
+    assert (job.id, job.attempts, job.payload) == (job_id, 1, {"n": 1})
+    broker.fail(job, "boom")
+    assert broker.get(job_id)["status"] == "queued"
+    assert broker.claim() is None  # still backing off
+    time.sleep(0.3)
+    job = broker.claim()
+    assert job.attempts == 2
+    broker.fail(job, "boom again")
+    info = broker.get(job_id)
+    assert (info["status"], info["attempts"], info["error"]) == ("failed", 2, "boom again")
+    assert broker.claim() is None
+
+
+def test_complete_stores_the_result(broker):
+    job_id = broker.enqueue("plan", {}, priority=0, timeout_s=10, max_retries=0)
+    broker.complete(broker.claim(), {"route_id": "r1"})
+    info = broker.get(job_id)
+    assert (info["status"], info["result"], info["error"]) == ("done", {"route_id": "r1"}, None)
+    assert broker.stats() == {"done": 1}
+    assert broker.get("unknown") is None
+
+
+def test_expired_lease_counts_as_a_failed_attempt(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "LEASE_GRACE_S", 0.0)
+    monkeypatch.setattr(jobs, "RETRY_BACKOFF_S", 0.0)
+    broker = SQLiteBroker(str(tmp_path / "jobs.sqlite3"))
+    job_id = broker.enqueue("plan", {}, priority=0, timeout_s=0.05, max_retries=1)
+    broker.claim()  # its worker never reports back
+    time.sleep(0.1)
+    job = broker.claim()
+    assert (job.id, job.attempts) == (job_id, 2)
+    time.sleep(0.1)
+    assert broker.claim() is None
+    info = broker.get(job_id)
+    assert (info["status"], info["error"]) == ("failed", "worker lost")
+
+
+def wait_for(broker, job_ids, timeout_s=60.0):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        infos = [broker.get(j) for j in job_ids]
+        if all(i["status"] in ("done", "failed") for i in infos):
+            return infos
+        time.sleep(0.1)
+    pytest.fail(f"jobs still pending after {timeout_s} s: {[i['status'] for i in infos]}")
+
+
+def test_pool_runs_retries_and_times_out_jobs(monkeypatch):
+    # standard-library handlers, so the spawned workers need nothing from the tests
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "sqrt", "math:sqrt")
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "sleep", "time:sleep")
+    monkeypatch.setattr(jobs, "RETRY_BACKOFF_S", 0.0)
+    broker = MemoryBroker()
+    ok = broker.enqueue("sqrt", 16.0, priority=0, timeout_s=30, max_retries=0)
+    bad = broker.enqueue("sqrt", -1.0, priority=0, timeout_s=30, max_retries=1)
+    slow = broker.enqueue("sleep", 30.0, priority=0, timeout_s=0.5, max_retries=1)
+    pool = WorkerPool(broker, workers=2, poll_s=0.05)
+    pool.start()
+    try:
+        done, failed, timed_out = wait_for(broker, [ok, bad, slow])
+    finally:
+        pool.stop()
+    assert (done["status"], done["result"]) == ("done", 4.0)
+    assert (failed["status"], failed["attempts"]) == ("failed", 2)
+    assert failed["error"].startswith("ValueError")
+    assert (timed_out["status"], timed_out["attempts"]) == ("failed", 2)
+    assert timed_out["error"] == "timed out after 0.5 s"
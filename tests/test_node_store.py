@@ -0,0 +1,64 @@
+"""Node store caching: no query per lookup, reloads on touch or TTL, unchanged reloads keep the object."""
+import pytest
+import app.services.node_store as node_store
+from app.services.node_store import NodeStore
+
+
+class Loader:
+    """Stand-in for _load that counts calls and serves whatever `price` currently is."""
+
+    def __init__(self):
+        self.calls = 0
+        self.price = 600.0
+
+    def __call__(self, db, kind):
+        self.calls += 1
+        return NodeStore(kind, [1, 2], [51.947, 1.3521], [4.136, 103.8198], [self.price, float("nan")],
+                         [5000.0, 7000.0], ["Rotterdam", "Singapore"])
+
+
+@pytest.fixture
+def loader(monkeypatch, tmp_path):
+    load = Loader()
+    monkeypatch.setattr(node_store, "_load", load)
+    monkeypatch.setattr(node_store, "NODE_STORE_STAMP", str(tmp_path / "node_store.stamp"))
+    monkeypatch.setattr(node_store, "_stores", {})
+    return load
+
+
+def test_lookups_are_cached(loader):
+    store = node_store.get_node_store(None, "port")
+    assert node_store.get_node_store(None, "port") is store
+    assert loader.calls == 1
+
+
+def test_touch_reloads(loader):
+    store = node_store.get_node_store(None, "port")
+    loader.price = 550.0
+    node_store.touch_node_stores()
+    reloaded = node_store.get_node_store(None, "port")
+    assert loader.calls == 2
+    assert reloaded is not store and reloaded.price[0] == 550.0
+
+
+def test_other_processes_see_the_stamp(loader, monkeypatch):
+    node_store.get_node_store(None, "port")
+    # as if another process touched the stamp: nothing was invalidated locally
+    monkeypatch.setattr(node_store, "invalidate_node_store", lambda kind=None: None)
+    node_store.touch_node_stores()
+    node_store.get_node_store(None, "port")
+    assert loader.calls == 2
+
+
+def test_ttl_reload_keeps_an_unchanged_store(loader, monkeypatch):
+    store = node_store.get_node_store(None, "port")
+    monkeypatch.setattr(node_store, "NODE_STORE_TTL_S", 0.0)
+    assert node_store.get_node_store(None, "port") is store
+    assert loader.calls == 2
+    loader.price = 550.0
+    assert node_store.get_node_store(None, "port") is not store
+
+
+def test_unknown_kind(loader):
+    with pytest.raises(ValueError):
+        node_store.get_node_store(None, "harbour")
@@ -0,0 +1,134 @@
+"""Plan blobs and plan history paging, on an in-memory SQLite copy of the plans table."""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import app.services.plan_store as plan_store
+from app.models import PlanRequest
+from app.models_orm import Plan
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def plan_request(carrier="bulkcarrier-75000DWT", medium="ocean") -> PlanRequest:
+    return PlanRequest(
+        transport_medium=medium, cargo_type="bulk", cargo_quantity=500.0, unit="tons", carrier_model=carrier,
+        origin={"lat": 51.9, "lon": 4.1}, destinations=[{"coord": {"lat": 31.2, "lon": 121.5}}],
+    )
+
+
+def plan_response(route_id: str, cost: float = 1000.0) -> dict:
+    return {
+        "route_id": route_id, "total_cost_usd": cost, "total_time_hours": 500.0, "total_distance_km": 19000.0,
+        "stops": 1, "total_fuel_unit": "tons",
+        "fuel_plan": [{"port": "Port Said", "amount_tons_or_liters": 900.0, "price_per_unit_usd": 500.0,
+                       "cost_usd": 450000.0}],
+        "leg_details": [{"mode": "ocean", "from_coord": {"lat": 51.9, "lon": 4.1},
+                         "to_coord": {"lat": 31.2, "lon": 121.5}, "distance_km": 19000.0}],
+    }
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine("sqlite://")
+    Plan.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    monkeypatch.setattr(plan_store, "_cache", type(plan_store._cache)())
+    yield session
+    session.close()
+
+
+def add_plans(db, count: int, start: datetime = T0, **request_kwargs):
+    """`count` plans created one minute apart (plan i at start + i minutes); returns their route ids."""
+    route_ids = []
+    for i in range(count):
+        route_id = f"r{i:03d}-{request_kwargs.get('carrier', 'default')}"
+        row = plan_store._plan_row(plan_request(**request_kwargs), plan_response(route_id, cost=float(i)))
+        row.created_at = start + timedelta(minutes=i)
+        db.add(row)
+        route_ids.append(route_id)
+    db.commit()
+    return route_ids
+
+
+def test_blob_round_trip_is_canonical():
+    body = plan_response("r1")
+    blob = plan_store.encode_blob(body)
+    assert plan_store.decode_blob(blob) == body
+    # key order does not change the bytes
+    reordered = dict(reversed(list(body.items())))
+    assert plan_store.encode_blob(reordered) == blob
+
+
+def test_unknown_blob_format_is_rejected():
+    with pytest.raises(ValueError):
+        plan_store.decode_blob(b"\x09" + plan_store.encode_blob({})[1:])
+
+
+def test_stored_plan_reads_back_from_blobs(db):
+    route_id = add_plans(db, 1)[0]
+    row = db.query(Plan).one()
+    assert row.request is None and row.response is None
+    assert plan_store.get_plan(db, route_id) == plan_response(route_id, cost=0.0)
+    request = plan_store.get_plan_request(db, route_id)
+    assert PlanRequest(**request) == plan_request()
+    assert plan_store.get_plan(db, "unknown") is None
+    assert plan_store.get_plan_request(db, "unknown") is None
+
+
+def test_legacy_json_rows_are_still_readable(db):
+    response = plan_response("legacy")
+    db.add(Plan(route_id="legacy", created_at=T0, request=plan_request().dict(), response=response))
+    db.commit()
+    assert plan_store.get_plan(db, "legacy") == response
+    assert PlanRequest(**plan_store.get_plan_request(db, "legacy")) == plan_request()
+
+
+def test_cursor_round_trip():
+    cursor = plan_store.encode_cursor(T0, 42)
+    assert plan_store.decode_cursor(cursor) == (T0, 42)
+    with pytest.raises(ValueError):
+        plan_store.decode_cursor("not a cursor")
+
+
+def test_pages_cover_every_plan_once_newest_first(db):
+    route_ids = add_plans(db, 23)
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        page = plan_store.list_plans(db, limit=5, cursor=cursor)
+        seen.extend(item["route_id"] for item in page["items"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == 5
+    assert seen == list(reversed(route_ids))
+
+
+def test_new_plans_do_not_shift_later_pages(db):
+    route_ids = add_plans(db, 6)
+    first = plan_store.list_plans(db, limit=3)
+    # a plan stored after the first page was read is newer than every row, so it never shows up
+    add_plans(db, 1, start=T0 + timedelta(days=1), carrier="late")
+    second = plan_store.list_plans(db, limit=3, cursor=first["next_cursor"])
+    assert [item["route_id"] for item in second["items"]] == list(reversed(route_ids[:3]))
+    assert second["next_cursor"] is None
+
+
+def test_filters_and_time_range(db):
+    add_plans(db, 4, carrier="bulkcarrier-75000DWT")
+    air = add_plans(db, 3, carrier="b777f", medium="air")
+    page = plan_store.list_plans(db, transport_medium="air")
+    assert [item["route_id"] for item in page["items"]] == list(reversed(air))
+    assert {item["carrier_model"] for item in page["items"]} == {"b777f"}
+    page = plan_store.list_plans(db, since=T0 + timedelta(minutes=1), until=T0 + timedelta(minutes=3),
+                                 carrier_model="bulkcarrier-75000DWT")
+    assert [item["total_cost_usd"] for item in page["items"]] == [2.0, 1.0]
+
+
+def test_page_size_is_clamped(db):
+    add_plans(db, 3)
+    assert len(plan_store.list_plans(db, limit=0)["items"]) == 1
+    assert len(plan_store.list_plans(db, limit=10_000)["items"]) == 3
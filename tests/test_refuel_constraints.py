@@ -0,0 +1,38 @@
+"""Plan constraints act as resources of the search: loose ones change nothing, tight ones bind or fail."""
+import pytest
+from app.services.refuel_optimizer import find_optimal_itinerary_refuel_route
+
+ROTTERDAM_SHANGHAI = [(51.9, 4.1), (31.2, 121.5)]
+
+
+def stops(result):
+    return [(f["node_id"], f["added_amount"]) for f in result["fuel_plan"]]
+
+
+def test_loose_constraints_keep_the_unconstrained_plan(solve):
+    free = solve()
+    constrained = solve(max_stops=10, max_hours=free["total_time_hours"] * 2)
+    assert constrained["total_cost"] == pytest.approx(free["total_cost"])
+    assert stops(constrained) == stops(free)
+
+
+def test_max_stops_is_enforced(solve, ship):
+    ship["fuel_capacity_tons"] = 2500
+    free = solve()
+    assert len(free["fuel_plan"]) == 2
+    one_stop = solve(max_stops=1)
+    assert len(one_stop["fuel_plan"]) == 1
+    assert one_stop["total_cost"] > free["total_cost"]
+
+
+def test_infeasible_stop_limit_reports_an_error(ocean_ports, ship):
+    result = find_optimal_itinerary_refuel_route(ROTTERDAM_SHANGHAI, ship, "ocean", "tons", step_size=50,
+                                                 initial_fuel=200, max_stops=1)
+    assert "at most 1 refuel stops" in result["error"]
+
+
+def test_deadline_before_the_fastest_arrival_is_infeasible(ocean_ports, ship, solve):
+    fastest = solve(objective="fastest")
+    result = find_optimal_itinerary_refuel_route(ROTTERDAM_SHANGHAI, ship, "ocean", "tons", step_size=50,
+                                                 initial_fuel=200, max_hours=fastest["total_time_hours"] * 0.9)
+    assert "error" in result
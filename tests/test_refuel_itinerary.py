@@ -0,0 +1,48 @@
+"""Multi-leg itineraries are solved jointly, so fuel bought cheaply on one leg is carried into the next."""
+import pytest
+import app.services.optimizer as optimizer
+from app.models import PlanRequest
+
+ROTTERDAM_COLOMBO_SHANGHAI = [(51.9, 4.1), (6.93, 79.84), (31.2, 121.5)]
+
+
+def test_joint_plan_beats_leg_by_leg(solve):
+    joint = solve(ROTTERDAM_COLOMBO_SHANGHAI, step_size=10)
+    first = solve(ROTTERDAM_COLOMBO_SHANGHAI[:2], step_size=10)
+    second = solve(ROTTERDAM_COLOMBO_SHANGHAI[1:], step_size=10, initial_fuel=first["final_fuel_amount"])
+    assert joint["total_cost"] < first["total_cost"] + second["total_cost"]
+    # Port Said is the cheapest bunker port: the joint plan fills up there for both legs
+    # instead of topping up at Colombo
+    assert [f["node"] for f in joint["fuel_plan"]] == ["Rotterdam", "Port Said"]
+    assert "Colombo" in [f["node"] for f in second["fuel_plan"]]
+
+
+def test_fuel_stops_and_legs_carry_their_itinerary_leg(solve):
+    result = solve(ROTTERDAM_COLOMBO_SHANGHAI, step_size=10)
+    leg_indexes = [leg["leg_index"] for leg in result["legs"]]
+    assert leg_indexes == sorted(leg_indexes)
+    assert leg_indexes[0] == 0 and leg_indexes[-1] == 1
+    assert all(f["leg_index"] == 0 for f in result["fuel_plan"])
+    assert result["legs"][-1]["to"] == "Destination 2"
+
+
+def test_initial_fuel_is_used_before_buying(solve):
+    low = solve(initial_fuel=200)
+    high = solve(initial_fuel=1000)
+    assert high["total_cost"] < low["total_cost"]
+    assert high["initial_fuel_amount"] == pytest.approx(1000)
+
+
+def test_failed_refuel_plan_is_reported(ocean_ports, ship, monkeypatch):
+    monkeypatch.setattr(optimizer, "find_optimal_itinerary_refuel_route", lambda **kwargs: {"error": "No feasible route"})
+    req = PlanRequest(transport_medium="ocean", cargo_type="bulk", cargo_quantity=500.0, unit="tons",
+                      carrier_model="containership-20000TEU", origin={"lat": 51.9, "lon": 4.1},
+                      destinations=[{"coord": {"lat": 31.2, "lon": 121.5}}])
+    events = []
+    plan = optimizer.build_plan_payload(req, carrier_profile=ship, db=object(), seed=False,
+                                        store=lambda *args: None, progress=lambda event, data: events.append(event))
+    # the run keeps its coarse legs, and the response says why it has no fuel stops
+    assert plan["fuel_plan"] == []
+    assert len(plan["warnings"]) == 1 and "No feasible route" in plan["warnings"][0]
+    assert [leg["refuel_warning"] for leg in plan["leg_details"]] == plan["warnings"]
+    assert "warning" in events
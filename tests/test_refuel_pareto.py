@@ -0,0 +1,29 @@
+"""The pareto label search returns the cost/time frontier between the scalar objectives."""
+import pytest
+
+
+def test_frontier_ends_match_cheapest_and_fastest(solve):
+    cheapest = solve(objective="cheapest")
+    fastest = solve(objective="fastest")
+    pareto = solve(objective="pareto")
+    frontier = pareto["pareto"]
+    assert frontier, "pareto search returned no plans"
+    assert frontier[0]["total_cost"] == pytest.approx(cheapest["total_cost"])
+    assert frontier[-1]["total_time_hours"] == pytest.approx(fastest["total_time_hours"])
+    # the headline plan is the cheapest one
+    assert pareto["total_cost"] == pytest.approx(frontier[0]["total_cost"])
+
+
+def test_frontier_is_sorted_and_non_dominated(solve):
+    frontier = solve(objective="pareto")["pareto"]
+    for a, b in zip(frontier, frontier[1:]):
+        assert a["total_cost"] < b["total_cost"]
+        assert a["total_time_hours"] > b["total_time_hours"]
+
+
+def test_weighted_plan_lies_on_the_frontier(solve):
+    value = 2000.0
+    frontier = solve(objective="pareto")["pareto"]
+    weighted = solve(objective="weighted", time_value_usd_per_hour=value)
+    best = min(p["total_cost"] + value * p["total_time_hours"] for p in frontier)
+    assert weighted["total_cost"] + value * weighted["total_time_hours"] == pytest.approx(best)
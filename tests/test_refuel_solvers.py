@@ -0,0 +1,36 @@
+"""The flat-array heap search and the expanded-graph csgraph search must return the same plans."""
+import pytest
+from app.services.refuel_optimizer import find_optimal_itinerary_refuel_route
+
+ROTTERDAM_SHANGHAI = [(51.9, 4.1), (31.2, 121.5)]
+ROTTERDAM_COLOMBO_SHANGHAI = [(51.9, 4.1), (6.93, 79.84), (31.2, 121.5)]
+
+
+def stops(result):
+    return [(f["node_id"], f["added_amount"]) for f in result["fuel_plan"]]
+
+
+@pytest.mark.parametrize("objective", ["cheapest", "fastest", "weighted"])
+@pytest.mark.parametrize("waypoints", [ROTTERDAM_SHANGHAI, ROTTERDAM_COLOMBO_SHANGHAI])
+def test_heap_and_csgraph_agree(solve, objective, waypoints):
+    pytest.importorskip("scipy")
+    heap = solve(waypoints, objective=objective, time_value_usd_per_hour=2000, solver="heap")
+    csgraph = solve(waypoints, objective=objective, time_value_usd_per_hour=2000, solver="csgraph")
+    assert heap["solver"] == "heap" and csgraph["solver"] == "csgraph"
+    assert csgraph["total_cost"] == pytest.approx(heap["total_cost"])
+    assert csgraph["total_time_hours"] == pytest.approx(heap["total_time_hours"])
+    assert stops(csgraph) == stops(heap)
+
+
+def test_state_space_limit_fails_fast(ocean_ports, ship):
+    result = find_optimal_itinerary_refuel_route(ROTTERDAM_SHANGHAI, ship, "ocean", "tons", step_size=1,
+                                                 initial_fuel=200, max_states=1000)
+    assert result["error"].startswith("State space too large")
+
+
+def test_results_report_search_statistics(solve):
+    result = solve()
+    assert result["states"] > 0 and result["labels_created"] > 0
+    assert result["peak_memory_mb"] >= 0.0
+    assert result["truncated"] is False
+    assert result["step_size"] == 50
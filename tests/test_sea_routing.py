@@ -0,0 +1,37 @@
+"""Sea-lane distances: around continents rather than across them, and the same from the port table."""
+import pytest
+from app.services.sea_routing import get_sea_router, sea_distance_nm
+from app.services.utils import haversine_km_np, KM_PER_NM
+
+ROTTERDAM = (51.947, 4.136)
+SHANGHAI = (31.2304, 121.4737)
+SINGAPORE = (1.3521, 103.8198)
+
+
+def great_circle_nm(a, b):
+    return float(haversine_km_np(a[0], a[1], b[0], b[1])) / KM_PER_NM
+
+
+def test_ocean_route_is_longer_than_the_great_circle():
+    sea = sea_distance_nm(*ROTTERDAM, *SHANGHAI)
+    # via Suez, roughly 10,500 nm against ~4,900 nm over land
+    assert sea > 1.8 * great_circle_nm(ROTTERDAM, SHANGHAI)
+    assert sea < 12000
+
+
+def test_distances_are_symmetric():
+    assert sea_distance_nm(*ROTTERDAM, *SINGAPORE) == pytest.approx(sea_distance_nm(*SINGAPORE, *ROTTERDAM))
+
+
+def test_route_follows_lane_waypoints():
+    route = get_sea_router().route(ROTTERDAM, SHANGHAI)
+    assert route["distance_nm"] == pytest.approx(sea_distance_nm(*ROTTERDAM, *SHANGHAI))
+    assert len(route["waypoints"]) > 2
+
+
+def test_port_table_matches_point_queries(port_sea_table, ocean_ports):
+    # ports 1 and 5 are Rotterdam and Shanghai
+    table = port_sea_table.distance_nm(1, 5)
+    direct = sea_distance_nm(ocean_ports[0][1], ocean_ports[0][2], ocean_ports[4][1], ocean_ports[4][2])
+    assert table == pytest.approx(direct, rel=1e-6)
+    assert port_sea_table.submatrix([1, 5]).shape == (2, 2)